@@ -0,0 +1,141 @@
+# Columnar exports for the analytics (analytics_logic.reports): the appointments as NumPy arrays
+# of epoch minutes, vet ids and customer ids, and the scheduled capacity (every slot of the
+# VET_SCHEDULES/WEEKDAY_SLOTS templates over a date range) as epoch minutes and vet ids, built
+# per weekday with array arithmetic instead of make_daily_slots for every date.
+# NumPy is only needed by the analytics: it is imported on first use, not by the application.
+import datetime as dt
+import logging
+from typing import Iterable, List
+
+from constants import VET_SCHEDULES, WEEKDAYS
+from slot_times import weekday_templates
+from persistence_logic.binary_snapshot import BinarySnapshot, datetime_minutes
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 1440
+# 1970-01-01 00:00 on the proleptic ordinal scale of the slot keys and the binary snapshots;
+# the columns count from it, so that column.astype("datetime64[m]") gives the datetimes
+EPOCH_MINUTES = datetime_minutes(dt.datetime(1970, 1, 1))
+# weekday index (Monday = 0) of the epoch day 0, a Thursday
+EPOCH_WEEKDAY = 3
+
+def load_numpy():
+    try:
+        import numpy
+    except ImportError as err:
+        raise ImportError("The analytics need NumPy; install it with: pip install numpy") from err
+    return numpy
+
+# Datetime/date -> epoch minutes, date <-> epoch day
+def epoch_minutes(moment) -> int:
+    if not isinstance(moment, dt.datetime):
+        moment = dt.datetime.combine(moment, dt.time())
+    return datetime_minutes(moment) - EPOCH_MINUTES
+
+def epoch_day(date: dt.date) -> int:
+    if isinstance(date, dt.datetime):
+        date = date.date()
+    return date.toordinal() - EPOCH_MINUTES // MINUTES_PER_DAY
+
+def epoch_date(day: int) -> dt.date:
+    return dt.date.fromordinal(int(day) + EPOCH_MINUTES // MINUTES_PER_DAY)
+
+# The vet axis of the exports: the clinic vets first, in the VET_SCHEDULES order, then the
+# others (e.g. former vets found in the history) in the order they are met
+def vet_axis(names: Iterable[str] = ()) -> List[str]:
+    vets = list(VET_SCHEDULES)
+    vets.extend(name for name in dict.fromkeys(names) if name not in VET_SCHEDULES)
+    return vets
+
+
+# One row per appointment; `vet` indexes `vets`, `customer` indexes `customers`
+class AppointmentColumns:
+    def __init__(self, minutes, vet, customer, vets: List[str], customers: List[str]):
+        self.minutes = minutes
+        self.vet = vet
+        self.customer = customer
+        self.vets = vets
+        self.customers = customers
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+    # One pass over the Appointment objects (a list, the AppointmentIndex, the archive...)
+    @classmethod
+    def from_appointments(cls, appointments: Iterable) -> "AppointmentColumns":
+        np = load_numpy()
+        appointments = appointments if hasattr(appointments, "__len__") else list(appointments)
+        vet_ids = {vet: number for number, vet in enumerate(vet_axis())}
+        customer_ids = {}
+        size = len(appointments)
+        minutes = np.fromiter((datetime_minutes(appointment.slot.datetime) for appointment in appointments), np.int64, size)
+        vet = np.fromiter((vet_ids.setdefault(appointment.slot.vet, len(vet_ids)) for appointment in appointments), np.int32, size)
+        customer = np.fromiter((customer_ids.setdefault(appointment.customer, len(customer_ids)) for appointment in appointments), np.int32, size)
+        return cls(minutes - EPOCH_MINUTES, vet, customer, list(vet_ids), list(customer_ids))
+
+    # The live appointments of the storage, and the archived ones (persistence_logic.archive)
+    @classmethod
+    def from_storage(cls, storage, archived: bool = True) -> "AppointmentColumns":
+        appointments = list(storage.appointments)
+        if archived:
+            appointments = storage.archive_store.between() + appointments
+        return cls.from_appointments(appointments)
+
+    # Straight from the columns of a binary snapshot (persistence_logic.binary_snapshot): no
+    # Appointment object is built, only the vet and customer names are decoded
+    @classmethod
+    def from_snapshot(cls, snapshot: BinarySnapshot) -> "AppointmentColumns":
+        np = load_numpy()
+        minutes, vets, customers = snapshot.appointment_columns()
+        vet_string_ids, vet = np.unique(np.frombuffer(vets, dtype=np.uint32), return_inverse=True)
+        names = [snapshot.string(int(string_id)) for string_id in vet_string_ids]
+        axis = vet_axis(names)
+        vet = np.array([axis.index(name) for name in names], dtype=np.int32)[vet] if names else vet.astype(np.int32)
+        customer_string_ids, customer = np.unique(np.frombuffer(customers, dtype=np.uint32), return_inverse=True)
+        return cls(np.frombuffer(minutes, dtype=np.int64) - EPOCH_MINUTES, vet, customer.astype(np.int32), axis,
+                   [snapshot.string(int(string_id)) for string_id in customer_string_ids])
+
+    # The rows with start <= datetime < end
+    def between(self, start: dt.datetime, end: dt.datetime) -> "AppointmentColumns":
+        inside = (self.minutes >= epoch_minutes(start)) & (self.minutes < epoch_minutes(end))
+        return AppointmentColumns(self.minutes[inside], self.vet[inside], self.customer[inside], self.vets, self.customers)
+
+
+# The scheduled slots of start <= date < end, from the current weekday templates (the history
+# is measured against today's schedule); `vet` indexes `vets`
+class ScheduleColumns:
+    def __init__(self, start: dt.date, end: dt.date, minutes, vet, vets: List[str]):
+        self.start = start
+        self.end = end
+        self.minutes = minutes
+        self.vet = vet
+        self.vets = vets
+
+    def __len__(self) -> int:
+        return len(self.minutes)
+
+    @property
+    def days(self) -> int:
+        return max((self.end - self.start).days, 0)
+
+    @classmethod
+    def from_templates(cls, start: dt.date, end: dt.date) -> "ScheduleColumns":
+        np = load_numpy()
+        vets = vet_axis()
+        days = np.arange(epoch_day(start), max(epoch_day(end), epoch_day(start)), dtype=np.int64)
+        weekdays = (days + EPOCH_WEEKDAY) % 7
+        templates = weekday_templates()
+        minutes, vet = [np.empty(0, np.int64)], [np.empty(0, np.int32)]
+        for number, weekday in enumerate(WEEKDAYS):
+            dates = days[weekdays == number]
+            if not len(dates):
+                continue
+            for name, offsets in templates.get(weekday, {}).items():
+                slots = (dates[:, None] * MINUTES_PER_DAY + np.asarray(offsets, dtype=np.int64)).ravel()
+                minutes.append(slots)
+                vet.append(np.full(len(slots), vets.index(name), dtype=np.int32))
+        minutes, vet = np.concatenate(minutes), np.concatenate(vet)
+        order = np.argsort(minutes, kind="stable")
+        return cls(start, end, minutes[order], vet[order], vets)
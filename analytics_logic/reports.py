@@ -0,0 +1,187 @@
+# Utilization and capacity reports over the columnar exports (analytics_logic.columns). Each
+# report is one vectorized group-by (numpy.bincount over a combined integer key: (day, vet),
+# (week, vet), (weekday, hour), (vet, weekday, time)) of the booked appointments and of the
+# scheduled slots. The reports are tables: dictionaries of equal-length arrays (column name ->
+# array), exported with write_csv.
+# Run with: python -m analytics_logic.reports [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--output DIR]
+import argparse
+import csv
+import datetime as dt
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from constants import WEEKDAYS
+from analytics_logic.columns import (EPOCH_WEEKDAY, MINUTES_PER_DAY, AppointmentColumns, ScheduleColumns, epoch_date,
+                                     epoch_day, load_numpy, vet_axis)
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+Table = Dict[str, object]
+
+# Default sizes of the rankings and of the forecast
+BUSIEST_SLOTS = 10
+FORECAST_WEEKS = 4
+FORECAST_HISTORY_WEEKS = 8
+
+# The vet ids of both exports on one axis (the schedule one, extended with the vets that only
+# appear in the appointments)
+def _aligned_vets(appointments: AppointmentColumns, schedule: ScheduleColumns) -> Tuple[List[str], object, object]:
+    np = load_numpy()
+    vets = vet_axis(schedule.vets + appointments.vets)
+    remap = np.array([vets.index(vet) for vet in appointments.vets] or [0], dtype=np.int64)
+    schedule_remap = np.array([vets.index(vet) for vet in schedule.vets] or [0], dtype=np.int64)
+    return vets, remap[appointments.vet], schedule_remap[schedule.vet]
+
+# Booked / capacity, NaN where nothing was scheduled
+def _ratio(booked, capacity):
+    np = load_numpy()
+    utilization = np.full(len(booked), np.nan)
+    np.divide(booked, capacity, out=utilization, where=capacity > 0)
+    return utilization
+
+# Counts of the booked and of the scheduled slots per key (0 <= key < size)
+def _counts(booked_keys, capacity_keys, size: int):
+    np = load_numpy()
+    return np.bincount(booked_keys, minlength=size)[:size], np.bincount(capacity_keys, minlength=size)[:size]
+
+# The appointments inside the schedule's date range, with their day offset in it
+def _inside(appointments: AppointmentColumns, schedule: ScheduleColumns, vet):
+    day = appointments.minutes // MINUTES_PER_DAY - epoch_day(schedule.start)
+    inside = (day >= 0) & (day < schedule.days)
+    return appointments.minutes[inside], day[inside], vet[inside]
+
+# Per (date, vet): booked, scheduled capacity and utilization; the rows with neither are left out
+def daily_utilization(appointments: AppointmentColumns, schedule: ScheduleColumns) -> Table:
+    np = load_numpy()
+    vets, vet, schedule_vet = _aligned_vets(appointments, schedule)
+    _, day, vet = _inside(appointments, schedule, vet)
+    schedule_day = schedule.minutes // MINUTES_PER_DAY - epoch_day(schedule.start)
+    size = schedule.days * len(vets)
+    booked, capacity = _counts(day * len(vets) + vet, schedule_day * len(vets) + schedule_vet, size)
+    keys = np.flatnonzero((booked > 0) | (capacity > 0))
+    days, vet_ids = np.divmod(keys, len(vets))
+    return {"date": (days + epoch_day(schedule.start)).astype("datetime64[D]"), "vet": np.array(vets)[vet_ids],
+            "booked": booked[keys], "capacity": capacity[keys], "utilization": _ratio(booked[keys], capacity[keys])}
+
+# Per (week, vet), the weeks starting on Monday (a partial first/last week is counted as is)
+def weekly_utilization(appointments: AppointmentColumns, schedule: ScheduleColumns) -> Table:
+    np = load_numpy()
+    vets, vet, schedule_vet = _aligned_vets(appointments, schedule)
+    start = epoch_day(schedule.start)
+    first_monday = start - (start + EPOCH_WEEKDAY) % 7
+    _, day, vet = _inside(appointments, schedule, vet)
+    weeks = (start + schedule.days - first_monday + 6) // 7
+    week = (day + start - first_monday) // 7
+    schedule_week = (schedule.minutes // MINUTES_PER_DAY - first_monday) // 7
+    booked, capacity = _counts(week * len(vets) + vet, schedule_week * len(vets) + schedule_vet, weeks * len(vets))
+    keys = np.flatnonzero((booked > 0) | (capacity > 0))
+    week_ids, vet_ids = np.divmod(keys, len(vets))
+    return {"week": (first_monday + 7 * week_ids).astype("datetime64[D]"), "vet": np.array(vets)[vet_ids],
+            "booked": booked[keys], "capacity": capacity[keys], "utilization": _ratio(booked[keys], capacity[keys])}
+
+# Per (weekday, hour), over the whole range and all the vets: the full 7 x 24 grid in weekday
+# then hour order, so that table["utilization"].reshape(7, 24) is the heatmap
+def utilization_heatmap(appointments: AppointmentColumns, schedule: ScheduleColumns) -> Table:
+    np = load_numpy()
+    vets, vet, _ = _aligned_vets(appointments, schedule)
+    minutes, _, _ = _inside(appointments, schedule, vet)
+
+    def cell(column):
+        days = column // MINUTES_PER_DAY
+        return ((days + EPOCH_WEEKDAY) % 7) * 24 + (column - days * MINUTES_PER_DAY) // 60
+
+    booked, capacity = _counts(cell(minutes), cell(schedule.minutes), 7 * 24)
+    cells = np.arange(7 * 24)
+    return {"weekday": np.array(WEEKDAYS)[cells // 24], "hour": cells % 24, "booked": booked, "capacity": capacity,
+            "utilization": _ratio(booked, capacity)}
+
+# The recurring slots (vet, weekday, time of day) ranked by utilization, the most booked first
+# (the least booked first with `least`); only the slots of the schedule are ranked
+def busiest_slots(appointments: AppointmentColumns, schedule: ScheduleColumns, top: int = BUSIEST_SLOTS,
+                  least: bool = False) -> Table:
+    np = load_numpy()
+    vets, vet, schedule_vet = _aligned_vets(appointments, schedule)
+    minutes, _, vet = _inside(appointments, schedule, vet)
+
+    def recurring(column, vet_column):
+        days = column // MINUTES_PER_DAY
+        return (vet_column * 7 + (days + EPOCH_WEEKDAY) % 7) * MINUTES_PER_DAY + column - days * MINUTES_PER_DAY
+
+    booked, capacity = _counts(recurring(minutes, vet), recurring(schedule.minutes, schedule_vet), len(vets) * 7 * MINUTES_PER_DAY)
+    keys = np.flatnonzero(capacity)
+    utilization = _ratio(booked[keys], capacity[keys])
+    # by utilization, then by the number of bookings
+    order = np.lexsort((booked[keys], utilization) if least else (-booked[keys], -utilization))[:top]
+    keys, utilization = keys[order], utilization[order]
+    vet_weekday, minute = np.divmod(keys, MINUTES_PER_DAY)
+    vet_ids, weekdays = np.divmod(vet_weekday, 7)
+    return {"vet": np.array(vets)[vet_ids], "weekday": np.array(WEEKDAYS)[weekdays],
+            "time": np.array([f"{value // 60:02d}:{value % 60:02d}" for value in minute.tolist()]),
+            "booked": booked[keys], "capacity": capacity[keys], "utilization": utilization}
+
+# Per (week, vet) of the `weeks` weeks from `start`: the scheduled capacity, the slots already
+# booked, and the expected bookings at the vet's fill rate over the `history_weeks` before
+# start (never below what is already booked); "spare" is the capacity left after the forecast
+def capacity_forecast(appointments: AppointmentColumns, start: dt.date, weeks: int = FORECAST_WEEKS,
+                      history_weeks: int = FORECAST_HISTORY_WEEKS) -> Table:
+    np = load_numpy()
+    history = ScheduleColumns.from_templates(start - dt.timedelta(weeks=history_weeks), start)
+    past = weekly_utilization(appointments, history)
+    vets = vet_axis(history.vets + appointments.vets)
+    past_vet = np.array([vets.index(vet) for vet in past["vet"].tolist()], dtype=np.int64)
+    past_booked = np.bincount(past_vet, weights=past["booked"], minlength=len(vets))
+    past_capacity = np.bincount(past_vet, weights=past["capacity"], minlength=len(vets))
+    fill_rate = np.divide(past_booked, past_capacity, out=np.zeros(len(vets)), where=past_capacity > 0)
+
+    future = weekly_utilization(appointments, ScheduleColumns.from_templates(start, start + dt.timedelta(weeks=weeks)))
+    vet = np.array([vets.index(vet) for vet in future["vet"].tolist()], dtype=np.int64)
+    expected = np.maximum(future["booked"], np.round(future["capacity"] * fill_rate[vet]))
+    return {"week": future["week"], "vet": future["vet"], "capacity": future["capacity"], "booked": future["booked"],
+            "fill_rate": fill_rate[vet], "forecast": expected, "spare": future["capacity"] - expected}
+
+# A report as CSV (the columns in the table order; dates as YYYY-MM-DD)
+def write_csv(table: Table, file_path: Path) -> Path:
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    columns = [column.tolist() if hasattr(column, "tolist") else list(column) for column in table.values()]
+    with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(table.keys())
+        writer.writerows(zip(*columns))
+    logger.info("Wrote the report %s (%s rows).", file_path, len(columns[0]) if columns else 0)
+    return file_path
+
+# All the reports of a date range (default: the whole history), as CSV files in a directory
+def export_reports(appointments: AppointmentColumns, output: Path, start: Optional[dt.date] = None,
+                   end: Optional[dt.date] = None, today: Optional[dt.date] = None) -> List[Path]:
+    if start is None or end is None:
+        days = appointments.minutes // MINUTES_PER_DAY
+        first = days.min() if len(days) else epoch_day(dt.date.today())
+        start = start or epoch_date(first)
+        end = end or epoch_date(days.max() + 1 if len(days) else first)
+    schedule = ScheduleColumns.from_templates(start, end)
+    output = Path(output)
+    reports = {"daily_utilization": daily_utilization(appointments, schedule),
+               "weekly_utilization": weekly_utilization(appointments, schedule),
+               "utilization_heatmap": utilization_heatmap(appointments, schedule),
+               "busiest_slots": busiest_slots(appointments, schedule),
+               "least_booked_slots": busiest_slots(appointments, schedule, least=True),
+               "capacity_forecast": capacity_forecast(appointments, today or dt.date.today())}
+    return [write_csv(table, output / f"{name}.csv") for name, table in reports.items()]
+
+if __name__ == "__main__":
+    import storage_logic
+    from logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Utilization and capacity reports of the clinic, as CSV files.")
+    parser.add_argument("--from", dest="start", type=dt.date.fromisoformat, default=None, help="first date (default: the oldest appointment)")
+    parser.add_argument("--to", dest="end", type=dt.date.fromisoformat, default=None, help="end date, excluded (default: after the last appointment)")
+    parser.add_argument("--output", type=Path, default=Path("reports"), help="directory of the CSV files")
+    parser.add_argument("--no-archive", action="store_true", help="leave out the archived appointments")
+    arguments = parser.parse_args()
+    configure_logging(level=logging.WARNING)
+    columns = AppointmentColumns.from_storage(storage_logic.shared_storage(), archived=not arguments.no_archive)
+    for path in export_reports(columns, arguments.output, arguments.start, arguments.end):
+        print(path)
@@ -1,18 +1,50 @@
 # Low-level logic for the appointment system
-from dataclasses import dataclass
+import sys
+from dataclasses import FrozenInstanceError
 from slot_times import Slot
 from typing import List
 import logging
 from slot_times import *
+from appointments_logic.index import AppointmentIndex
+from metrics import timed
+from appointments_logic import events
 
 # Logger initialization
 logger = logging.getLogger(__name__)
 
-# Base class (with init, repr and eq included)
-@dataclass(frozen=True)
+# Base class (init, repr and eq as the Slot): immutable, hashable (hash cached), no __dict__
 class Appointment:
-    customer: str
-    slot: Slot
+    __slots__ = ("customer", "slot", "_hash")
+
+    def __init__(self, customer: str, slot: Slot):
+        object.__setattr__(self, "customer", sys.intern(customer) if type(customer) is str else customer)
+        object.__setattr__(self, "slot", slot)
+        object.__setattr__(self, "_hash", None)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        return (Appointment, (self.customer, self.slot))
+
+    def __repr__(self) -> str:
+        return f"Appointment(customer={self.customer!r}, slot={self.slot!r})"
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash((self.customer, self.slot)))
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not Appointment:
+            return NotImplemented
+        return self.customer == other.customer and self.slot == other.slot
+
+# The appointments can be kept in a plain list or in the indexed store
+APPOINTMENT_CONTAINERS = (list, AppointmentIndex)
 
 # Basic appointment constructors and accessors
 def appointment_customer(appointment: Appointment) -> str:
@@ -35,7 +67,7 @@ def make_appointment(customer: str, slot: object) -> Appointment:
 
 # this function adds the appointment to the list:
 def add_appointment(appointments: List[Appointment], appointment: Appointment):
-    if not isinstance(appointments, list):
+    if not isinstance(appointments, APPOINTMENT_CONTAINERS):
         logger.error("The apointments entry is not a valid list.")
         raise TypeError("The appointments entry is not valid. Please, try again.")
     elif check_slot_error(appointment_slot(appointment)) is None:
@@ -43,11 +75,13 @@ def add_appointment(appointments: List[Appointment], appointment: Appointment):
         return None
     else:
         appointments.append(appointment)
+        events.emit("book", appointment_slot(appointment))
         logger.info("Successfully added the appointment.")
         return appointments
 
+@timed("cancel", {"layer": "core"})
 def remove_appointment(appointments, appointment):
-    if not isinstance(appointments, list):
+    if not isinstance(appointments, APPOINTMENT_CONTAINERS):
         logger.error("The apointments entry is not a valid list.")
         raise TypeError("The appointments entry is not valid. Please, try again.")
     elif check_slot_error(appointment_slot(appointment)) is None:
@@ -55,28 +89,30 @@ def remove_appointment(appointments, appointment):
         return None
     elif appointment in appointments:
         appointments.remove(appointment)
-        logger.info(f"Successfully removed the apointment: {appointment}.")
+        events.emit("cancel", appointment_slot(appointment))
+        logger.info("Successfully removed the apointment: %s.", appointment)
         return appointments
     else:
         logger.warning("The given appointment entry is not currently in the list of appointments.")
         return None
 
 def check_appointment_status(appointments, appointment):
-    if not isinstance(appointments, list):
+    if not isinstance(appointments, APPOINTMENT_CONTAINERS):
         logger.error("The apointments entry is not a valid list.")
         raise TypeError("The appointments entry is not valid. Please, try again.")
     elif check_slot_error(appointment_slot(appointment)) is None:
         logger.warning("Can't check the appointment status due to an invalid slot.")
         return False
     elif appointment in appointments:
-        logger.info(f"The records show that the given appointmet is present in the system: '{appointment}'")
+        logger.info("The records show that the given appointmet is present in the system: '%s'", appointment)
         return True
     else:
-        logger.info(f"The records show that the given appointment ({appointment}) is NOT scheduled in the system.")
+        logger.info("The records show that the given appointment (%s) is NOT scheduled in the system.", appointment)
         return False
     
+@timed("update", {"layer": "core"})
 def update_current_appointment(appointments: List[Appointment], old_appointment: Appointment, new_appointment: Appointment):
-    if not isinstance(appointments, list):
+    if not isinstance(appointments, APPOINTMENT_CONTAINERS):
         logger.error("The apointments entry is not a valid list.")
         raise TypeError("The appointments entry is not valid. Please, try again.")
     elif check_slot_error(appointment_slot(old_appointment)) is None or False:
@@ -91,5 +127,6 @@ def update_current_appointment(appointments: List[Appointment], old_appointment:
     else:
         remove_appointment(appointments, old_appointment)
         add_appointment(appointments, new_appointment)
-        logger.info(f"The appointment has been successfully updated. Old appointment: {old_appointment};\nNew appointment: {new_appointment}.")
+        events.emit("update", appointment_slot(old_appointment), appointment_slot(new_appointment))
+        logger.info("The appointment has been successfully updated. Old appointment: %s;\nNew appointment: %s.", old_appointment, new_appointment)
         return appointments
\ No newline at end of file
@@ -0,0 +1,37 @@
+# Slot change events: every mutation of the booking state announces the slots it touched, after
+# the change is applied, so that derived data (e.g. the availability cache) can be invalidated
+import logging
+from typing import Callable, List, Tuple
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# "schedule" and "archive" carry no slots: the schedule constants changed, or the past was moved
+# out of the working set; everything derived is stale
+EVENT_KINDS = ("book", "cancel", "reserve", "update", "schedule", "archive")
+
+Listener = Callable[[str, Tuple], None]
+
+_listeners: List[Listener] = []
+
+def subscribe(listener: Listener) -> Listener:
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+def unsubscribe(listener: Listener) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+    return None
+
+# The listeners run synchronously in the mutating thread (under its locks, if any); a failing
+# listener is logged and does not stop the others
+def emit(kind: str, *slots) -> None:
+    if not _listeners:
+        return None
+    for listener in tuple(_listeners):
+        try:
+            listener(kind, slots)
+        except Exception as err:
+            logger.error("The listener %r failed on the event '%s': %s", listener, kind, err)
+    return None
@@ -0,0 +1,215 @@
+# Indexed in-memory store for the appointments
+import bisect
+import datetime as dt
+import heapq
+import logging
+from itertools import islice
+from threading import RLock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Index keys; the Slot itself is not used as a key, the (datetime, vet) pair is
+SlotKey = Tuple[dt.datetime, str]
+AppointmentKey = Tuple[str, dt.datetime, str]
+
+# Helpers for building the index keys out of the Slot/Appointment attributes
+def slot_key(slot) -> SlotKey:
+    return (slot.datetime, slot.vet)
+
+def appointment_key(appointment) -> AppointmentKey:
+    return (appointment.customer, appointment.slot.datetime, appointment.slot.vet)
+
+# Key of the customer index: the searches by name ignore the case (str.casefold)
+def customer_key(customer: str) -> str:
+    return customer.casefold()
+
+# Appended to a prefix, the upper bound of the keys starting with it
+PREFIX_END = "\U0010ffff"
+
+# Sorting key used for the datetime index (time first, then vet and customer)
+def _sort_key(appointment) -> Tuple[dt.datetime, str, str]:
+    return (appointment.slot.datetime, appointment.slot.vet, appointment.customer)
+
+
+# The appointments store; it keeps the list API (append, remove, in, len, iteration, indexing)
+# used by appointments_logic.core, with hash indexes on (customer, slot), slot, vet and date,
+# a sorted index by datetime, and a customer index (the sorted case-folded names, each with its
+# appointments in time order) for the prefix searches. An appointment (customer + slot) is
+# stored only once.
+class AppointmentIndex:
+    def __init__(self, appointments: Optional[Iterable] = None):
+        self._records: Dict[AppointmentKey, object] = {}
+        self._by_slot: Dict[SlotKey, Dict[AppointmentKey, object]] = {}
+        self._by_vet: Dict[str, Dict[AppointmentKey, object]] = {}
+        self._by_date: Dict[dt.date, Dict[AppointmentKey, object]] = {}
+        self._sorted: List[Tuple[dt.datetime, str, str]] = []
+        self._customers: List[str] = []
+        self._by_customer: Dict[str, List[Tuple[dt.datetime, str, str]]] = {}
+        # short internal lock: keeps the indexes consistent when several vet-day locks mutate at once
+        self._lock = RLock()
+        if appointments is not None:
+            self.extend(appointments)
+
+    # Helpers for maintaining the secondary indexes
+    @staticmethod
+    def _index_add(index: Dict, key, record_key: AppointmentKey, appointment) -> None:
+        index.setdefault(key, {})[record_key] = appointment
+
+    @staticmethod
+    def _index_remove(index: Dict, key, record_key: AppointmentKey) -> None:
+        bucket = index.get(key)
+        if bucket is None:
+            return None
+        bucket.pop(record_key, None)
+        if not bucket:
+            del index[key]
+
+    # List API
+    def append(self, appointment) -> None:
+        key = appointment_key(appointment)
+        with self._lock:
+            if key in self._records:
+                logger.warning("The appointment %s is already in the store.", appointment)
+                return None
+            self._records[key] = appointment
+            self._index_add(self._by_slot, slot_key(appointment.slot), key, appointment)
+            self._index_add(self._by_vet, appointment.slot.vet, key, appointment)
+            self._index_add(self._by_date, appointment.slot.datetime.date(), key, appointment)
+            bisect.insort(self._sorted, _sort_key(appointment))
+            name = customer_key(appointment.customer)
+            entries = self._by_customer.get(name)
+            if entries is None:
+                entries = self._by_customer[name] = []
+                bisect.insort(self._customers, name)
+            bisect.insort(entries, _sort_key(appointment))
+        return None
+
+    def extend(self, appointments: Iterable) -> None:
+        for appointment in appointments:
+            self.append(appointment)
+        return None
+
+    def remove(self, appointment) -> None:
+        key = appointment_key(appointment)
+        with self._lock:
+            if key not in self._records:
+                raise ValueError(f"{appointment} is not in the appointments store.")
+            del self._records[key]
+            self._index_remove(self._by_slot, slot_key(appointment.slot), key)
+            self._index_remove(self._by_vet, appointment.slot.vet, key)
+            self._index_remove(self._by_date, appointment.slot.datetime.date(), key)
+            position = bisect.bisect_left(self._sorted, _sort_key(appointment))
+            del self._sorted[position]
+            name = customer_key(appointment.customer)
+            entries = self._by_customer[name]
+            del entries[bisect.bisect_left(entries, _sort_key(appointment))]
+            if not entries:
+                del self._by_customer[name]
+                del self._customers[bisect.bisect_left(self._customers, name)]
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._by_slot.clear()
+            self._by_vet.clear()
+            self._by_date.clear()
+            self._sorted.clear()
+            self._customers.clear()
+            self._by_customer.clear()
+        return None
+
+    def __contains__(self, appointment) -> bool:
+        try:
+            return appointment_key(appointment) in self._records
+        except AttributeError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._records.values()))
+
+    # Positional access is kept for compatibility with the list API; it costs O(N)
+    def __getitem__(self, position):
+        return list(self._records.values())[position]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, AppointmentIndex):
+            return self._records == other._records
+        if isinstance(other, list):
+            return list(self._records.values()) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"AppointmentIndex({list(self._records.values())!r})"
+
+    # Indexed lookups
+    def find(self, customer: str, slot) -> Optional[object]:
+        return self._records.get((customer, slot.datetime, slot.vet))
+
+    def by_slot(self, slot) -> List:
+        return list(self._by_slot.get(slot_key(slot), {}).values())
+
+    def is_slot_booked(self, slot) -> bool:
+        return slot_key(slot) in self._by_slot
+
+    def by_vet(self, vet: str) -> List:
+        return sorted(self._by_vet.get(vet, {}).values(), key=_sort_key)
+
+    def by_date(self, date: dt.date) -> List:
+        return sorted(self._by_date.get(date, {}).values(), key=_sort_key)
+
+    # The appointments with start <= datetime < end, in time order (O(log N + k))
+    def between(self, start: dt.datetime, end: dt.datetime) -> List:
+        with self._lock:
+            low = bisect.bisect_left(self._sorted, (start,))
+            high = bisect.bisect_left(self._sorted, (end,))
+            return [self._records[(customer, datetime, vet)] for datetime, vet, customer in self._sorted[low:high]]
+
+    # The appointments of a customer (case-insensitive), in time order, from `since` if given
+    def by_customer(self, customer: str, since: Optional[dt.datetime] = None) -> List:
+        with self._lock:
+            entries = self._by_customer.get(customer_key(customer), [])
+            low = bisect.bisect_left(entries, (since,)) if since is not None else 0
+            return [self._records[(customer, datetime, vet)] for datetime, vet, customer in entries[low:]]
+
+    # The case-folded customer names starting with the prefix (O(log N + k))
+    def customers_with_prefix(self, prefix: str) -> List[str]:
+        prefix = customer_key(prefix)
+        with self._lock:
+            low = bisect.bisect_left(self._customers, prefix)
+            high = bisect.bisect_left(self._customers, prefix + PREFIX_END)
+            return self._customers[low:high]
+
+    # The appointments of the customers starting with the prefix, from `since` if given, in time
+    # order. The range of names costs O(log N); then, for the m matching customers, either the
+    # per-customer lists are cut at `since` (O(log n) each) and merged, or, when m is large and
+    # only the first `limit` are asked, the time index is walked from `since` (about
+    # limit * customers / m entries) and filtered by the prefix.
+    def search_customers(self, prefix: str, since: Optional[dt.datetime] = None, limit: Optional[int] = None) -> List:
+        prefix = customer_key(prefix)
+        with self._lock:
+            low = bisect.bisect_left(self._customers, prefix)
+            high = bisect.bisect_left(self._customers, prefix + PREFIX_END)
+            matching = high - low
+            if limit is not None and matching * matching > limit * len(self._customers):
+                start = bisect.bisect_left(self._sorted, (since,)) if since is not None else 0
+                keys = islice((self._sorted[position] for position in range(start, len(self._sorted))
+                               if customer_key(self._sorted[position][2]).startswith(prefix)), limit)
+            else:
+                streams = []
+                for name in self._customers[low:high]:
+                    entries = self._by_customer[name]
+                    first = bisect.bisect_left(entries, (since,)) if since is not None else 0
+                    if first < len(entries):
+                        streams.append(entries[first:])
+                keys = islice(heapq.merge(*streams), limit)
+            return [self._records[(customer, datetime, vet)] for datetime, vet, customer in keys]
+
+    def ordered(self) -> List:
+        with self._lock:
+            return [self._records[(customer, datetime, vet)] for datetime, vet, customer in self._sorted]
@@ -0,0 +1,121 @@
+# Lock striping per (vet, day) with version counters for the optimistic reads
+import datetime as dt
+import logging
+from contextlib import contextmanager
+from threading import RLock
+from typing import Callable, Dict, Hashable, Iterator, Tuple
+
+from metrics import acquire, acquired, count
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Number of lock stripes, and of optimistic attempts before a read falls back to the lock
+LOCK_STRIPES = 64
+OPTIMISTIC_READ_ATTEMPTS = 8
+
+VetDayKey = Tuple[str, dt.date]
+
+# The (vet, day) key of a slot
+def vet_day_key(slot) -> VetDayKey:
+    return (slot.vet, slot.datetime.date())
+
+
+# Mutations of a vet-day take its stripe lock and bump its version on entry and on exit (odd
+# while a mutation is in progress, as a seqlock); reads run without a lock and are valid if the
+# version was even and did not change meanwhile. Bookings of different vet-days only
+# contend when their keys fall on the same stripe.
+class VetDayLocks:
+    def __init__(self, stripes: int = LOCK_STRIPES):
+        self._stripes = [RLock() for _ in range(stripes)]
+        # a version is only written while holding the stripe lock of its key
+        self._versions: Dict[Hashable, int] = {}
+        # short lock of what every vet-day shares (the service's slot lists, the counters): a
+        # stripe lock only covers its own vet-days, while `in` and list.remove run Slot.__eq__
+        # and can be interleaved with the mutation of another stripe
+        self.shared = RLock()
+        self.conflicts = 0
+
+    def _stripe_index(self, key: Hashable) -> int:
+        return hash(key) % len(self._stripes)
+
+    def _stripe(self, key: Hashable) -> RLock:
+        return self._stripes[self._stripe_index(key)]
+
+    def version(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def _bump(self, key: Hashable) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        return None
+
+    # Exclusive section for one key
+    @contextmanager
+    def locked(self, key: Hashable) -> Iterator[None]:
+        with acquired(self._stripe(key), "vet_day"):
+            self._bump(key)
+            try:
+                yield
+            finally:
+                self._bump(key)
+
+    # Exclusive section for several keys; the stripes are taken in index order, as all_locked does
+    @contextmanager
+    def locked_many(self, keys) -> Iterator[None]:
+        keys = list(dict.fromkeys(keys))
+        stripes = [self._stripes[index] for index in sorted({self._stripe_index(key) for key in keys})]
+        taken = []
+        try:
+            for stripe in stripes:
+                acquire(stripe, "vet_day")
+                taken.append(stripe)
+            for key in keys:
+                self._bump(key)
+            try:
+                yield
+            finally:
+                for key in keys:
+                    self._bump(key)
+        finally:
+            for stripe in reversed(taken):
+                stripe.release()
+
+    # Exclusive section over every stripe (e.g. a checkpoint of the whole state)
+    @contextmanager
+    def all_locked(self) -> Iterator[None]:
+        taken = []
+        try:
+            for stripe in self._stripes:
+                acquire(stripe, "all_stripes")
+                taken.append(stripe)
+            yield
+        finally:
+            for stripe in reversed(taken):
+                stripe.release()
+
+    # Run `apply` only if nobody changed the key since `expected_version` was read
+    def compare_and_set(self, key: Hashable, expected_version: int, apply: Callable[[], object]) -> Tuple[bool, object]:
+        with acquired(self._stripe(key), "vet_day"):
+            if self.version(key) != expected_version:
+                with self.shared:
+                    self.conflicts += 1
+                count("cas_conflicts")
+                return False, None
+            self._bump(key)
+            try:
+                return True, apply()
+            finally:
+                self._bump(key)
+
+    # Lock-free read validated by the version; falls back to the lock under heavy contention
+    def optimistic_read(self, key: Hashable, read: Callable[[], object]) -> object:
+        for _ in range(OPTIMISTIC_READ_ATTEMPTS):
+            version = self.version(key)
+            if version % 2:
+                continue
+            result = read()
+            if self.version(key) == version:
+                return result
+        count("optimistic_read_fallbacks")
+        with acquired(self._stripe(key), "vet_day"):
+            return read()
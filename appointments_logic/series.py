@@ -0,0 +1,259 @@
+# Recurring appointment series: a rule (first datetime, frequency, interval, count or end) kept
+# as is, whose occurrences are generated lazily, over the requested window only (the first
+# occurrence of a window is found by arithmetic, not by walking the series). A cancelled or
+# moved occurrence is an exception of the series (occurrence number -> None or the new slot),
+# not a rewrite of the rule.
+import datetime as dt
+import heapq
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from slot_times import Slot
+from appointments_logic.core import Appointment
+from appointments_logic.index import customer_key
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+# Longest series (occurrences), so that every rule ends
+SERIES_MAX_OCCURRENCES = 1000
+
+# The same day and time `months` months later; None if the month has no such day (the 31st...)
+def add_months(moment: dt.datetime, months: int) -> Optional[dt.datetime]:
+    years, month = divmod(moment.month - 1 + months, 12)
+    try:
+        return moment.replace(year=moment.year + years, month=month + 1)
+    except ValueError:
+        return None
+
+
+# Occurrence n (0-based) is at start + n * interval days/weeks/months; a monthly occurrence on
+# a day its month does not have is skipped (it keeps its number)
+class RecurrenceRule:
+    def __init__(self, start: dt.datetime, frequency: str = "weekly", interval: int = 1, count: Optional[int] = None,
+                 until: Optional[dt.datetime] = None):
+        self.start = start
+        self.frequency = frequency
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.step = dt.timedelta(days=interval * (7 if frequency == "weekly" else 1)) if frequency != "monthly" else None
+        self.length = self._length()
+
+    def at(self, number: int) -> Optional[dt.datetime]:
+        if self.step is not None:
+            return self.start + number * self.step
+        return add_months(self.start, number * self.interval)
+
+    # The number of occurrences (including the skipped ones)
+    def _length(self) -> int:
+        lengths = [self.count] if self.count is not None else []
+        if self.until is not None:
+            if self.until < self.start:
+                lengths.append(0)
+            elif self.step is not None:
+                lengths.append((self.until - self.start) // self.step + 1)
+            else:
+                last = ((self.until.year - self.start.year) * 12 + self.until.month - self.start.month) // self.interval
+                moment = self.at(last)
+                lengths.append(last if moment is not None and moment > self.until else last + 1)
+        return min(lengths) if lengths else 0
+
+    # The number of the first occurrence at or after `moment` (length if there is none)
+    def number_at_or_after(self, moment: dt.datetime) -> int:
+        if moment <= self.start:
+            return 0
+        if self.step is not None:
+            return min(-((self.start - moment) // self.step), self.length)
+        number = max(((moment.year - self.start.year) * 12 + moment.month - self.start.month) // self.interval, 0)
+        while number < self.length and (self.at(number) is None or self.at(number) < moment):
+            number += 1
+        return min(number, self.length)
+
+    # The number of the occurrence at exactly `moment`, if any
+    def number_of(self, moment: dt.datetime) -> Optional[int]:
+        number = self.number_at_or_after(moment)
+        return number if number < self.length and self.at(number) == moment else None
+
+    # (number, datetime) of the occurrences with start <= datetime < end, in order
+    def occurrences(self, start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None) -> Iterator[Tuple[int, dt.datetime]]:
+        for number in range(self.number_at_or_after(start) if start is not None else 0, self.length):
+            moment = self.at(number)
+            if moment is None:
+                continue
+            if end is not None and moment >= end:
+                return
+            yield number, moment
+
+    @property
+    def last(self) -> Optional[dt.datetime]:
+        for number in range(self.length - 1, -1, -1):
+            moment = self.at(number)
+            if moment is not None:
+                return moment
+        return None
+
+    def as_dict(self) -> Dict:
+        return {"start": self.start.isoformat(), "frequency": self.frequency, "interval": self.interval, "count": self.count,
+                "until": self.until.isoformat() if self.until is not None else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RecurrenceRule":
+        return cls(dt.datetime.fromisoformat(data["start"]), data["frequency"], data["interval"], data.get("count"),
+                   dt.datetime.fromisoformat(data["until"]) if data.get("until") else None)
+
+    def __repr__(self) -> str:
+        return (f"RecurrenceRule(start={self.start!r}, frequency={self.frequency!r}, interval={self.interval}, "
+                f"count={self.count}, until={self.until!r})")
+
+# Rule constructor with the checks; `until` may be a date (the whole day is included). Returns
+# None if the rule is not valid.
+def make_rule(start: dt.datetime, frequency: str = "weekly", interval: int = 1, count: Optional[int] = None,
+              until=None) -> Optional[RecurrenceRule]:
+    if isinstance(until, dt.date) and not isinstance(until, dt.datetime):
+        until = dt.datetime.combine(until, dt.time.max)
+    if not isinstance(start, dt.datetime):
+        logger.warning("The series needs a start datetime.")
+        return None
+    elif frequency not in FREQUENCIES:
+        logger.warning("The series frequency '%s' is not valid. Please, choose one of: %s.", frequency, ", ".join(FREQUENCIES))
+        return None
+    elif not isinstance(interval, int) or interval < 1:
+        logger.warning("The series interval must be a positive integer.")
+        return None
+    elif count is None and until is None:
+        logger.warning("The series needs a number of occurrences or an end date.")
+        return None
+    elif count is not None and (not isinstance(count, int) or count < 1):
+        logger.warning("The number of occurrences must be a positive integer.")
+        return None
+    elif until is not None and (not isinstance(until, dt.datetime) or until < start):
+        logger.warning("The series end must be a datetime after its start.")
+        return None
+    rule = RecurrenceRule(start, frequency, interval, count, until)
+    if rule.length > SERIES_MAX_OCCURRENCES:
+        logger.warning("The series has %s occurrences; at most %s are allowed.", rule.length, SERIES_MAX_OCCURRENCES)
+        return None
+    return rule
+
+
+# One customer's series with one vet; the exceptions map occurrence numbers to None (cancelled)
+# or to the slot they were moved to
+class AppointmentSeries:
+    def __init__(self, series_id: int, customer: str, vet: str, rule: RecurrenceRule,
+                 exceptions: Optional[Dict[int, Optional[Slot]]] = None):
+        self.id = series_id
+        self.customer = customer
+        self.vet = vet
+        self.rule = rule
+        self.exceptions: Dict[int, Optional[Slot]] = {}
+        # moved slot -> occurrence number
+        self._moved: Dict[Slot, int] = {}
+        for number, slot in (exceptions or {}).items():
+            self.set_exception(number, slot)
+
+    def set_exception(self, number: int, slot: Optional[Slot] = None) -> None:
+        previous = self.exceptions.get(number)
+        if previous is not None:
+            del self._moved[previous]
+        self.exceptions[number] = slot
+        if slot is not None:
+            self._moved[slot] = number
+        return None
+
+    # The appointments of the occurrences with start <= datetime < end, in time order
+    def occurrences(self, start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None) -> Iterator[Appointment]:
+        regular = (Appointment(self.customer, Slot(moment, self.vet)) for number, moment in self.rule.occurrences(start, end)
+                   if number not in self.exceptions)
+        moved = sorted(slot for slot in self._moved if (start is None or slot.datetime >= start) and (end is None or slot.datetime < end))
+        if not moved:
+            return regular
+        return heapq.merge(regular, (Appointment(self.customer, slot) for slot in moved), key=lambda appointment: appointment.slot.datetime)
+
+    # The number of the occurrence held at the slot, if any
+    def occurrence_at(self, slot: Slot) -> Optional[int]:
+        number = self._moved.get(slot)
+        if number is not None:
+            return number
+        if slot.vet != self.vet:
+            return None
+        number = self.rule.number_of(slot.datetime)
+        return None if number is None or number in self.exceptions else number
+
+    def __len__(self) -> int:
+        return self.rule.length
+
+    def __repr__(self) -> str:
+        return f"AppointmentSeries(id={self.id}, customer={self.customer!r}, vet={self.vet!r}, rule={self.rule!r}, exceptions={len(self.exceptions)})"
+
+
+# All the series of a storage, by vet (of the rule) and by moved slot, so that "who holds this
+# slot" costs one rule check per series of the vet
+class SeriesBook:
+    def __init__(self, series: List[AppointmentSeries] = ()):
+        self._series: Dict[int, AppointmentSeries] = {}
+        self._by_vet: Dict[str, List[AppointmentSeries]] = {}
+        self._moved: Dict[Slot, AppointmentSeries] = {}
+        for item in series:
+            self.add(item)
+
+    def next_id(self) -> int:
+        return max(self._series, default=0) + 1
+
+    def add(self, series: AppointmentSeries) -> None:
+        self._series[series.id] = series
+        self._by_vet.setdefault(series.vet, []).append(series)
+        for slot in series._moved:
+            self._moved[slot] = series
+        return None
+
+    def get(self, series_id: int) -> Optional[AppointmentSeries]:
+        return self._series.get(series_id)
+
+    def set_exception(self, series: AppointmentSeries, number: int, slot: Optional[Slot] = None) -> None:
+        previous = series.exceptions.get(number)
+        if previous is not None:
+            self._moved.pop(previous, None)
+        series.set_exception(number, slot)
+        if slot is not None:
+            self._moved[slot] = series
+        return None
+
+    # The series and occurrence number holding the slot, if any
+    def occupant(self, slot: Slot) -> Optional[Tuple[AppointmentSeries, int]]:
+        series = self._moved.get(slot)
+        if series is not None:
+            return series, series._moved[slot]
+        for series in self._by_vet.get(slot.vet, ()):
+            number = series.occurrence_at(slot)
+            if number is not None:
+                return series, number
+        return None
+
+    def find(self, customer: str, slot: Slot) -> Optional[Tuple[AppointmentSeries, int]]:
+        occupant = self.occupant(slot)
+        return occupant if occupant is not None and occupant[0].customer == customer else None
+
+    # The occurrences with start <= datetime < end (of one vet, if given), series by series
+    def occurrences_between(self, start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None,
+                            vet: Optional[str] = None) -> Iterator[Appointment]:
+        if vet is None:
+            candidates = list(self._series.values())
+        else:
+            candidates = list(dict.fromkeys(self._by_vet.get(vet, []) + [series for slot, series in self._moved.items() if slot.vet == vet]))
+        for series in candidates:
+            for appointment in series.occurrences(start, end):
+                if vet is None or appointment.slot.vet == vet:
+                    yield appointment
+
+    # The series of the customers whose name starts with the prefix (case-insensitive)
+    def with_customer_prefix(self, prefix: str) -> List[AppointmentSeries]:
+        prefix = customer_key(prefix)
+        return [series for series in self._series.values() if customer_key(series.customer).startswith(prefix)]
+
+    def __iter__(self) -> Iterator[AppointmentSeries]:
+        return iter(list(self._series.values()))
+
+    def __len__(self) -> int:
+        return len(self._series)
@@ -1,8 +1,15 @@
 import datetime as dt
+import json
 import logging
+import time
+from contextlib import nullcontext
+from pathlib import Path
 from constants import *
-from slot_times import (add_slot, check_slot, filter_slots_by_date, filter_slots_by_vet, make_slot, make_daily_slots)
-from appointments_logic.core import appointment_slot, add_appointment, make_appointment
+from slot_times import (add_slot, check_slot, check_slot_error, filter_slots_by_date, filter_slots_by_vet, make_slot, make_daily_slots, vet_name)
+from appointments_logic.core import appointment_customer, appointment_slot, add_appointment, make_appointment, remove_appointment
+from appointments_logic.locking import vet_day_key
+from metrics import count, timed
+from appointments_logic import events
 
 # Initializing the logger
 logger = logging.getLogger(__name__)
@@ -16,56 +23,268 @@ def get_current_day(date):
     
 # Helper function to finding a vet schedule
 def find_vet_schedule(schedule: Dict, vet: str) -> List[str]:
-    if vet not in schedule.items():
-        logger.warning(f"The specified vet '{vet}' does not exist. Please, choose a valid vet from the list:\n")
+    if vet not in schedule:
+        logger.warning("The specified vet '%s' does not exist. Please, choose a valid vet from the list:\n", vet)
         return None
     else:
         return schedule[vet]    
 
+# The shared lock of `locks` (appointments_logic.locking.VetDayLocks), held around every access
+# to the slot lists: they are shared by all the vet-days, while a stripe lock only covers its own
+def _shared(locks):
+    return locks.shared if locks is not None else nullcontext()
+
 # High-level logic for the appointment system
-def create_appointment(appointments, appointment, available_slots, reserved_slots):
+def _book_slot(appointments, appointment, available_slots, reserved_slots, locks=None):
     slot = appointment_slot(appointment)
-    if check_slot(available_slots, slot) is True:
+    with _shared(locks):
         add_appointment(appointments, appointment)
         add_slot(reserved_slots, slot)
         available_slots.remove(slot)
+    events.emit("book", slot)
+    return None
+
+# With `locks` (appointments_logic.locking.VetDayLocks) the availability is read without the
+# vet-day lock and the booking is applied with compare-and-set on the (vet, day) version: of two
+# concurrent bookings of the same slot exactly one wins, the other one re-reads and finds the
+# slot taken
+@timed("booking", {"layer": "service"})
+def create_appointment(appointments, appointment, available_slots, reserved_slots, locks=None):
+    if locks is not None:
+        return _create_appointment_cas(appointments, appointment, available_slots, reserved_slots, locks)
+    return _create_appointment(appointments, appointment, available_slots, reserved_slots)
+
+# The booking itself; with `locks`, the caller holds the vet-day lock of the slot
+def _create_appointment(appointments, appointment, available_slots, reserved_slots, locks=None):
+    slot = appointment_slot(appointment)
+    with _shared(locks):
+        free = check_slot(available_slots, slot)
+    if free is True:
+        _book_slot(appointments, appointment, available_slots, reserved_slots, locks)
+        count("bookings", labels={"outcome": "created"})
         logger.info("Successfully created the appointment.")
         return appointments, available_slots, reserved_slots
     else:
+        count("bookings", labels={"outcome": "rejected"})
         logger.warning("The appointment could not be created! The slot is either reserved or unavailable. Please, refresh the page/system and try again.")
         return None, available_slots, reserved_slots
-    
-def get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved_slots):
+
+def _create_appointment_cas(appointments, appointment, available_slots, reserved_slots, locks):
+    slot = appointment_slot(appointment)
+    valid, not_valid = check_slot_error(slot)
+    if not valid:
+        logger.warning("The appointment could not be created! The slot is not valid: %s", not_valid)
+        return None, available_slots, reserved_slots
+    key = vet_day_key(slot)
+    while True:
+        version = locks.version(key)
+        with locks.shared:
+            available = slot in available_slots
+        if version % 2 or locks.version(key) != version:
+            # a booking of the same vet-day is in progress; read again
+            time.sleep(0)
+            continue
+        if not available:
+            count("bookings", labels={"outcome": "rejected"})
+            logger.warning("The appointment could not be created! The slot is either reserved or unavailable. Please, refresh the page/system and try again.")
+            return None, available_slots, reserved_slots
+        booked, _ = locks.compare_and_set(key, version, lambda: _book_slot(appointments, appointment, available_slots, reserved_slots, locks))
+        if booked:
+            count("bookings", labels={"outcome": "created"})
+            logger.info("Successfully created the appointment.")
+            return appointments, available_slots, reserved_slots
+
+# Cancellation that releases the slot: the appointment is removed and its slot is available
+# again. With a waitlist (appointments_logic.waitlist.Waitlist), the freed slot is first offered
+# to the best waiting customer and booked through create_appointment; with `locks`, the
+# cancellation and that booking happen under one hold of the (vet, day) lock, so no other
+# booking sees the slot free in between. Returns the waitlist appointment, None if nobody took
+# the slot (or the appointment was not found).
+@timed("cancel", {"layer": "service"})
+def cancel_appointment(appointments, appointment, available_slots, reserved_slots, waitlist=None, locks=None):
+    if locks is not None:
+        with locks.locked(vet_day_key(appointment_slot(appointment))):
+            return _cancel_appointment(appointments, appointment, available_slots, reserved_slots, waitlist, locks)
+    return _cancel_appointment(appointments, appointment, available_slots, reserved_slots, waitlist)
+
+def _cancel_appointment(appointments, appointment, available_slots, reserved_slots, waitlist=None, locks=None):
+    slot = appointment_slot(appointment)
+    with _shared(locks):
+        if remove_appointment(appointments, appointment) is None:
+            return None
+        if slot in reserved_slots:
+            reserved_slots.remove(slot)
+        add_slot(available_slots, slot)
+    if waitlist is None:
+        return None
+    entry = waitlist.claim(slot, exclude=appointment_customer(appointment))
+    if entry is None:
+        return None
+    replacement = make_appointment(entry.customer, slot)
+    booked, _, _ = _create_appointment(appointments, replacement, available_slots, reserved_slots, locks)
+    if booked is None:
+        waitlist.restore(entry, slot)
+        return None
+    waitlist.fulfil(entry, replacement)
+    return replacement
+
+# Batch booking: the requests are Appointment objects or dictionaries
+# {"customer": ..., "vet": ..., "datetime": "YYYY-MM-DDTHH:MM"} (e.g. the lines of a JSONL file).
+# The lines are yielded as read and parsed per request, so that a malformed line only rejects
+# its own request.
+def read_booking_requests(source):
+    if isinstance(source, (str, Path)):
+        with open(source, "r", encoding="utf-8") as f:
+            yield from read_booking_requests(f)
+        return
+    for line in source:
+        line = line.strip()
+        if line:
+            yield line
+
+def booking_request_appointment(request):
+    if isinstance(request, str):
+        request = json.loads(request)
+    if not isinstance(request, dict):
+        return request
+    date_time = request.get("datetime")
+    if isinstance(date_time, str):
+        date_time = dt.datetime.fromisoformat(date_time)
+    vet = request.get("vet")
+    return make_appointment(request.get("customer"), make_slot(date_time, vet_name(vet) or vet))
+
+# Validates the whole batch against the current state, resolves the conflicts within the batch
+# deterministically (the first request in the stream order wins a slot), then applies all the
+# accepted bookings at once. The state is either the slot lists (with `locks`, a VetDayLocks, when
+# other threads share them; `persist`, e.g. AppointmentStorage.save, is then called once) or a
+# `storage` (storage_logic.AppointmentStorage): the bookings are then one transaction, checked
+# and committed under the vet-day locks of their slots.
+# Returns one result per request: {"index", "appointment", "status": "booked"/"rejected", "reason"}.
+@timed("booking_batch", {"layer": "service"})
+def create_appointments_batch(requests, appointments=None, available_slots=None, reserved_slots=None, persist=None,
+                              locks=None, storage=None):
+    if isinstance(requests, (str, Path)) or hasattr(requests, "read"):
+        requests = read_booking_requests(requests)
+    results = []
+    candidates = []
+    for index, request in enumerate(requests):
+        result = {"index": index, "appointment": None, "status": "rejected", "reason": None}
+        results.append(result)
+        try:
+            appointment = booking_request_appointment(request)
+        except (TypeError, ValueError, AttributeError) as err:
+            result["reason"] = f"invalid request: {err}"
+            continue
+        result["appointment"] = appointment
+        valid, not_valid = check_slot_error(appointment_slot(appointment))
+        if not valid:
+            result["reason"] = f"invalid slot: {not_valid}"
+        elif not isinstance(appointment.customer, str) or not appointment.customer:
+            result["reason"] = "invalid customer"
+        else:
+            candidates.append((result, appointment))
+
+    slots = [appointment_slot(appointment) for _, appointment in candidates]
+    if storage is not None:
+        section = storage.locked_slots(slots)
+    elif locks is not None:
+        section = locks.locked_many([vet_day_key(slot) for slot in slots])
+    else:
+        section = nullcontext()
+    with section, _shared(locks if storage is None else None):
+        if storage is not None:
+            is_free = storage.is_slot_free
+        else:
+            available, reserved = set(available_slots), set(reserved_slots)
+            is_free = lambda slot: slot in available and slot not in reserved
+        taken = set()
+        accepted = []
+        for result, appointment in candidates:
+            slot = appointment_slot(appointment)
+            if slot in taken:
+                result["reason"] = "conflict: the slot was taken by an earlier request of the batch"
+            elif not is_free(slot):
+                result["reason"] = "the slot is either reserved or unavailable"
+            else:
+                taken.add(slot)
+                accepted.append(result)
+        if accepted:
+            _apply_batch([result["appointment"] for result in accepted], taken, appointments, available_slots,
+                         reserved_slots, persist, storage)
+            for result in accepted:
+                result["status"] = "booked"
+    logger.info("Batch booking: %s of %s requests booked.", len(accepted), len(results))
+    return results
+
+# The accepted bookings of a batch, applied to the storage (one transaction) or to the lists
+def _apply_batch(accepted, taken, appointments, available_slots, reserved_slots, persist, storage) -> None:
+    if storage is not None:
+        with storage.transaction() as transaction:
+            for appointment in accepted:
+                transaction.book(appointment)
+        return None
+    appointments.extend(accepted)
+    reserved_slots.extend(appointment_slot(appointment) for appointment in accepted)
+    available_slots[:] = [slot for slot in available_slots if slot not in taken]
+    events.emit("book", *taken)
+    if persist is not None:
+        persist()
+    return None
+
+# With an availability engine (availability_logic.bitset.AvailabilityBitset) the free slots
+# are read from its masks instead of the slot sets
+# With `locks`, the read is validated against the (vet, day) version (no lock taken)
+# With `cache` (availability_logic.cache.AvailabilityCache, which must be used with one state
+# only), the result is read through the cache of the (vet, date)
+# With `horizon` (availability_logic.horizon.AvailabilityHorizon), the dates inside its window
+# are read from the materialized slots; the other options apply to the dates outside it
+@timed("availability", {"layer": "service"})
+def get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved_slots, availability=None, locks=None, cache=None, horizon=None):
+    if horizon is not None:
+        available_slots = horizon.free_slots(vet, date_time.date())
+        if available_slots is not None:
+            return available_slots
+    if cache is not None:
+        key = (vet_name(vet) or vet, date_time.date())
+        return cache.get_or_compute(key, lambda: get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved_slots, availability, locks))
+    if locks is not None:
+        key = (vet_name(vet) or vet, date_time.date())
+
+        # the shared list is copied under its lock, the slots are computed from the copy
+        def read():
+            with locks.shared:
+                reserved = list(reserved_slots)
+            return get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved, availability)
+
+        return locks.optimistic_read(key, read)
+    if availability is not None:
+        available_slots = availability.free_slots(vet, date_time.date())
+        logger.debug("The available slots for the vet '%s' on the date '%s' are:\n%s.", vet, date_time.date(), available_slots)
+        return available_slots
     current_day_slots = make_daily_slots(VET_SCHEDULES, date_time.date())
     check_slots_vet = filter_slots_by_vet(current_day_slots, vet)
     check_slots_date = filter_slots_by_date(current_day_slots, date_time)
     intersect_slots = set(check_slots_vet).intersection(set(check_slots_date))
     available_slots = list(intersect_slots - set(reserved_slots))
-    logger.debug(f"The available slots for the vet '{vet}' on the date '{date_time.date()}' are:\n{available_slots}.")
+    logger.debug("The available slots for the vet '%s' on the date '%s' are:\n%s.", vet, date_time.date(), available_slots)
     return available_slots
 
 # Certain slots are already reserved for emergencies
-def reserved_slot_appointments(customer, date_time, vet, VET_SCHEDULES, reserved_slots, appointments, available_slots):
-    current_schedules = find_vet_schedule(VET_SCHEDULES, VETERINARIANS)
+def reserved_slot_appointments(customer, date_time, vet, VET_SCHEDULES, reserved_slots, appointments, available_slots, locks=None):
+    vet = vet_name(vet) or vet
+    current_schedules = find_vet_schedule(VET_SCHEDULES, vet)
     current_day_slots = make_daily_slots(VET_SCHEDULES, date_time.date())
+    slot = make_slot(date_time, vet)
     if (current_schedules is False) or (current_schedules is None):
         logger.warning("Our veterinarian is not available at the chosen moment.")
         return None
-    elif date_time not in current_day_slots:
+    elif slot not in current_day_slots:
         logger.warning("The chose date and time combination is not available.")
         return None
-    elif (date_time, vet) in reserved_slots:
+    elif slot in reserved_slots:
         logger.warning("The chosen slot is already reserved for emergency appointments. Please, retry to make the appointment or contact our team.")
         return None
     else:
-        check_slots_vet = filter_slots_by_vet(current_day_slots, vet)
-        check_slots_date = filter_slots_by_date(current_day_slots, date_time)
-        intersect_slots = set(check_slots_vet).intersection(set(check_slots_date))
-        if len(intersect_slots) == 0:
-            logger.warning("The chosen slot is not available. Please, retry to make the appointment or contact our team.")
-            return None
-        else:
-            slot = make_slot(date_time, vet)
-            appointment = make_appointment(customer, slot)
-            logger.debug(f"Creating emergency reservation for the slot: {slot}.")   
-            return create_appointment(appointments, appointment, available_slots, reserved_slots)
+        appointment = make_appointment(customer, slot)
+        logger.debug("Creating emergency reservation for the slot: %s.", slot)   
+        return create_appointment(appointments, appointment, available_slots, reserved_slots, locks=locks)
@@ -0,0 +1,241 @@
+# Waitlist: the customers waiting for a slot to free up, with their constraints (vets, date
+# range, weekdays). An entry is pushed on the heap of every (vet, day) it accepts, ordered by
+# (priority, registration order); a freed slot is offered to the top of the heap of its
+# (vet, day), in O(log N). The entries booked or withdrawn meanwhile stay in the other heaps and
+# are dropped when they reach the top (lazy deletion).
+import datetime as dt
+import heapq
+import itertools
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from constants import VET_SCHEDULES, WEEKDAYS
+from slot_times import Slot, vet_name
+from appointments_logic.locking import VetDayKey, vet_day_key
+from metrics import count
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Longest date range of one entry (days): an entry is pushed on at most vets * days heaps
+WAITLIST_MAX_DAYS = 92
+
+# The states of an entry; "claimed" while the booking of an offered slot is in progress
+WAITING, CLAIMED, BOOKED, WITHDRAWN, EXPIRED = "waiting", "claimed", "booked", "withdrawn", "expired"
+
+
+class WaitlistEntry:
+    __slots__ = ("id", "customer", "vets", "start", "end", "weekdays", "priority", "status", "appointment")
+
+    def __init__(self, entry_id: int, customer: str, vets: Tuple[str, ...], start: dt.date, end: dt.date,
+                 weekdays: Tuple[str, ...], priority: int):
+        self.id = entry_id
+        self.customer = customer
+        self.vets = vets
+        self.start = start
+        self.end = end
+        self.weekdays = weekdays
+        self.priority = priority
+        self.status = WAITING
+        # the appointment booked for the entry, once fulfilled
+        self.appointment = None
+
+    # The heap order: lower priority first, then first registered first
+    @property
+    def rank(self) -> Tuple[int, int]:
+        return (self.priority, self.id)
+
+    def accepts(self, slot: Slot) -> bool:
+        date = slot.datetime.date()
+        return slot.vet in self.vets and self.start <= date <= self.end and WEEKDAYS[date.weekday()] in self.weekdays
+
+    def days(self) -> Iterable[dt.date]:
+        for offset in range((self.end - self.start).days + 1):
+            date = self.start + dt.timedelta(days=offset)
+            if WEEKDAYS[date.weekday()] in self.weekdays:
+                yield date
+
+    def __repr__(self) -> str:
+        return (f"WaitlistEntry(id={self.id}, customer={self.customer!r}, vets={self.vets!r}, start={self.start}, "
+                f"end={self.end}, weekdays={self.weekdays!r}, priority={self.priority}, status={self.status!r})")
+
+
+# The heaps are keyed by (vet, day) whatever the vet schedules say, so a schedule change needs
+# no re-indexing (a day the vet does not work simply never frees a slot). The past days are
+# dropped, and the entries whose range is over expire, on the first registration of each day.
+class Waitlist:
+    def __init__(self, today: Callable[[], dt.date] = dt.date.today):
+        self.today = today
+        self._lock = threading.Lock()
+        self._heaps: Dict[VetDayKey, List[Tuple[int, int, WaitlistEntry]]] = {}
+        self._entries: Dict[int, WaitlistEntry] = {}
+        self._sequence = itertools.count(1)
+        self._expired_before: Optional[dt.date] = None
+        self.waiting = 0
+        self.booked = 0
+        # heap items of booked/withdrawn/expired entries discarded on the way to the top
+        self.dropped = 0
+
+    # Adds a customer to the waitlist: the vets (letters or names, all by default), the dates
+    # start <= date <= end (end defaults to start) and the weekdays (all by default) they accept;
+    # the lower the priority, the earlier they are served. Returns None if the constraints are
+    # not valid. The slots already free are not looked at: the entry waits for a cancellation.
+    def register(self, customer: str, start: dt.date, end: dt.date = None, vets: Iterable[str] = None,
+                 weekdays: Iterable[str] = None, priority: int = 0) -> Optional[WaitlistEntry]:
+        if not isinstance(customer, str) or not customer:
+            logger.warning("A waitlist entry needs a customer name.")
+            return None
+        if isinstance(start, dt.datetime):
+            start = start.date()
+        if isinstance(end, dt.datetime):
+            end = end.date()
+        end = start if end is None else end
+        if not isinstance(start, dt.date) or not isinstance(end, dt.date) or end < start:
+            logger.warning("The waitlist date range %s - %s is not valid.", start, end)
+            return None
+        if (end - start).days >= WAITLIST_MAX_DAYS:
+            logger.warning("The waitlist date range %s - %s is longer than %s days.", start, end, WAITLIST_MAX_DAYS)
+            return None
+        names = tuple(dict.fromkeys(vet_name(vet) for vet in vets)) if vets is not None else tuple(VET_SCHEDULES)
+        if not names or None in names:
+            logger.warning("The waitlist vets %s are not valid. Please, choose valid vets from the list.", vets)
+            return None
+        weekdays = tuple(weekdays) if weekdays is not None else tuple(WEEKDAYS)
+        if not weekdays or any(weekday not in WEEKDAYS for weekday in weekdays):
+            logger.warning("The waitlist weekdays %s are not valid.", weekdays)
+            return None
+        self.expire()
+        today = self.today()
+        if end < today:
+            logger.warning("The waitlist date range %s - %s is in the past.", start, end)
+            return None
+        with self._lock:
+            entry = WaitlistEntry(next(self._sequence), customer, names, max(start, today), end, weekdays, priority)
+            days = list(entry.days())
+            if not days:
+                logger.warning("The waitlist entry for %s accepts no day.", customer)
+                return None
+            item = (entry.priority, entry.id, entry)
+            for vet in names:
+                for date in days:
+                    heapq.heappush(self._heaps.setdefault((vet, date), []), item)
+            self._entries[entry.id] = entry
+            self.waiting += 1
+        count("waitlist", labels={"event": "registered"})
+        logger.info("The customer %s was added to the waitlist (entry %s).", customer, entry.id)
+        return entry
+
+    def withdraw(self, entry_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.status != WAITING:
+                logger.warning("The waitlist entry %s is not waiting. Can't withdraw it.", entry_id)
+                return False
+            entry.status = WITHDRAWN
+            self.waiting -= 1
+        count("waitlist", labels={"event": "withdrawn"})
+        logger.info("The waitlist entry %s was withdrawn.", entry_id)
+        return True
+
+    # Pops the heap items of the entries that stopped waiting; the caller holds the lock
+    def _prune(self, key: VetDayKey) -> Optional[List[Tuple[int, int, WaitlistEntry]]]:
+        heap = self._heaps.get(key)
+        while heap and heap[0][2].status != WAITING:
+            heapq.heappop(heap)
+            self.dropped += 1
+        if heap is not None and not heap:
+            del self._heaps[key]
+            return None
+        return heap
+
+    # The entry the slot would be offered to, left in place
+    def peek(self, slot: Slot) -> Optional[WaitlistEntry]:
+        with self._lock:
+            heap = self._prune(vet_day_key(slot))
+            return heap[0][2] if heap else None
+
+    # Takes the best waiting entry for the freed slot (skipping the customer who freed it, if
+    # given); the entry is "claimed" until the caller books it (fulfil) or gives it back (restore)
+    def claim(self, slot: Slot, exclude: str = None) -> Optional[WaitlistEntry]:
+        key = vet_day_key(slot)
+        skipped = []
+        entry = None
+        with self._lock:
+            heap = self._prune(key)
+            while heap:
+                item = heapq.heappop(heap)
+                if item[2].status != WAITING:
+                    self.dropped += 1
+                elif item[2].customer == exclude:
+                    skipped.append(item)
+                else:
+                    entry = item[2]
+                    break
+            for item in skipped:
+                heapq.heappush(self._heaps.setdefault(key, []), item)
+            if key in self._heaps and not self._heaps[key]:
+                del self._heaps[key]
+            if entry is None:
+                return None
+            entry.status = CLAIMED
+            self.waiting -= 1
+        count("waitlist", labels={"event": "claimed"})
+        return entry
+
+    def fulfil(self, entry: WaitlistEntry, appointment) -> None:
+        with self._lock:
+            entry.status = BOOKED
+            entry.appointment = appointment
+            self.booked += 1
+        count("waitlist", labels={"event": "booked"})
+        logger.info("The waitlist entry %s was booked: %s.", entry.id, appointment)
+        return None
+
+    # The booking of a claimed entry failed: it waits again, back in the heap of the slot's day
+    # (the items in its other heaps were never removed)
+    def restore(self, entry: WaitlistEntry, slot: Slot) -> None:
+        with self._lock:
+            if entry.status != CLAIMED:
+                return None
+            entry.status = WAITING
+            self.waiting += 1
+            heapq.heappush(self._heaps.setdefault(vet_day_key(slot), []), (entry.priority, entry.id, entry))
+        count("waitlist", labels={"event": "restored"})
+        return None
+
+    # Drops the heaps of the past days and expires the entries whose range is over; runs once a
+    # day (on the first registration), or when called. Returns the number of expired entries.
+    def expire(self, today: dt.date = None) -> int:
+        today = today or self.today()
+        if self._expired_before == today:
+            return 0
+        with self._lock:
+            self._expired_before = today
+            for key in [key for key in self._heaps if key[1] < today]:
+                del self._heaps[key]
+            expired = [entry for entry in self._entries.values() if entry.status == WAITING and entry.end < today]
+            for entry in expired:
+                entry.status = EXPIRED
+            self.waiting -= len(expired)
+            # the entries that are done are only kept while they can still be looked up in a heap
+            self._entries = {entry_id: entry for entry_id, entry in self._entries.items()
+                             if entry.status in (WAITING, CLAIMED) or entry.end >= today}
+        if expired:
+            logger.info("%s waitlist entries expired before %s.", len(expired), today)
+        return len(expired)
+
+    def get(self, entry_id: int) -> Optional[WaitlistEntry]:
+        return self._entries.get(entry_id)
+
+    def entries(self, customer: str = None) -> List[WaitlistEntry]:
+        with self._lock:
+            return [entry for entry in self._entries.values() if customer is None or entry.customer == customer]
+
+    def __len__(self) -> int:
+        return self.waiting
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"waiting": self.waiting, "booked": self.booked, "entries": len(self._entries), "heaps": len(self._heaps),
+                    "heap_items": sum(len(heap) for heap in self._heaps.values()), "dropped": self.dropped}
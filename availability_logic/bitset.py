@@ -0,0 +1,162 @@
+# Bitset availability engine: every (vet, day) is an integer bitmask over the slots of the day
+import datetime as dt
+import logging
+from threading import RLock
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from constants import VET_SCHEDULES, WEEKDAYS
+from slot_times import SLOT_DURATION, Slot, vet_name, weekday_templates
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Bit i of a day mask is the slot starting at i * SLOT_MINUTES after midnight
+SLOT_MINUTES = int(SLOT_DURATION.total_seconds() // 60)
+SLOTS_PER_DAY = (24 * 60) // SLOT_MINUTES
+
+MaskKey = Tuple[str, dt.date]
+
+# Conversions between slots and (vet, day) masks
+def slot_bit(slot_datetime: dt.datetime) -> int:
+    return 1 << ((slot_datetime.hour * 60 + slot_datetime.minute) // SLOT_MINUTES)
+
+def slots_to_masks(slots: Iterable[Slot]) -> Dict[MaskKey, int]:
+    masks: Dict[MaskKey, int] = {}
+    for slot in slots:
+        key = (slot.vet, slot.datetime.date())
+        masks[key] = masks.get(key, 0) | slot_bit(slot.datetime)
+    return masks
+
+def mask_to_datetimes(mask: int, date: dt.date) -> List[dt.datetime]:
+    midnight = dt.datetime.combine(date, dt.time())
+    datetimes = []
+    while mask:
+        lowest = mask & -mask
+        datetimes.append(midnight + dt.timedelta(minutes=(lowest.bit_length() - 1) * SLOT_MINUTES))
+        mask ^= lowest
+    return datetimes
+
+def masks_to_slots(masks: Dict[MaskKey, int]) -> Set[Slot]:
+    return {Slot(datetime, vet) for (vet, date), mask in masks.items() for datetime in mask_to_datetimes(mask, date)}
+
+# The slot set algebra of slot_times, on masks (keys missing from a mapping are empty days)
+def masks_union(*mask_sets: Dict[MaskKey, int]) -> Dict[MaskKey, int]:
+    result: Dict[MaskKey, int] = {}
+    for masks in mask_sets:
+        for key, mask in masks.items():
+            result[key] = result.get(key, 0) | mask
+    return {key: mask for key, mask in result.items() if mask}
+
+def masks_intersection(*mask_sets: Dict[MaskKey, int]) -> Dict[MaskKey, int]:
+    if not mask_sets:
+        return {}
+    result = dict(mask_sets[0])
+    for masks in mask_sets[1:]:
+        result = {key: mask & masks.get(key, 0) for key, mask in result.items()}
+    return {key: mask for key, mask in result.items() if mask}
+
+def masks_difference(first: Dict[MaskKey, int], *others: Dict[MaskKey, int]) -> Dict[MaskKey, int]:
+    result = dict(first)
+    for masks in others:
+        for key, mask in masks.items():
+            if key in result:
+                result[key] &= ~mask
+    return {key: mask for key, mask in result.items() if mask}
+
+
+# The engine: the scheduled masks come from the weekday templates, the taken (booked or
+# reserved) masks are kept per (vet, day); free = scheduled & ~taken
+class AvailabilityBitset:
+    def __init__(self, taken_slots: Iterable[Slot] = ()):
+        self._lock = RLock()
+        self._taken: Dict[MaskKey, int] = {}
+        self.vets: List[str] = list(VET_SCHEDULES)
+        self.refresh_schedule()
+        self.take_many(taken_slots)
+
+    # Rebuild the scheduled masks (after a change of the schedule constants)
+    def refresh_schedule(self) -> None:
+        schedule: Dict[str, Dict[str, int]] = {}
+        for weekday, vets in weekday_templates().items():
+            schedule[weekday] = {}
+            for vet, offsets in vets.items():
+                mask = 0
+                for offset in offsets:
+                    mask |= 1 << (offset // SLOT_MINUTES)
+                schedule[weekday][vet] = mask
+        with self._lock:
+            self._schedule = schedule
+            self.vets = list(VET_SCHEDULES)
+        return None
+
+    def scheduled_mask(self, vet: str, date: dt.date) -> int:
+        return self._schedule.get(WEEKDAYS[date.weekday()], {}).get(vet, 0)
+
+    def free_mask(self, vet: str, date: dt.date) -> int:
+        return self.scheduled_mask(vet, date) & ~self._taken.get((vet, date), 0)
+
+    # Booking/reservation and cancellation of single slots
+    def take(self, slot: Slot) -> bool:
+        key, bit = (slot.vet, slot.datetime.date()), slot_bit(slot.datetime)
+        with self._lock:
+            taken = self._taken.get(key, 0)
+            if taken & bit:
+                return False
+            self._taken[key] = taken | bit
+        return True
+
+    def take_many(self, slots: Iterable[Slot]) -> None:
+        with self._lock:
+            for key, mask in slots_to_masks(slots).items():
+                self._taken[key] = self._taken.get(key, 0) | mask
+        return None
+
+    def release(self, slot: Slot) -> bool:
+        key, bit = (slot.vet, slot.datetime.date()), slot_bit(slot.datetime)
+        with self._lock:
+            taken = self._taken.get(key, 0)
+            if not taken & bit:
+                return False
+            taken &= ~bit
+            if taken:
+                self._taken[key] = taken
+            else:
+                del self._taken[key]
+        return True
+
+    def is_free(self, slot: Slot) -> bool:
+        return bool(self.free_mask(slot.vet, slot.datetime.date()) & slot_bit(slot.datetime))
+
+    # "Free slots for vet X on date D"
+    def free_slots(self, vet: str, date: dt.date) -> List[Slot]:
+        if isinstance(date, dt.datetime):
+            date = date.date()
+        vet = vet_name(vet) or vet
+        return [Slot(datetime, vet) for datetime in mask_to_datetimes(self.free_mask(vet, date), date)]
+
+    # "Any vet free at T"
+    def free_vets_at(self, slot_datetime: dt.datetime) -> List[str]:
+        date, bit = slot_datetime.date(), slot_bit(slot_datetime)
+        return [vet for vet in self.vets if self.free_mask(vet, date) & bit]
+
+    # The free slots from `start` onward, in time order (vets in VET_SCHEDULES order within a slot)
+    def iter_free_slots(self, start: dt.datetime, vets: Optional[Iterable[str]] = None, horizon_days: int = 365) -> Iterator[Slot]:
+        vets = self.vets if vets is None else [vet_name(vet) or vet for vet in vets]
+        first_bit = -(-(start.hour * 60 + start.minute) // SLOT_MINUTES)
+        for day in range(horizon_days):
+            date = start.date() + dt.timedelta(days=day)
+            # bits before `start` are cut off on the first day
+            cutoff = ~((1 << first_bit) - 1) if day == 0 else -1
+            day_masks = [(vet, self.free_mask(vet, date) & cutoff) for vet in vets]
+            combined = 0
+            for _, mask in day_masks:
+                combined |= mask
+            for datetime in mask_to_datetimes(combined, date):
+                bit = slot_bit(datetime)
+                for vet, mask in day_masks:
+                    if mask & bit:
+                        yield Slot(datetime, vet)
+
+    # "First free slot after T"
+    def first_free_slot(self, start: dt.datetime, vets: Optional[Iterable[str]] = None, horizon_days: int = 365) -> Optional[Slot]:
+        return next(self.iter_free_slots(start, vets, horizon_days), None)
@@ -0,0 +1,108 @@
+# Read-through cache of the free slots per (vet, date), invalidated by the slot change events
+import datetime as dt
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from appointments_logic import events
+from metrics import count
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_CACHE_SIZE = 4096
+
+CacheKey = Tuple[str, dt.date]
+
+
+# Bounded LRU. A fill only lands if no invalidation of its key happened while the value was
+# computed (per-key generations), so a reader that raced with a booking never stores the
+# availability from before the booking.
+class AvailabilityCache:
+    def __init__(self, max_entries: int = AVAILABILITY_CACHE_SIZE, subscribe: bool = True):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._epoch = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.dropped_fills = 0
+        if subscribe:
+            events.subscribe(self.on_event)
+
+    def _generation(self, key: CacheKey) -> Tuple[int, int]:
+        return (self._epoch, self._generations.get(key, 0))
+
+    # The cached free slots of the key, or compute(), stored if still valid; a fresh list is
+    # returned every time, the cached value itself cannot be changed by the callers
+    def get_or_compute(self, key: CacheKey, compute: Callable[[], List]) -> List:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                count("availability_cache", labels={"result": "hit"})
+                return list(value)
+            self.misses += 1
+            generation = self._generation(key)
+        count("availability_cache", labels={"result": "miss"})
+        result = compute()
+        if result is None:
+            return result
+        with self._lock:
+            if self._generation(key) != generation:
+                self.dropped_fills += 1
+                return list(result)
+            self._entries[key] = tuple(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return list(result)
+
+    def invalidate(self, vet: str, date: dt.date) -> None:
+        key = (vet, date)
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+            # the generations of the keys are forgotten at once (a new epoch) when they pile up;
+            # the fills in progress are dropped then, the cached entries are kept
+            if len(self._generations) > 8 * self.max_entries:
+                self._epoch += 1
+                self._generations.clear()
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+        return None
+
+    # Slot change events (appointments_logic.events)
+    def on_event(self, kind: str, slots: Tuple) -> None:
+        if kind in ("schedule", "archive"):
+            return self.clear()
+        for slot in slots:
+            self.invalidate(slot.vet, slot.datetime.date())
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations,
+                    "dropped_fills": self.dropped_fills, "size": len(self._entries), "max_entries": self.max_entries}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        events.unsubscribe(self.on_event)
+        return None
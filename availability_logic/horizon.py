@@ -0,0 +1,212 @@
+# Rolling availability horizon: the free slots of every (vet, day) of the next window_days,
+# materialized ahead of the queries from the weekday templates minus the taken (booked or
+# reserved) slots. The slot events mark the touched (vet, day)s dirty; a background worker
+# recomputes them and moves the window forward every day, so that the queries inside the
+# window are reads of the precomputed slots.
+import datetime as dt
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from slot_times import Slot, make_daily_slots, vet_name
+from appointments_logic import events
+from metrics import count, timed
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Default window (12 weeks) and the longest sleep of the worker between two maintenance rounds
+HORIZON_DAYS = 84
+HORIZON_POLL_SECONDS = 60.0
+
+DayKey = Tuple[str, dt.date]
+
+
+# The source of the taken slots is the storage (AppointmentStorage.taken_slots and
+# taken_slots_between). The events only say which (vet, day)s changed, not how (a rolled back
+# booking announces its slot again), so a dirty day is recomputed from the source: by the
+# worker, or by the first query that reaches it. A recomputation that raced with another event
+# of its day is not kept (per-day generations, as in availability_logic.cache).
+class AvailabilityHorizon:
+    def __init__(self, source, window_days: int = HORIZON_DAYS, today: Callable[[], dt.date] = dt.date.today,
+                 subscribe: bool = True):
+        self.source = source
+        self.window_days = window_days
+        self.today = today
+        self._lock = threading.Lock()
+        self._days: Dict[DayKey, Tuple[Slot, ...]] = {}
+        self._dirty: Set[DayKey] = set()
+        self._generations: Dict[DayKey, int] = {}
+        self._epoch = 0
+        # a full rebuild is pending (schedule change); the queries fall back meanwhile
+        self._stale = True
+        self.start: Optional[dt.date] = None
+        self.end: Optional[dt.date] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.reads = 0
+        self.recomputes = 0
+        self.fallbacks = 0
+        if subscribe:
+            events.subscribe(self.on_event)
+        self.rebuild()
+
+    # The free slots of every (vet, day) with start <= date < end
+    def _materialize(self, start: dt.date, end: dt.date) -> Dict[DayKey, Tuple[Slot, ...]]:
+        taken: Dict[DayKey, Set[Slot]] = {}
+        for slot in self.source.taken_slots_between(start, end):
+            taken.setdefault((slot.vet, slot.datetime.date()), set()).add(slot)
+        days: Dict[DayKey, List[Slot]] = {}
+        for offset in range((end - start).days):
+            date = start + dt.timedelta(days=offset)
+            for slot in make_daily_slots(None, date):
+                if slot not in taken.get((slot.vet, date), ()):
+                    days.setdefault((slot.vet, date), []).append(slot)
+        return {key: tuple(sorted(slots)) for key, slots in days.items()}
+
+    def _compute(self, key: DayKey) -> Tuple[Slot, ...]:
+        vet, date = key
+        taken = set(self.source.taken_slots(vet, date))
+        return tuple(sorted(slot for slot in make_daily_slots(None, date) if slot.vet == vet and slot not in taken))
+
+    @timed("horizon_rebuild")
+    def rebuild(self, today: Optional[dt.date] = None) -> None:
+        today = today or self.today()
+        with self._lock:
+            self._epoch += 1
+            epoch = self._epoch
+            self._generations.clear()
+            self._dirty.clear()
+        days = self._materialize(today, today + dt.timedelta(days=self.window_days))
+        with self._lock:
+            # a schedule change during the rebuild makes it stale already
+            if self._epoch != epoch:
+                return None
+            self._days = days
+            self.start, self.end = today, today + dt.timedelta(days=self.window_days)
+            self._stale = False
+        logger.info("The availability horizon was rebuilt for %s to %s.", self.start, self.end)
+        return None
+
+    # Drop the past days and materialize the new ones at the end of the window
+    @timed("horizon_advance")
+    def advance(self, today: Optional[dt.date] = None) -> None:
+        today = today or self.today()
+        with self._lock:
+            epoch, start, end = self._epoch, self.start, self.end
+        if self._stale or start is None or today < start or today >= end:
+            return self.rebuild(today)
+        new_end = today + dt.timedelta(days=self.window_days)
+        added = self._materialize(end, new_end) if new_end > end else {}
+        with self._lock:
+            if self._epoch != epoch:
+                return None
+            self._days = {key: slots for key, slots in self._days.items() if key[1] >= today}
+            self._days.update(added)
+            self._generations = {key: generation for key, generation in self._generations.items() if key[1] >= today}
+            self._dirty = {key for key in self._dirty if key[1] >= today}
+            self.start, self.end = today, max(new_end, end)
+        logger.info("The availability horizon was advanced to %s - %s.", self.start, self.end)
+        return None
+
+    # Recompute one day from the source; the result is only kept if no event of the day arrived
+    # meanwhile (it is still returned, it reflects the state at the start of the call)
+    def _refresh(self, key: DayKey) -> Tuple[Slot, ...]:
+        with self._lock:
+            generation = (self._epoch, self._generations.get(key, 0))
+        slots = self._compute(key)
+        with self._lock:
+            self.recomputes += 1
+            if (self._epoch, self._generations.get(key, 0)) == generation:
+                self._dirty.discard(key)
+                if self.start is not None and self.start <= key[1] < self.end:
+                    self._days[key] = slots
+        return slots
+
+    # "Free slots for vet X on date D"; None outside the window (or while a rebuild is pending),
+    # for the caller to compute them itself
+    def free_slots(self, vet: str, date: dt.date) -> Optional[List[Slot]]:
+        if isinstance(date, dt.datetime):
+            date = date.date()
+        key = (vet_name(vet) or vet, date)
+        with self._lock:
+            if self._stale or self.start is None or not self.start <= date < self.end:
+                self.fallbacks += 1
+                count("availability_horizon", labels={"result": "fallback"})
+                return None
+            self.reads += 1
+            if key not in self._dirty:
+                count("availability_horizon", labels={"result": "hit"})
+                return list(self._days.get(key, ()))
+        count("availability_horizon", labels={"result": "recompute"})
+        return list(self._refresh(key))
+
+    def __contains__(self, date: dt.date) -> bool:
+        return not self._stale and self.start is not None and self.start <= date < self.end
+
+    # Slot change events (appointments_logic.events); the archived days are past the window
+    def on_event(self, kind: str, slots: Tuple) -> None:
+        if kind == "schedule":
+            with self._lock:
+                self._stale = True
+                self._epoch += 1
+        elif kind != "archive":
+            with self._lock:
+                for slot in slots:
+                    key = (slot.vet, slot.datetime.date())
+                    self._generations[key] = self._generations.get(key, 0) + 1
+                    self._dirty.add(key)
+        self._wake.set()
+        return None
+
+    # One round of the worker: rebuild after a schedule change, move the window on a new day,
+    # recompute the dirty days
+    def maintain(self) -> None:
+        today = self.today()
+        if self._stale:
+            self.rebuild(today)
+        elif today != self.start:
+            self.advance(today)
+        with self._lock:
+            if self.start is None:
+                return None
+            dirty = [key for key in self._dirty if self.start <= key[1] < self.end]
+            # the days outside the window are materialized from the source when they enter it
+            self._dirty.intersection_update(dirty)
+        for key in dirty:
+            self._refresh(key)
+        return None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(HORIZON_POLL_SECONDS)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.maintain()
+            except Exception as err:
+                logger.error("The availability horizon maintenance failed: %s", err)
+        return None
+
+    def start_worker(self) -> "AvailabilityHorizon":
+        if self._worker is None:
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name="availability-horizon", daemon=True)
+            self._worker.start()
+        return self
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"start": self.start, "end": self.end, "days": len(self._days), "dirty": len(self._dirty),
+                    "reads": self.reads, "recomputes": self.recomputes, "fallbacks": self.fallbacks}
+
+    def close(self) -> None:
+        events.unsubscribe(self.on_event)
+        self._stopping.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        return None
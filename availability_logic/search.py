@@ -0,0 +1,85 @@
+# "Next N free slots" search across vets and days, lazily and in time order
+import bisect
+import datetime as dt
+import heapq
+import logging
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from constants import VET_SCHEDULES, WEEKDAYS
+from slot_times import Slot, vet_name, weekday_templates
+from availability_logic.bitset import mask_to_datetimes
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# How far the search looks ahead by default (days)
+SEARCH_HORIZON_DAYS = 365
+
+# The free datetimes of a vet on a day, sorted
+DayFreeSlots = Callable[[str, dt.date], List[dt.datetime]]
+
+# The weekdays are given as a list of names ("Monday") or numbers (0 = Monday, ..., 6 = Sunday);
+# anything else raises a ValueError (a single name is not a list of weekdays)
+def _weekday_names(weekdays: Optional[Iterable]) -> Optional[set]:
+    if weekdays is None:
+        return None
+    if isinstance(weekdays, (str, bytes)) or not hasattr(weekdays, "__iter__"):
+        raise ValueError(f"The weekdays must be a list of names or numbers, not {weekdays!r}.")
+    names = set()
+    for day in weekdays:
+        if isinstance(day, int) and not isinstance(day, bool) and 0 <= day < len(WEEKDAYS):
+            names.add(WEEKDAYS[day])
+        elif isinstance(day, str) and day in WEEKDAYS:
+            names.add(day)
+        else:
+            raise ValueError(f"Unknown weekday {day!r}: use a name ({', '.join(WEEKDAYS)}) or a number from 0 to {len(WEEKDAYS) - 1}.")
+    return names
+
+# Day lookups: from the bitset masks (a fully booked day costs one AND), or from the weekday
+# templates minus a set of taken slots
+def _bitset_day_free_slots(availability) -> DayFreeSlots:
+    return lambda vet, date: mask_to_datetimes(availability.free_mask(vet, date), date)
+
+def _set_day_free_slots(taken_slots: Iterable[Slot]) -> DayFreeSlots:
+    taken = set(taken_slots)
+    templates = weekday_templates()
+    def day_free_slots(vet: str, date: dt.date) -> List[dt.datetime]:
+        midnight = dt.datetime.combine(date, dt.time())
+        datetimes = [midnight + dt.timedelta(minutes=offset) for offset in templates.get(WEEKDAYS[date.weekday()], {}).get(vet, ())]
+        return [datetime for datetime in datetimes if Slot(datetime, vet) not in taken] if taken else datetimes
+    return day_free_slots
+
+# The free slots of one vet in [start, end), in time order: the days the vet does not work (or
+# that are filtered out) are skipped on the weekday templates, the first day is entered with bisect
+def iter_vet_free_slots(vet: str, start: dt.datetime, end: dt.datetime, day_free_slots: DayFreeSlots,
+                        weekdays: Optional[set] = None) -> Iterator[Slot]:
+    templates = weekday_templates()
+    date = start.date()
+    while dt.datetime.combine(date, dt.time()) < end:
+        weekday = WEEKDAYS[date.weekday()]
+        if vet in templates.get(weekday, {}) and (weekdays is None or weekday in weekdays):
+            datetimes = day_free_slots(vet, date)
+            begin = bisect.bisect_left(datetimes, start) if date == start.date() else 0
+            for datetime in datetimes[begin:]:
+                if datetime >= end:
+                    return
+                yield Slot(datetime, vet)
+        date += dt.timedelta(days=1)
+
+# The first `count` free slots from `start` onward (all of them within the horizon if count is
+# None), optionally restricted to some vets and weekdays. The per-vet streams are merged with a
+# heap, so the slots are produced lazily in time order (ties in the Slot order: by vet id).
+# The taken slots come from an AvailabilityBitset (`availability`) or from `taken_slots`.
+def next_free_slots(start: dt.datetime, count: Optional[int] = None, vets: Optional[Iterable[str]] = None,
+                    weekdays: Optional[Iterable] = None, horizon_days: int = SEARCH_HORIZON_DAYS,
+                    taken_slots: Iterable[Slot] = (), availability=None) -> Iterator[Slot]:
+    day_free_slots = _bitset_day_free_slots(availability) if availability is not None else _set_day_free_slots(taken_slots)
+    vets = list(VET_SCHEDULES) if vets is None else [vet_name(vet) or vet for vet in vets]
+    end = dt.datetime.combine(start.date() + dt.timedelta(days=horizon_days), dt.time())
+    weekday_names = _weekday_names(weekdays)
+    merged = heapq.merge(*(iter_vet_free_slots(vet, start, end, day_free_slots, weekday_names) for vet in vets))
+    return merged if count is None else islice(merged, count)
+
+def first_free_slots(start: dt.datetime, count: int = 5, **options) -> List[Slot]:
+    return list(next_free_slots(start, count, **options))
@@ -0,0 +1,92 @@
+# Benchmark and consistency check of the columnar analytics (analytics_logic): export of a
+# clinic's history to NumPy columns (from the Appointment objects and from a binary snapshot),
+# the utilization reports, and the daily utilization and heatmap against the object loop with
+# make_daily_slots for every date
+# Run with: python -m benchmarks.bench_analytics [profile]   (needs NumPy)
+import datetime as dt
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from slot_times import make_daily_slots
+from persistence_logic.binary_snapshot import BinarySnapshot, write_snapshot
+from analytics_logic.columns import AppointmentColumns, ScheduleColumns
+from analytics_logic import reports
+from benchmarks.clinic import PROFILES, generate_clinic, installed_clinic
+
+def measure(function):
+    begin = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - begin
+
+# The object loop: one pass over the appointments, and make_daily_slots for every date
+def loop_daily_utilization(appointments, start: dt.date, end: dt.date):
+    booked = Counter((appointment.slot.datetime.date(), appointment.slot.vet) for appointment in appointments
+                     if start <= appointment.slot.datetime.date() < end)
+    capacity = Counter()
+    for offset in range((end - start).days):
+        date = start + dt.timedelta(days=offset)
+        capacity.update((date, slot.vet) for slot in make_daily_slots(None, date))
+    return {key: (booked[key], capacity[key]) for key in booked.keys() | capacity.keys()}
+
+def loop_heatmap(appointments, start: dt.date, end: dt.date):
+    booked, capacity = Counter(), Counter()
+    booked.update((appointment.slot.datetime.weekday(), appointment.slot.datetime.hour) for appointment in appointments
+                  if start <= appointment.slot.datetime.date() < end)
+    for offset in range((end - start).days):
+        date = start + dt.timedelta(days=offset)
+        capacity.update((date.weekday(), slot.datetime.hour) for slot in make_daily_slots(None, date))
+    return booked, capacity
+
+def main(profile: str = "large") -> None:
+    logging.disable(logging.WARNING)
+    clinic = generate_clinic(PROFILES[profile])
+    start, end = clinic.dates[0], clinic.dates[-1] + dt.timedelta(days=1)
+    with installed_clinic(clinic), tempfile.TemporaryDirectory() as directory:
+        print(f"{profile} clinic: {len(clinic.appointments)} appointments, {len(clinic.vet_schedules)} vets, {(end - start).days} days")
+        columns, from_objects = measure(lambda: AppointmentColumns.from_appointments(clinic.appointments))
+        write_snapshot(Path(directory) / "snapshot.bin", clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+        snapshot = BinarySnapshot(Path(directory) / "snapshot.bin")
+        mapped, from_snapshot = measure(lambda: AppointmentColumns.from_snapshot(snapshot))
+        schedule, from_templates = measure(lambda: ScheduleColumns.from_templates(start, end))
+        print(f"  export: objects {from_objects * 1000:.0f} ms | binary snapshot {from_snapshot * 1000:.0f} ms | "
+              f"schedule ({len(schedule)} slots) {from_templates * 1000:.0f} ms")
+
+        timings = {}
+        for name, report in (("daily", lambda: reports.daily_utilization(columns, schedule)),
+                             ("weekly", lambda: reports.weekly_utilization(columns, schedule)),
+                             ("heatmap", lambda: reports.utilization_heatmap(columns, schedule)),
+                             ("busiest", lambda: reports.busiest_slots(columns, schedule)),
+                             ("forecast", lambda: reports.capacity_forecast(columns, clinic.dates[-28]))):
+            timings[name] = measure(report)
+        print("  reports: " + " | ".join(f"{name} {elapsed * 1000:.1f} ms" for name, (_, elapsed) in timings.items()))
+        total = from_objects + from_templates + sum(elapsed for _, elapsed in timings.values())
+        print(f"  export + every report: {total * 1000:.0f} ms")
+
+        expected, loop = measure(lambda: loop_daily_utilization(clinic.appointments, start, end))
+        daily = timings["daily"][0]
+        got = {(date, vet): (booked, capacity) for date, vet, booked, capacity in
+               zip(daily["date"].tolist(), daily["vet"].tolist(), daily["booked"].tolist(), daily["capacity"].tolist())}
+        print(f"  daily utilization by the object loop: {loop * 1000:.0f} ms ({loop / timings['daily'][1]:.0f}x the vectorized report)")
+        assert got == expected, "the daily utilization differs from the object loop"
+        assert reports.daily_utilization(mapped, schedule)["booked"].tolist() == daily["booked"].tolist(), "the snapshot export differs"
+        booked, capacity = loop_heatmap(clinic.appointments, start, end)
+        heatmap = timings["heatmap"][0]
+        assert heatmap["booked"].reshape(7, 24).tolist() == [[booked[(day, hour)] for hour in range(24)] for day in range(7)]
+        assert heatmap["capacity"].reshape(7, 24).tolist() == [[capacity[(day, hour)] for hour in range(24)] for day in range(7)]
+        weekly = timings["weekly"][0]
+        assert weekly["booked"].sum() == daily["booked"].sum() and weekly["capacity"].sum() == daily["capacity"].sum()
+        print("  daily, weekly and heatmap reports match the object loop")
+
+        paths, csv_elapsed = measure(lambda: reports.export_reports(columns, Path(directory) / "reports", start, end, clinic.dates[-28]))
+        print(f"  CSV export of {len(paths)} reports: {csv_elapsed * 1000:.0f} ms")
+        busiest = timings["busiest"][0]
+        print(f"  busiest slot: {busiest['vet'][0]} {busiest['weekday'][0]} {busiest['time'][0]} ({busiest['utilization'][0]:.0%})")
+        del mapped
+        snapshot.close()
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
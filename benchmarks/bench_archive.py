@@ -0,0 +1,65 @@
+# Benchmark of the hot/cold tiering (AppointmentStorage.archive): working-set memory, load and
+# save cost before and after archiving all but the last weeks of a clinic's history, the cost
+# of the historical lookups (cold and warm), and a check that no record was lost or duplicated
+# Run with: python -m benchmarks.bench_archive [profile] [days kept]
+import datetime as dt
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import storage_logic
+from benchmarks.clinic import PROFILES, generate_clinic
+
+def measure(function):
+    begin = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - begin
+
+def working_set(label: str) -> storage_logic.AppointmentStorage:
+    storage, load_elapsed = measure(storage_logic.AppointmentStorage)
+    tracemalloc.start()
+    storage_logic.AppointmentStorage().close()
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    _, save_elapsed = measure(storage.save)
+    size = sum(path.stat().st_size for path in (storage_logic.APPOINTMENTS_FILE, storage_logic.AVAILABLE_SLOTS_FILE,
+                                                storage_logic.RESERVED_SLOTS_FILE))
+    print(f"  {label:<15} {len(storage.appointments):>7} appointments, {len(storage.available_slots) + len(storage.reserved_slots):>7} slots | "
+          f"load {load_elapsed * 1000:8.1f} ms, {load_peak / 2**20:6.1f} MiB | save {save_elapsed * 1000:8.1f} ms | files {size / 2**20:6.2f} MiB")
+    return storage
+
+def main(profile: str = "medium", days_kept: int = 28) -> None:
+    logging.disable(logging.WARNING)
+    clinic = generate_clinic(PROFILES[profile])
+    cutoff = dt.datetime.combine(clinic.dates[-days_kept], dt.time())
+    print(f"{profile} clinic, {len(clinic.dates)} days of history, archiving before {cutoff:%Y-%m-%d}:")
+    with tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+        storage = working_set("before")
+        archived, archive_elapsed = measure(lambda: storage.archive(cutoff))
+        print(f"  archived {archived} appointments in {archive_elapsed * 1000:.1f} ms: {storage.archive_store.stats()}")
+        storage = working_set("after")
+
+        archive = storage.archive_store
+        probe = clinic.appointments[len(clinic.appointments) // 3]
+        found, cold = measure(lambda: archive.find(probe.customer, probe.slot))
+        found_again, warm = measure(lambda: archive.find(probe.customer, probe.slot))
+        history, scan = measure(lambda: archive.by_customer(probe.customer))
+        assert found == probe and found_again == probe and probe in history
+        print(f"  historical lookup: {cold * 1000:.2f} ms cold, {warm * 1000:.3f} ms warm; "
+              f"customer history ({len(history)} visits, every segment): {scan * 1000:.1f} ms")
+
+        live = storage.appointments.ordered()
+        past = archive.between()
+        assert len(live) + len(past) == len(clinic.appointments), "appointments were lost or duplicated"
+        assert set(live + past) == set(clinic.appointments), "the live and archived appointments differ from the history"
+        assert len(storage.reserved_slots) + len(archive.slots_between()) == len(set(clinic.reserved_slots))
+        print("  live + archived records match the original history")
+        storage.close()
+
+if __name__ == "__main__":
+    main(*(int(argument) if number == 1 else argument for number, argument in enumerate(sys.argv[1:3])))
@@ -0,0 +1,53 @@
+# Benchmark: set-based availability (slot_times) vs. the bitset engine over a one-year horizon
+# Run with: python -m benchmarks.bench_availability [reserved share in percent]
+import datetime as dt
+import random
+import sys
+import time
+
+from constants import VET_SCHEDULES
+from slot_times import make_daily_slots
+from appointments_logic.service import get_available_slots_for_vet
+from availability_logic.bitset import AvailabilityBitset
+
+HORIZON_DAYS = 365
+
+def year_of_reserved_slots(start: dt.date, share: float, seed: int = 7):
+    generator = random.Random(seed)
+    reserved = []
+    for day in range(HORIZON_DAYS):
+        for slot in sorted(make_daily_slots(None, start + dt.timedelta(days=day))):
+            if generator.random() < share:
+                reserved.append(slot)
+    return reserved
+
+def main(reserved_percent: int = 30) -> None:
+    start = dt.date(2026, 1, 1)
+    reserved = year_of_reserved_slots(start, reserved_percent / 100)
+    queries = [(vet, dt.datetime.combine(start + dt.timedelta(days=day), dt.time()))
+               for day in range(HORIZON_DAYS) for vet in VET_SCHEDULES]
+
+    begin = time.perf_counter()
+    set_results = [get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved) for vet, date_time in queries]
+    set_elapsed = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    availability = AvailabilityBitset(reserved)
+    build_elapsed = time.perf_counter() - begin
+    begin = time.perf_counter()
+    bitset_results = [get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved, availability=availability) for vet, date_time in queries]
+    bitset_elapsed = time.perf_counter() - begin
+
+    assert [sorted(result) for result in set_results] == [sorted(result) for result in bitset_results]
+    begin = time.perf_counter()
+    first_free = [availability.first_free_slot(date_time) for _, date_time in queries]
+    first_free_elapsed = time.perf_counter() - begin
+
+    print(f"{len(queries)} vet-day queries over {HORIZON_DAYS} days, {len(reserved)} reserved slots")
+    print(f"  set-based:        {set_elapsed * 1000:9.1f} ms ({len(queries) / set_elapsed:10.0f} queries/sec)")
+    print(f"  bitset:           {bitset_elapsed * 1000:9.1f} ms ({len(queries) / bitset_elapsed:10.0f} queries/sec, "
+          f"{set_elapsed / bitset_elapsed:.0f}x), built in {build_elapsed * 1000:.1f} ms")
+    print(f"  first free slot:  {first_free_elapsed * 1000:9.1f} ms for {len(first_free)} searches")
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
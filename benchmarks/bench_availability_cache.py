@@ -0,0 +1,96 @@
+# Benchmark and consistency check of the availability cache (availability_logic.cache): a
+# read-mostly mix of availability queries and bookings, then concurrent bookings and cached
+# reads, after which every cached (vet, date) must match a fresh computation
+# Run with: python -m benchmarks.bench_availability_cache [queries] [threads]
+import datetime as dt
+import logging
+import random
+import sys
+import threading
+import time
+
+from constants import VET_SCHEDULES
+from slot_times import make_daily_slots
+from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.locking import VetDayLocks
+from appointments_logic.service import create_appointment, get_available_slots_for_vet
+from availability_logic.cache import AvailabilityCache
+
+START = dt.date(2026, 10, 19)
+DAYS = 28
+BOOKING_SHARE = 0.05
+
+def make_state():
+    slots = sorted(slot for day in range(DAYS) for slot in make_daily_slots(None, START + dt.timedelta(days=day)))
+    return AppointmentIndex(), set(slots), set(), slots
+
+def run_mix(queries: int, cache) -> float:
+    generator = random.Random(3)
+    appointments, available, reserved, slots = make_state()
+    vets = list(VET_SCHEDULES)
+    begin = time.perf_counter()
+    for number in range(queries):
+        if generator.random() < BOOKING_SHARE:
+            create_appointment(appointments, Appointment(f"Customer {number}", generator.choice(slots)), available, reserved)
+        else:
+            date_time = dt.datetime.combine(START + dt.timedelta(days=generator.randrange(DAYS)), dt.time())
+            get_available_slots_for_vet(generator.choice(vets), date_time, VET_SCHEDULES, reserved, cache=cache)
+    return time.perf_counter() - begin
+
+def concurrent_check(threads: int) -> None:
+    appointments, available, reserved, slots = make_state()
+    locks = VetDayLocks()
+    cache = AvailabilityCache()
+    vets = list(VET_SCHEDULES)
+
+    def booker(number: int) -> None:
+        generator = random.Random(number)
+        for index in range(len(slots) // threads):
+            create_appointment(appointments, Appointment(f"Customer {number}-{index}", generator.choice(slots)), available, reserved, locks=locks)
+            # let the readers fill the cache between the bookings
+            time.sleep(0.0002)
+
+    def reader(number: int) -> None:
+        generator = random.Random(1000 + number)
+        while not done.is_set():
+            date_time = dt.datetime.combine(START + dt.timedelta(days=generator.randrange(DAYS)), dt.time())
+            get_available_slots_for_vet(generator.choice(vets), date_time, VET_SCHEDULES, reserved, locks=locks, cache=cache)
+
+    bookers = [threading.Thread(target=booker, args=(number,)) for number in range(threads)]
+    readers = [threading.Thread(target=reader, args=(number,)) for number in range(threads)]
+    done = threading.Event()
+    for worker in readers + bookers:
+        worker.start()
+    for worker in bookers:
+        worker.join()
+    done.set()
+    for worker in readers:
+        worker.join()
+
+    stale = 0
+    for vet in vets:
+        for day in range(DAYS):
+            date_time = dt.datetime.combine(START + dt.timedelta(days=day), dt.time())
+            cached = cache.get_or_compute((vet, date_time.date()), lambda: None)
+            if cached is not None and sorted(cached) != sorted(get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved)):
+                stale += 1
+    print(f"{threads} booking + {threads} reading threads: {len(appointments)} bookings, {stale} stale cache entries, {cache.stats()}")
+    assert stale == 0, "the cache returned availability from before a booking"
+    cache.close()
+
+def main(queries: int = 50000, threads: int = 4) -> None:
+    logging.disable(logging.WARNING)
+    uncached = run_mix(queries, None)
+    cache = AvailabilityCache()
+    cached = run_mix(queries, cache)
+    stats = cache.stats()
+    cache.close()
+    print(f"{queries} operations ({BOOKING_SHARE:.0%} bookings) over {DAYS} days:")
+    print(f"  uncached: {uncached * 1000:8.1f} ms ({queries / uncached:8.0f} ops/sec)")
+    print(f"  cached:   {cached * 1000:8.1f} ms ({queries / cached:8.0f} ops/sec, {uncached / cached:.1f}x), "
+          f"hit rate {stats['hit_rate']:.1%}, {stats['invalidations']} invalidations")
+    concurrent_check(threads)
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
@@ -0,0 +1,60 @@
+# Startup harness for the CLI (main.py): in a fresh interpreter, the time to import main, and
+# the time of the first query (which loads the state, once), for growing data sizes. The
+# import must not touch the data files: the files opened during it are recorded (audit hook)
+# Run with: python -m benchmarks.bench_cli_startup [sizes...]   (default: 0 10000 100000)
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import storage_logic
+from benchmarks.bench_startup import make_appointments
+
+REPEAT = 3
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs in the child interpreter; prints the measurements as JSON
+CHILD = """
+import datetime as dt, json, sys, time
+opened = []
+sys.addaudithook(lambda event, args: opened.append(str(args[0])) if event == "open" and isinstance(args[0], str) else None)
+begin = time.perf_counter()
+import main
+imported = time.perf_counter()
+data_opened = [path for path in opened if "/data/" in path or path.startswith(sys.argv[1])]
+import storage_logic
+storage_logic.set_data_dir(sys.argv[1])
+query = time.perf_counter()
+main.vet_availability("a", dt.date(2026, 10, 19))
+first = time.perf_counter()
+main.vet_availability("b", dt.date(2026, 10, 20))
+second = time.perf_counter()
+print(json.dumps({"import": imported - begin, "first_query": first - query, "second_query": second - first,
+                  "appointments": len(storage_logic.shared_storage().appointments), "data_opened": data_opened}))
+"""
+
+def run_child(data_dir: Path) -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD, str(data_dir)], cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def run(count: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(make_appointments(count), [], [])
+        runs = [run_child(Path(directory)) for _ in range(REPEAT)]
+    best = {key: min(result[key] for result in runs) for key in ("import", "first_query", "second_query")}
+    assert all(result["appointments"] == count for result in runs), "the state was not loaded from the data directory"
+    assert not any(result["data_opened"] for result in runs), f"the import opened data files: {runs[0]['data_opened']}"
+    print(f"{count:>9} appointments: import main {best['import'] * 1000:7.1f} ms | first query (loads the state) "
+          f"{best['first_query'] * 1000:9.1f} ms | next query {best['second_query'] * 1000:6.2f} ms")
+
+def main(*sizes: int) -> None:
+    logging.disable(logging.WARNING)
+    print(f"best of {REPEAT} fresh interpreters; no data file is opened by the import")
+    for count in sizes or (0, 10_000, 100_000):
+        run(count)
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:]))
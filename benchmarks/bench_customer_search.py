@@ -0,0 +1,79 @@
+# Benchmark and consistency check of the customer index (AppointmentIndex.search_customers):
+# "upcoming appointments of the customers starting with X" through the index vs. a scan of
+# every appointment; then random bookings, cancellations and updates, after which every
+# prefix query must match the scan
+# Run with: python -m benchmarks.bench_customer_search [appointments] [queries]
+import datetime as dt
+import logging
+import random
+import string
+import sys
+import time
+
+from constants import VET_SCHEDULES
+from slot_times import Slot
+from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex
+
+START = dt.datetime(2026, 1, 5, 9)
+
+def make_customers(count: int, generator: random.Random):
+    return [generator.choice(["", "dr ", "Mc"]) + "".join(generator.choice(string.ascii_letters) for _ in range(generator.randint(3, 9)))
+            for _ in range(count)]
+
+def make_appointment(generator: random.Random, customers, vets, number: int) -> Appointment:
+    return Appointment(generator.choice(customers), Slot(START + dt.timedelta(hours=generator.randrange(24 * 730)), vets[number % len(vets)]))
+
+def scan(appointments, prefix: str, since: dt.datetime, limit: int = None):
+    prefix = prefix.casefold()
+    found = sorted((appointment for appointment in appointments
+                    if appointment.customer.casefold().startswith(prefix) and appointment.slot.datetime >= since),
+                   key=lambda appointment: (appointment.slot.datetime, appointment.slot.vet, appointment.customer))
+    return found[:limit] if limit is not None else found
+
+def main(count: int = 100000, queries: int = 200) -> None:
+    logging.disable(logging.WARNING)
+    generator = random.Random(11)
+    customers, vets = make_customers(max(count // 5, 1), generator), list(VET_SCHEDULES)
+    appointments = list({make_appointment(generator, customers, vets, number) for number in range(count)})
+    begin = time.perf_counter()
+    index = AppointmentIndex(appointments)
+    print(f"{len(appointments)} appointments of {len(set(customers))} customers indexed in {(time.perf_counter() - begin) * 1000:.0f} ms")
+
+    since = START + dt.timedelta(days=365)
+    prefixes = [customer[:generator.randint(1, 3)].lower() for customer in generator.sample(customers, queries)]
+    for label, search in (("index", lambda prefix: index.search_customers(prefix, since, 20)),
+                          ("scan", lambda prefix: scan(appointments, prefix, since, 20))):
+        begin = time.perf_counter()
+        for prefix in prefixes:
+            search(prefix)
+        print(f"  {label:<6} first 20 upcoming per prefix: {(time.perf_counter() - begin) / queries * 1e6:10.1f} us per query")
+
+    # incremental maintenance: bookings, cancellations and updates (remove + append)
+    live = set(appointments)
+    for number in range(5000):
+        action = generator.random()
+        if action < 0.4 or not live:
+            appointment = make_appointment(generator, customers, vets, number)
+            if appointment not in live:
+                index.append(appointment)
+                live.add(appointment)
+        else:
+            appointment = generator.choice(tuple(live)) if number % 50 == 0 else next(iter(live))
+            index.remove(appointment)
+            live.discard(appointment)
+            if action > 0.7:
+                moved = Appointment(appointment.customer, Slot(appointment.slot.datetime + dt.timedelta(days=7), appointment.slot.vet))
+                if moved not in live:
+                    index.append(moved)
+                    live.add(moved)
+    mismatches = sum(index.search_customers(prefix, since) != scan(live, prefix, since) for prefix in prefixes[:50])
+    mismatches += sum(index.search_customers(prefix, since, 20) != scan(live, prefix, since, 20) for prefix in prefixes[:50])
+    mismatches += sum(index.by_customer(customer) != scan([a for a in live if a.customer.casefold() == customer.casefold()], "", dt.datetime.min)
+                      for customer in customers[:50])
+    assert index.customers_with_prefix("") == sorted({appointment.customer.casefold() for appointment in live})
+    print(f"  after 5000 random bookings/cancellations/updates: {mismatches} mismatching queries")
+    assert not mismatches
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
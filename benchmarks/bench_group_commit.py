@@ -0,0 +1,59 @@
+# Multi-threaded benchmark: per-operation fsync vs. group commit of the journal records
+# Run with: python -m benchmarks.bench_group_commit [threads] [operations per thread]
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from persistence_logic.journal import Journal
+from persistence_logic.group_commit import GroupCommitWriter
+
+# A booking-sized journal record
+RECORD = {"customer": "Customer", "slot": {"datetime": "2026-01-05T09:00:00", "vet": "Dr. Arron"}}
+
+def run_threads(threads: int, operations: int, write) -> float:
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(operations):
+            write("add", RECORD)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.join()
+    return time.perf_counter() - start
+
+def bench_per_op_fsync(directory: Path, threads: int, operations: int) -> float:
+    journal = Journal(directory / "per_op.log")
+    elapsed = run_threads(threads, operations, journal.append)
+    journal.close()
+    return elapsed
+
+def bench_group_commit(directory: Path, threads: int, operations: int) -> float:
+    journal = Journal(directory / "group.log")
+    writer = GroupCommitWriter(journal)
+    elapsed = run_threads(threads, operations, writer.write)
+    writer.close()
+    print(f"  group commit: {writer.records} records in {writer.batches} batches "
+          f"(average batch {writer.records / max(writer.batches, 1):.1f})")
+    journal.close()
+    return elapsed
+
+def main(threads: int = 16, operations: int = 200) -> None:
+    total = threads * operations
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        per_op = bench_per_op_fsync(directory, threads, operations)
+        grouped = bench_group_commit(directory, threads, operations)
+    print(f"{threads} threads x {operations} bookings")
+    print(f"  per-op fsync: {total / per_op:10.0f} bookings/sec")
+    print(f"  group commit: {total / grouped:10.0f} bookings/sec ({per_op / grouped:.1f}x)")
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
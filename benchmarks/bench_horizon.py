@@ -0,0 +1,118 @@
+# Benchmark and consistency check of the rolling availability horizon: query latency of the
+# slot sets, the bitset and the horizon; concurrent bookings/cancellations through the storage
+# with the worker running (every booking must be visible to the next query, and every day of
+# the window must match a fresh computation at the end); a move of the window by a week
+# Run with: python -m benchmarks.bench_horizon [queries] [threads]
+import datetime as dt
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import storage_logic
+from constants import VET_SCHEDULES
+from slot_times import make_daily_slots
+from appointments_logic.core import Appointment
+from appointments_logic.service import get_available_slots_for_vet
+from availability_logic.bitset import AvailabilityBitset
+from availability_logic.horizon import AvailabilityHorizon
+from benchmarks.clinic import ClinicSpec, generate_clinic, installed_clinic
+
+WINDOW_DAYS = 84
+
+def check_window(storage, horizon) -> int:
+    taken = {appointment.slot for appointment in storage.appointments} | set(storage.reserved_slots)
+    stale = 0
+    for offset in range((horizon.end - horizon.start).days):
+        date = horizon.start + dt.timedelta(days=offset)
+        for vet in VET_SCHEDULES:
+            expected = sorted(slot for slot in make_daily_slots(None, date) if slot.vet == vet and slot not in taken)
+            if horizon.free_slots(vet, date) != expected:
+                stale += 1
+    return stale
+
+def time_queries(queries: int, dates, query) -> float:
+    generator = random.Random(5)
+    vets = list(VET_SCHEDULES)
+    begin = time.perf_counter()
+    for _ in range(queries):
+        query(generator.choice(vets), dt.datetime.combine(generator.choice(dates), dt.time()))
+    return (time.perf_counter() - begin) / queries
+
+def concurrent_check(storage, horizon, dates, threads: int) -> None:
+    failures = []
+
+    def booker(number: int) -> None:
+        generator = random.Random(number)
+        for index in range(60):
+            vet, date = generator.choice(list(VET_SCHEDULES)), generator.choice(dates)
+            free = horizon.free_slots(vet, date)
+            if not free:
+                continue
+            appointment = Appointment(f"Customer {number}-{index}", generator.choice(free))
+            storage.add_appointment(appointment)
+            if appointment.slot in horizon.free_slots(vet, date):
+                failures.append(f"booked {appointment.slot} still listed as free")
+            if index % 3 == 0:
+                storage.remove_appointment(appointment)
+                if appointment.slot not in horizon.free_slots(vet, date):
+                    failures.append(f"cancelled {appointment.slot} not listed as free")
+
+    def reader(number: int) -> None:
+        generator = random.Random(1000 + number)
+        while not done.is_set():
+            horizon.free_slots(generator.choice(list(VET_SCHEDULES)), generator.choice(dates))
+
+    done = threading.Event()
+    bookers = [threading.Thread(target=booker, args=(number,)) for number in range(threads)]
+    readers = [threading.Thread(target=reader, args=(number,)) for number in range(threads)]
+    for worker in readers + bookers:
+        worker.start()
+    for worker in bookers:
+        worker.join()
+    done.set()
+    for worker in readers:
+        worker.join()
+    horizon.maintain()
+    stale = check_window(storage, horizon)
+    print(f"  {threads} booking + {threads} reading threads: {len(failures)} read-your-writes failures, "
+          f"{stale} stale days, {horizon.stats()}")
+    assert not failures and not stale, failures[:3]
+
+def main(queries: int = 20000, threads: int = 4) -> None:
+    logging.disable(logging.WARNING)
+    clinic = generate_clinic(ClinicSpec(months_of_history=6))
+    with installed_clinic(clinic), tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+        storage = storage_logic.AppointmentStorage(journaled=True)
+        today = [clinic.dates[0]]
+        begin = time.perf_counter()
+        horizon = AvailabilityHorizon(storage, WINDOW_DAYS, today=lambda: today[0])
+        print(f"{WINDOW_DAYS} day window over {len(VET_SCHEDULES)} vets materialized in {(time.perf_counter() - begin) * 1000:.1f} ms")
+
+        dates = clinic.dates[:WINDOW_DAYS]
+        reserved = list(storage.reserved_slots) + [appointment.slot for appointment in storage.appointments]
+        bitset = AvailabilityBitset(reserved)
+        sets = time_queries(queries, dates, lambda vet, date_time: get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, reserved))
+        masks = time_queries(queries, dates, lambda vet, date_time: get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, (), availability=bitset))
+        materialized = time_queries(queries, dates, lambda vet, date_time: get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, (), horizon=horizon))
+        print(f"  availability query: slot sets {sets * 1e6:8.1f} us | bitset {masks * 1e6:6.1f} us | horizon {materialized * 1e6:6.1f} us "
+              f"({sets / materialized:.0f}x vs. sets, {masks / materialized:.1f}x vs. bitset)")
+
+        horizon.start_worker()
+        concurrent_check(storage, horizon, dates, threads)
+
+        today[0] += dt.timedelta(days=7)
+        horizon.maintain()
+        stale = check_window(storage, horizon)
+        print(f"  window advanced to {horizon.start} - {horizon.end}: {stale} stale days")
+        assert horizon.start == today[0] and not stale
+        horizon.close()
+        storage.close()
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
@@ -0,0 +1,59 @@
+# Throughput of the vet-day locking vs. thread count (the no-double-booking check under the same
+# contention is tests/test_locking.py)
+# Run with: python -m benchmarks.bench_locking [days]
+import datetime as dt
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+
+from slot_times import make_daily_slots
+from appointments_logic.core import make_appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.locking import VetDayLocks
+from appointments_logic.service import create_appointment
+
+def run(threads: int, days: int) -> None:
+    start = dt.date(2026, 1, 5)
+    slots = sorted(slot for day in range(days) for slot in make_daily_slots(None, start + dt.timedelta(days=day)))
+    available_slots = list(slots)
+    reserved_slots = []
+    appointments = AppointmentIndex()
+    locks = VetDayLocks()
+    booked = Counter()
+    booked_lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    # every thread tries to book every slot, so each slot is contended by all the threads
+    def worker(number: int):
+        barrier.wait()
+        for slot in slots:
+            result, _, _ = create_appointment(appointments, make_appointment(f"Customer {number}", slot),
+                                              available_slots, reserved_slots, locks=locks)
+            if result is not None:
+                with booked_lock:
+                    booked[slot] += 1
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    begin = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - begin
+
+    attempts = threads * len(slots)
+    print(f"{threads:3} threads: {attempts / elapsed:10.0f} attempts/sec, {sum(booked.values())} of {len(slots)} slots booked, "
+          f"{locks.conflicts} CAS conflicts")
+
+def main(days: int = 60) -> None:
+    # the rejected attempts log a warning each
+    logging.disable(logging.WARNING)
+    for threads in (1, 2, 4, 8, 16):
+        run(threads, days)
+    logging.disable(logging.NOTSET)
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
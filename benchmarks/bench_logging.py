@@ -0,0 +1,55 @@
+# Benchmark: booking latency with logging off, synchronous (formatting and file I/O on the
+# booking path), asynchronous (QueueHandler/QueueListener) and asynchronous with rate limiting
+# Run with: python -m benchmarks.bench_logging [bookings]
+import datetime as dt
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from slot_times import make_daily_slots
+from appointments_logic.core import Appointment, remove_appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.service import create_appointment
+from logging_setup import configure_logging, stop_logging
+
+def booking_latencies(bookings: int):
+    slots = sorted(slot for day in range(120) for slot in make_daily_slots(None, dt.date(2026, 1, 5) + dt.timedelta(days=day)))
+    appointments, available, reserved = AppointmentIndex(), set(slots), set()
+    latencies = []
+    for number in range(bookings):
+        appointment = Appointment(f"Customer {number}", slots[number % len(slots)])
+        begin = time.perf_counter()
+        create_appointment(appointments, appointment, available, reserved)
+        latencies.append(time.perf_counter() - begin)
+        # give the slot back, off the clock
+        remove_appointment(appointments, appointment)
+        available.add(appointment.slot)
+        reserved.discard(appointment.slot)
+    return latencies
+
+def report(name: str, latencies, log_file: Path) -> None:
+    ordered = sorted(latencies)
+    lines = sum(1 for _ in open(log_file, encoding="utf-8")) if log_file.exists() else 0
+    print(f"  {name:<28} p50 {statistics.median(ordered) * 1e6:7.1f} us  p99 {ordered[int(0.99 * len(ordered))] * 1e6:7.1f} us  "
+          f"mean {statistics.mean(ordered) * 1e6:7.1f} us  ({lines} log lines)")
+
+def main(bookings: int = 20000) -> None:
+    modes = [("off (WARNING level)", dict(level=logging.WARNING, asynchronous=False, rate_limit=None)),
+             ("synchronous INFO", dict(level=logging.INFO, asynchronous=False, rate_limit=None)),
+             ("asynchronous INFO", dict(level=logging.INFO, asynchronous=True, rate_limit=None)),
+             ("asynchronous INFO, limited", dict(level=logging.INFO, asynchronous=True))]
+    print(f"{bookings} bookings (create_appointment), logging to a file:")
+    with tempfile.TemporaryDirectory() as directory:
+        for number, (name, options) in enumerate(modes):
+            log_file = Path(directory) / f"{number}.log"
+            configure_logging(filename=str(log_file), **options)
+            latencies = booking_latencies(bookings)
+            stop_logging()
+            report(name, latencies, log_file)
+    logging.getLogger().handlers.clear()
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
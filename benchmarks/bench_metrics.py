@@ -0,0 +1,72 @@
+# Benchmark: cost of the instrumentation (metrics.py) when disabled and when enabled, plus a
+# sample of the exported metrics after a contended run of the storage
+# Run with: python -m benchmarks.bench_metrics [threads]
+import datetime as dt
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import metrics
+import storage_logic
+from constants import VET_SCHEDULES
+from slot_times import Slot, make_daily_slots
+from appointments_logic.core import Appointment
+from appointments_logic.service import get_available_slots_for_vet
+
+CALLS = 20000
+
+def availability_loop() -> float:
+    date_time = dt.datetime(2026, 10, 19)
+    begin = time.perf_counter()
+    for _ in range(CALLS):
+        get_available_slots_for_vet("Dr. Arron", date_time, VET_SCHEDULES, ())
+    return (time.perf_counter() - begin) / CALLS
+
+def contended_bookings(threads: int) -> None:
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    slots = sorted(slot for day in range(14) for slot in make_daily_slots(None, dt.date(2026, 10, 19) + dt.timedelta(days=day)))
+
+    def book(number: int) -> None:
+        for index, slot in enumerate(slots):
+            if index % threads == number % threads or index % 3 == 0:
+                storage.add_appointment(Appointment(f"Customer {number}", slot))
+    workers = [threading.Thread(target=book, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    storage.close()
+
+def main(threads: int = 8) -> None:
+    logging.disable(logging.WARNING)
+    metrics.disable_metrics()
+    disabled = availability_loop()
+    metrics.enable_metrics()
+    enabled = availability_loop()
+    print(f"get_available_slots_for_vet: {disabled * 1e6:.2f} us disabled, {enabled * 1e6:.2f} us enabled "
+          f"({(enabled - disabled) * 1e9:+.0f} ns per call)")
+
+    wrapped = metrics.timed("noop")(lambda: None)
+    metrics.disable_metrics()
+    begin = time.perf_counter()
+    for _ in range(CALLS * 10):
+        wrapped()
+    print(f"disabled timer on an empty function: {(time.perf_counter() - begin) / (CALLS * 10) * 1e9:.0f} ns per call")
+
+    metrics.reset_metrics()
+    metrics.enable_metrics()
+    with tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        contended_bookings(threads)
+    snapshot = metrics.snapshot()
+    print(f"{threads} threads booking two weeks of slots:")
+    for name, value in snapshot["counters"].items():
+        print(f"  {name:<50} {value}")
+    for name, stats in snapshot["timers"].items():
+        print(f"  {name:<50} {stats['count']:>7} calls, mean {stats['mean_seconds'] * 1e6:9.1f} us, max {stats['max_seconds'] * 1e6:9.1f} us")
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
@@ -0,0 +1,54 @@
+# Benchmark: "next N free slots" search vs. looping over days and vets with get_available_slots_for_vet
+# Run with: python -m benchmarks.bench_search [taken share in percent] [N]
+import datetime as dt
+import statistics
+import sys
+import time
+
+from constants import VET_SCHEDULES
+from appointments_logic.service import get_available_slots_for_vet
+from availability_logic.bitset import AvailabilityBitset
+from availability_logic.search import first_free_slots
+from benchmarks.bench_availability import HORIZON_DAYS, year_of_reserved_slots
+
+QUERIES = 2000
+
+# The loop a caller had to write before: day by day, vet by vet, until N slots are found
+def naive_first_free_slots(start: dt.datetime, count: int, taken) -> list:
+    found = []
+    for day in range(HORIZON_DAYS):
+        date_time = dt.datetime.combine(start.date() + dt.timedelta(days=day), dt.time())
+        day_slots = []
+        for vet in VET_SCHEDULES:
+            day_slots.extend(slot for slot in get_available_slots_for_vet(vet, date_time, VET_SCHEDULES, taken) if slot.datetime >= start)
+        found.extend(sorted(day_slots))
+        if len(found) >= count:
+            return found[:count]
+    return found
+
+def main(taken_percent: int = 90, count: int = 5) -> None:
+    start = dt.date(2026, 1, 1)
+    taken = year_of_reserved_slots(start, taken_percent / 100)
+    availability = AvailabilityBitset(taken)
+    starts = [dt.datetime.combine(start + dt.timedelta(days=index % 300), dt.time(8 + index % 10, 30)) for index in range(QUERIES)]
+
+    latencies = []
+    for query_start in starts:
+        begin = time.perf_counter()
+        first_free_slots(query_start, count, availability=availability)
+        latencies.append(time.perf_counter() - begin)
+
+    naive_starts = starts[:QUERIES // 20]
+    begin = time.perf_counter()
+    naive_results = [naive_first_free_slots(query_start, count, taken) for query_start in naive_starts]
+    naive_elapsed = time.perf_counter() - begin
+    assert naive_results == [first_free_slots(query_start, count, availability=availability) for query_start in naive_starts]
+
+    ordered = sorted(latencies)
+    print(f"first {count} free slots, {len(taken)} taken slots ({taken_percent}% of the year)")
+    print(f"  search:     p50 {statistics.median(latencies) * 1e6:8.1f} us, p99 {ordered[int(0.99 * len(ordered))] * 1e6:8.1f} us "
+          f"({len(latencies) / sum(latencies):8.0f} queries/sec)")
+    print(f"  day loop:   mean {naive_elapsed / len(naive_starts) * 1e6:8.1f} us ({len(naive_starts)} queries)")
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:3]))
@@ -0,0 +1,110 @@
+# Benchmark and consistency check of the recurring series (appointments_logic.series): booking
+# time and in-memory size of a short and a long weekly series (one series record each) against
+# booking the same occurrences one appointment at a time, the lazy expansion of a window of a long
+# series, cancelled/moved occurrences stored as one exception record each, the conflict checks,
+# and the series log reloaded from disk
+# Run with: python -m benchmarks.bench_series [occurrences]
+import datetime as dt
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import storage_logic
+from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.series import make_rule
+from slot_times import Slot
+from benchmarks.clinic import ClinicSpec, generate_clinic, installed_clinic
+
+def measure(function):
+    begin = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - begin
+
+# The result of the function, its duration and the memory it left allocated
+def retained(function):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result, elapsed = measure(function)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, after - before
+
+def log_records(path: Path) -> int:
+    return len(path.read_bytes().splitlines()) if path.exists() else 0
+
+def main(occurrences: int = 520) -> None:
+    logging.disable(logging.WARNING)
+    clinic = generate_clinic(ClinicSpec(months_of_history=1))
+    with installed_clinic(clinic), tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+        storage = storage_logic.AppointmentStorage(journaled=True)
+        # the vets 000 and 001 both work on Tuesdays (000: Monday..Wednesday, 001: Tuesday..Thursday)
+        vet, other_vet = list(clinic.vet_schedules)[:2]
+        end = clinic.dates[-1]
+        tuesday = dt.datetime.combine(end + dt.timedelta(days=(1 - end.weekday()) % 7 + 7), dt.time(9))
+        print(f"clinic: {len(clinic.appointments)} appointments; the series start on {tuesday:%Y-%m-%d}")
+
+        short, short_time = measure(lambda: storage.book_series("Series Short", vet, make_rule(tuesday, count=10)))
+        long, long_time = measure(lambda: storage.book_series("Series Long", vet, make_rule(tuesday.replace(hour=10), count=occurrences)))
+        assert short is not None and long is not None, "a free series was rejected"
+        # the memory of a series as loaded (its rule and exceptions), whatever its length
+        sizes = [retained(lambda: storage_logic.deserialize_series(storage_logic.serialize_series(series)))[2] for series in (short, long)]
+        print(f"  series booking (one record, one fsync): {len(short)} occurrences {short_time * 1000:.2f} ms, {sizes[0]} B | "
+              f"{len(long)} occurrences {long_time * 1000:.2f} ms, {sizes[1]} B")
+
+        eager = [Appointment("Series Eager", Slot(tuesday.replace(hour=11) + dt.timedelta(weeks=week), other_vet)) for week in range(occurrences)]
+        _, eager_time = measure(lambda: [storage.add_appointment(appointment) for appointment in eager])
+        assert all(appointment in storage.appointments for appointment in eager)
+        # the same appointments held by the index (the rebuilt index, without the other appointments)
+        eager_memory = retained(lambda: AppointmentIndex(list(eager)))[2]
+        print(f"  the same {occurrences} occurrences as appointments: {eager_time * 1000:.0f} ms, {eager_memory / 1024:.0f} KiB in the index "
+              f"({eager_time / long_time:.0f}x the time, {eager_memory / max(sizes[1], 1):.0f}x the memory of the series)")
+        print(f"  series log: {log_records(storage_logic.SERIES_FILE)} records for {len(short) + len(long)} occurrences")
+
+        middle = long.rule.at(len(long) // 2)
+        window, window_time = measure(lambda: list(long.occurrences(middle, middle + dt.timedelta(weeks=4))))
+        everything, full_time = measure(lambda: list(long.occurrences()))
+        assert [appointment.slot.datetime for appointment in window] == [middle + dt.timedelta(weeks=week) for week in range(4)]
+        print(f"  a 4-week window of the long series: {window_time * 1e6:.0f} us | every occurrence: {full_time * 1e6:.0f} us")
+
+        monthly = storage.book_series("Series Monthly", vet, make_rule(tuesday.replace(hour=11), "monthly", count=24), skip_conflicts=True)
+        assert monthly is not None and all(occurrence.slot.datetime.weekday() in (0, 1, 2) for occurrence in monthly.occurrences())
+        print(f"  monthly series: {len(monthly) - len(monthly.exceptions)} of {len(monthly)} occurrences on the vet's days, "
+              f"the others stored as cancelled")
+
+        # conflicts: a series over a held slot, an appointment on an occurrence, an unscheduled day
+        assert storage.book_series("Series Clash", vet, make_rule(tuesday + dt.timedelta(weeks=3), count=5)) is None
+        assert storage.book_series("Series Clash", vet, make_rule(tuesday + dt.timedelta(days=3), count=5)) is None
+        assert storage.add_appointment(Appointment("Series Clash", Slot(long.rule.at(7), vet))) is None
+        assert Appointment("Series Clash", Slot(long.rule.at(7), vet)) not in storage.appointments
+        taken = storage.taken_slots_between(tuesday.date(), tuesday.date() + dt.timedelta(weeks=2), vet)
+        assert {Slot(short.rule.at(1), vet), Slot(long.rule.at(1), vet)} <= set(taken)
+        print("  overlapping series and appointments are rejected; the occurrences count as taken slots")
+
+        records = log_records(storage_logic.SERIES_FILE)
+        cancelled, moved = Slot(long.rule.at(3), vet), Slot(long.rule.at(4), vet)
+        target = Slot(moved.datetime.replace(hour=14), vet)
+        storage.remove_appointment(Appointment("Series Long", cancelled))
+        storage.update_appointment(Appointment("Series Long", moved), Appointment("Series Long", target))
+        assert log_records(storage_logic.SERIES_FILE) == records + 2, "an exception was not stored as one record"
+        assert storage.series.occupant(cancelled) is None and storage.series.occupant(moved) is None
+        assert storage.series.find("Series Long", target) == (long, 4)
+        upcoming = storage.upcoming_appointments("series l", since=tuesday, limit=6)
+        assert [appointment.slot for appointment in upcoming] == [Slot(long.rule.at(number), vet) for number in (0, 1, 2)] + [target] + \
+            [Slot(long.rule.at(number), vet) for number in (5, 6)], upcoming
+        print("  a cancelled and a moved occurrence: one exception record each, the search sees the move")
+
+        storage.close()
+        reloaded = storage_logic.AppointmentStorage(journaled=True)
+        expected = {series.id: storage_logic.serialize_series(series) for series in storage.series}
+        assert {series.id: storage_logic.serialize_series(series) for series in reloaded.series} == expected, "the reloaded series differ"
+        print(f"  the series reloaded from disk match ({log_records(storage_logic.SERIES_FILE)} records in the series log)")
+        reloaded.close()
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
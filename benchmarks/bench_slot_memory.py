@@ -0,0 +1,63 @@
+# Memory/throughput comparison: the previous dataclass Slot/Appointment vs. the compact ones
+# Run with: python -m benchmarks.bench_slot_memory [number of slots]
+import datetime as dt
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from constants import VET_SCHEDULES
+from slot_times import Slot
+from appointments_logic.core import Appointment
+
+# The previous representations (frozen dataclasses with a __dict__ per instance)
+@dataclass(order=True, frozen=True)
+class DataclassSlot:
+    datetime: dt.datetime
+    vet: str
+
+@dataclass(frozen=True)
+class DataclassAppointment:
+    customer: str
+    slot: DataclassSlot
+
+def build(slot_class, appointment_class, count: int):
+    vets = list(VET_SCHEDULES)
+    start = dt.datetime(2020, 1, 1, 9)
+    # the vet names are fresh string objects, as when they are read from the data files
+    slots = [slot_class(start + dt.timedelta(hours=index // len(vets)), "".join(vets[index % len(vets)]))
+             for index in range(count)]
+    appointments = [appointment_class(f"Customer {index % 5000}", slot) for index, slot in enumerate(slots)]
+    return slots, appointments
+
+def measure(label: str, slot_class, appointment_class, count: int) -> None:
+    tracemalloc.start()
+    begin = time.perf_counter()
+    slots, appointments = build(slot_class, appointment_class, count)
+    build_elapsed = time.perf_counter() - begin
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    begin = time.perf_counter()
+    slot_set = set(slots)
+    appointment_set = set(appointments)
+    set_elapsed = time.perf_counter() - begin
+    probes = slots[::7]
+    begin = time.perf_counter()
+    found = sum(1 for slot in probes if slot in slot_set)
+    lookup_elapsed = time.perf_counter() - begin
+    begin = time.perf_counter()
+    sorted(slots[::-1])
+    sort_elapsed = time.perf_counter() - begin
+
+    assert found == len(probes) and len(appointment_set) == count
+    print(f"{label:10} {memory / count:8.0f} B/pair  build {build_elapsed:6.2f}s  sets {set_elapsed:6.2f}s  "
+          f"lookups {len(probes) / lookup_elapsed:10.0f}/s  sort {sort_elapsed:6.2f}s")
+
+def main(count: int = 200_000) -> None:
+    print(f"{count} slots + appointments")
+    measure("dataclass", DataclassSlot, DataclassAppointment, count)
+    measure("compact", Slot, Appointment, count)
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
@@ -0,0 +1,55 @@
+# Startup benchmark: JSON loader (load_state) vs. the memory-mapped binary snapshot
+# Run with: python -m benchmarks.bench_startup [sizes...]   (default: 10000 100000 1000000)
+import datetime as dt
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import storage_logic
+from constants import VET_SCHEDULES
+from slot_times import Slot
+from appointments_logic.core import Appointment
+
+def make_appointments(count: int):
+    vets = list(VET_SCHEDULES)
+    start = dt.datetime(2015, 1, 1, 9)
+    return [Appointment(f"Customer {index % 20000}", Slot(start + dt.timedelta(hours=index // len(vets)), vets[index % len(vets)]))
+            for index in range(count)]
+
+def timed(function):
+    begin = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - begin
+
+def run(count: int) -> None:
+    appointments = make_appointments(count)
+    probe = appointments[count // 2]
+    with tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(appointments, [], [])
+        storage_logic.save_binary_state(appointments, [], [])
+
+        (loaded, _, _), json_elapsed = timed(storage_logic.load_state)
+        json_query = probe in loaded
+
+        def binary_start():
+            snapshot = storage_logic.load_binary_state()
+            return snapshot, snapshot.has_appointment(probe.customer, probe.slot)
+        (snapshot, binary_query), binary_elapsed = timed(binary_start)
+        _, materialize_elapsed = timed(snapshot.load)
+        snapshot.close()
+
+    assert json_query and binary_query
+    print(f"{count:>9} appointments: JSON load_state {json_elapsed * 1000:10.1f} ms | "
+          f"binary open + first query {binary_elapsed * 1000:8.2f} ms ({json_elapsed / binary_elapsed:.0f}x) | "
+          f"binary full load {materialize_elapsed * 1000:10.1f} ms")
+
+def main(*sizes: int) -> None:
+    logging.disable(logging.INFO)
+    for count in sizes or (10_000, 100_000, 1_000_000):
+        run(count)
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:]))
@@ -0,0 +1,112 @@
+# Benchmark and consistency check of the storage transactions: a reschedule as two commits
+# (remove + add) vs. one transaction, per engine; then a rejected transaction, a failing
+# engine and a reload, after each of which the state must be exactly the expected one
+# Run with: python -m benchmarks.bench_transaction [reschedules] [profile]
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import storage_logic
+from appointments_logic.core import Appointment
+from persistence_logic.engines import TransactionError
+from persistence_logic.sqlite_engine import SQLiteStorageEngine
+from benchmarks.clinic import PROFILES, generate_clinic
+
+ENGINES = {
+    "json": lambda directory: storage_logic.JsonStorageEngine(),
+    "json journaled": lambda directory: storage_logic.JsonStorageEngine(journaled=True),
+    "sqlite": lambda directory: SQLiteStorageEngine(directory / "appointments.db"),
+}
+
+def make_storage(name: str, directory: Path, clinic) -> storage_logic.AppointmentStorage:
+    engine = ENGINES[name](directory)
+    engine.save(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+    return storage_logic.AppointmentStorage(engine)
+
+def snapshot(storage: storage_logic.AppointmentStorage):
+    return storage.appointments.ordered(), sorted(storage.reserved_slots)
+
+def separately(storage, old_appointment, new_appointment) -> None:
+    storage.remove_appointment(old_appointment)
+    storage.add_appointment(new_appointment)
+
+def transactionally(storage, old_appointment, new_appointment) -> None:
+    with storage.transaction() as transaction:
+        transaction.reschedule(old_appointment, new_appointment)
+
+# Moves the first appointments to free slots and back, so both runs start from the same state
+def run_reschedules(storage, clinic, reschedules: int, reschedule) -> float:
+    moves = [(appointment, Appointment(appointment.customer, slot))
+             for appointment, slot in zip(clinic.appointments[:reschedules], clinic.available_slots)]
+    begin = time.perf_counter()
+    for old_appointment, new_appointment in moves:
+        reschedule(storage, old_appointment, new_appointment)
+    for old_appointment, new_appointment in moves:
+        reschedule(storage, new_appointment, old_appointment)
+    return (time.perf_counter() - begin) / (2 * len(moves))
+
+def check_consistency(storage, clinic, name: str, directory: Path) -> None:
+    before = snapshot(storage)
+    first, second = clinic.appointments[0], clinic.appointments[1]
+    # the second operation books a taken slot: the first one must not be applied either
+    try:
+        with storage.transaction() as transaction:
+            transaction.cancel(first)
+            transaction.book(Appointment("Intruder", second.slot))
+        raise AssertionError("a double booking was committed")
+    except TransactionError:
+        pass
+    assert snapshot(storage) == before, "a rejected transaction changed the state"
+
+    # the engine fails while persisting: the in-memory changes are rolled back
+    commit = storage.engine.commit
+    def failing_commit(operation, data, state):
+        raise OSError("disk full")
+    storage.engine.commit = failing_commit
+    try:
+        with storage.transaction() as transaction:
+            transaction.cancel(first)
+            transaction.reserve(clinic.available_slots[-1])
+        raise AssertionError("the engine failure was swallowed")
+    except OSError:
+        pass
+    finally:
+        storage.engine.commit = commit
+    assert snapshot(storage) == before, "a failed commit changed the state"
+
+    # a committed transaction survives a reload (journal replay or database rows)
+    with storage.transaction() as transaction:
+        transaction.cancel(first)
+        transaction.book(Appointment(first.customer, clinic.available_slots[-1]))
+        transaction.reserve(clinic.available_slots[-2])
+    expected = snapshot(storage)
+    if name == "sqlite":
+        reloaded = storage_logic.AppointmentStorage(SQLiteStorageEngine(directory / "appointments.db"))
+    else:
+        storage.engine.journal.close()
+        reloaded = storage_logic.AppointmentStorage(ENGINES[name](directory))
+    assert snapshot(reloaded) == expected, "the reloaded state differs from the committed one"
+    print(f"  {name}: rejected, failed and reloaded transactions are consistent")
+
+def main(reschedules: int = 50, profile: str = "small") -> None:
+    logging.disable(logging.WARNING)
+    clinic = generate_clinic(PROFILES[profile])
+    print(f"{reschedules} reschedules (and back) over a {profile} clinic of {len(clinic.appointments)} appointments:")
+    for name in ENGINES:
+        with tempfile.TemporaryDirectory() as directory:
+            storage_logic.set_data_dir(Path(directory))
+            storage = make_storage(name, Path(directory), clinic)
+            two_commits = run_reschedules(storage, clinic, reschedules, separately)
+            one_commit = run_reschedules(storage, clinic, reschedules, transactionally)
+            print(f"  {name:<15} remove + add: {two_commits * 1000:7.2f} ms, transaction: {one_commit * 1000:7.2f} ms "
+                  f"({two_commits / one_commit:.1f}x)")
+            storage.close()
+    for name in ENGINES:
+        with tempfile.TemporaryDirectory() as directory:
+            storage_logic.set_data_dir(Path(directory))
+            check_consistency(make_storage(name, Path(directory), clinic), clinic, name, Path(directory))
+
+if __name__ == "__main__":
+    main(*(int(argument) if number == 0 else argument for number, argument in enumerate(sys.argv[1:3])))
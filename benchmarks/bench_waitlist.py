@@ -0,0 +1,128 @@
+# Benchmark and consistency check of the waitlist (appointments_logic.waitlist): registration
+# throughput, matching a freed slot through the heaps vs. a scan of every entry, and bursts of
+# cancellations through AppointmentStorage.remove_appointment(..., waitlist), one thread (every
+# fill must go to the entry a scan picks) and several threads (no slot booked twice, no entry
+# booked twice, the storage reloaded from disk holds the same appointments)
+# Run with: python -m benchmarks.bench_waitlist [entries] [cancellations] [threads]
+import datetime as dt
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import storage_logic
+from constants import VET_SCHEDULES, WEEKDAYS
+from appointments_logic.waitlist import BOOKED, WAITING, Waitlist
+from benchmarks.clinic import ClinicSpec, generate_clinic, installed_clinic
+
+# The reference: the best waiting entry accepting the slot, by a scan
+def scan(entries, slot, exclude: str = None):
+    candidates = [entry for entry in entries if entry.status == WAITING and entry.customer != exclude and entry.accepts(slot)]
+    return min(candidates, key=lambda entry: entry.rank) if candidates else None
+
+def register(waitlist: Waitlist, count: int, dates, generator: random.Random):
+    vets = list(VET_SCHEDULES)
+    entries = []
+    for number in range(count):
+        start = generator.choice(dates[:60])
+        entry = waitlist.register(f"Waiting {number:06d}", start, start + dt.timedelta(days=generator.randrange(28)),
+                                  vets=generator.sample(vets, generator.randint(1, 3)) if generator.random() < 0.7 else None,
+                                  weekdays=generator.sample(WEEKDAYS[:6], generator.randint(2, 6)) if generator.random() < 0.5 else None,
+                                  priority=generator.randrange(4))
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+def sequential_burst(storage, waitlist: Waitlist, entries, appointments) -> float:
+    elapsed = 0.0
+    mismatches = 0
+    for appointment in appointments:
+        expected = scan(entries, appointment.slot, appointment.customer)
+        begin = time.perf_counter()
+        replacement = storage.remove_appointment(appointment, waitlist)
+        elapsed += time.perf_counter() - begin
+        got = next((entry for entry in entries if entry.appointment is replacement), None) if replacement is not None else None
+        if got is not expected or (replacement is not None and replacement not in storage.appointments):
+            mismatches += 1
+    print(f"  1 thread: {len(appointments)} cancellations in {elapsed * 1000:.0f} ms ({len(appointments) / elapsed:,.0f}/s), "
+          f"{mismatches} fills differing from the scan")
+    assert not mismatches
+    return elapsed
+
+def concurrent_burst(storage, waitlist: Waitlist, appointments, threads: int) -> None:
+    errors = []
+
+    def canceller(chunk) -> None:
+        try:
+            for appointment in chunk:
+                storage.remove_appointment(appointment, waitlist)
+        except Exception as err:
+            errors.append(err)
+
+    workers = [threading.Thread(target=canceller, args=(appointments[number::threads],)) for number in range(threads)]
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    print(f"  {threads} threads: {len(appointments)} cancellations in {elapsed * 1000:.0f} ms ({len(appointments) / elapsed:,.0f}/s)")
+    assert not errors, errors[:3]
+
+def check(storage, waitlist: Waitlist, entries, cancelled) -> None:
+    booked = [entry for entry in entries if entry.status == BOOKED]
+    slots = [appointment.slot for appointment in storage.appointments]
+    assert len(slots) == len(set(slots)), "a slot is booked twice"
+    assert all(entry.appointment in storage.appointments and entry.accepts(entry.appointment.slot) for entry in booked)
+    assert len({entry.appointment.slot for entry in booked}) == len(booked) == waitlist.booked
+    assert sum(entry.status == WAITING for entry in entries) == len(waitlist)
+    assert not any(appointment in storage.appointments for appointment in cancelled), "a cancelled appointment is still booked"
+    print(f"  {len(booked)} waitlist entries booked, {len(waitlist)} still waiting: {waitlist.stats()}")
+
+def main(entries: int = 5000, cancellations: int = 2000, threads: int = 4) -> None:
+    logging.disable(logging.WARNING)
+    generator = random.Random(23)
+    clinic = generate_clinic(ClinicSpec(months_of_history=3, booking_density=0.85))
+    with installed_clinic(clinic), tempfile.TemporaryDirectory() as directory:
+        storage_logic.set_data_dir(Path(directory))
+        storage_logic.save_state(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+        storage = storage_logic.AppointmentStorage(journaled=True)
+        dates = clinic.dates
+        waitlist = Waitlist(today=lambda: dates[0])
+
+        begin = time.perf_counter()
+        registered = register(waitlist, entries, dates, generator)
+        elapsed = time.perf_counter() - begin
+        print(f"{len(registered)} waitlist entries registered in {elapsed * 1000:.0f} ms "
+              f"({elapsed / len(registered) * 1e6:.1f} us each): {waitlist.stats()}")
+
+        probes = [appointment.slot for appointment in generator.sample(clinic.appointments, 500)]
+        begin = time.perf_counter()
+        matched = [waitlist.peek(slot) for slot in probes]
+        heaps = (time.perf_counter() - begin) / len(probes)
+        begin = time.perf_counter()
+        expected = [scan(registered, slot) for slot in probes]
+        scanned = (time.perf_counter() - begin) / len(probes)
+        assert matched == expected, "the heaps and the scan pick different entries"
+        print(f"  best entry for a freed slot: heaps {heaps * 1e6:.1f} us | scan {scanned * 1e6:.0f} us ({scanned / heaps:.0f}x)")
+
+        # the bursts cancel appointments of the days the entries cover
+        window = set(dates[:88])
+        candidates = [appointment for appointment in clinic.appointments if appointment.slot.datetime.date() in window]
+        sample = generator.sample(candidates, min(2 * cancellations, len(candidates)))
+        sequential, concurrent = sample[:len(sample) // 2], sample[len(sample) // 2:]
+        sequential_burst(storage, waitlist, registered, sequential)
+        concurrent_burst(storage, waitlist, concurrent, threads)
+        check(storage, waitlist, registered, sample)
+
+        storage.close()
+        reloaded = storage_logic.AppointmentStorage(journaled=True)
+        assert set(reloaded.appointments) == set(storage.appointments), "the reloaded state differs"
+        print("  the state reloaded from disk matches (each cancellation + fill was one commit)")
+        reloaded.close()
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:4]))
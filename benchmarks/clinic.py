@@ -0,0 +1,116 @@
+# Deterministic synthetic clinics for the benchmarks: schedules in the shape of
+# WEEKDAY_SLOTS/VET_SCHEDULES, plus months of booking history at a given density
+import calendar
+import datetime as dt
+import random
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List
+
+import constants
+from slot_times import Slot, invalidate_slot_templates
+from appointments_logic.core import Appointment
+
+WORKING_DAYS = constants.WEEKDAYS[:6]
+
+
+@dataclass(frozen=True)
+class ClinicSpec:
+    vets: int = 5
+    # working days per vet (out of Monday..Saturday) and opening hours of a day
+    days_per_vet: int = 3
+    opening_hour: int = 9
+    closing_hour: int = 17
+    lunch_hour: int = 13
+    months_of_history: int = 3
+    # share of the scheduled slots that are booked, and of the remaining ones held as reserved
+    booking_density: float = 0.6
+    reserved_density: float = 0.05
+    customers: int = 2000
+    start: str = "2026-01-01"
+    seed: int = 7
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+# The named clinic sizes of the benchmark suite
+PROFILES: Dict[str, ClinicSpec] = {
+    "small": ClinicSpec(),
+    "medium": ClinicSpec(vets=20, days_per_vet=4, months_of_history=12, customers=20000),
+    "large": ClinicSpec(vets=60, days_per_vet=5, months_of_history=36, customers=100000),
+}
+
+
+@dataclass
+class Clinic:
+    spec: ClinicSpec
+    veterinarians: Dict[str, str]
+    weekday_slots: Dict[str, List[str]]
+    vet_schedules: Dict[str, List[str]]
+    appointments: List[Appointment] = field(default_factory=list)
+    available_slots: List[Slot] = field(default_factory=list)
+    reserved_slots: List[Slot] = field(default_factory=list)
+
+    @property
+    def dates(self) -> List[dt.date]:
+        start = dt.date.fromisoformat(self.spec.start)
+        return [start + dt.timedelta(days=day) for day in range((_history_end(self.spec) - start).days)]
+
+def _history_end(spec: ClinicSpec) -> dt.date:
+    start = dt.date.fromisoformat(spec.start)
+    month = start.month - 1 + spec.months_of_history
+    year, month = start.year + month // 12, month % 12 + 1
+    return dt.date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def make_weekday_slots(spec: ClinicSpec) -> Dict[str, List[str]]:
+    hours = [f"{hour:02d}:00" for hour in range(spec.opening_hour, spec.closing_hour) if hour != spec.lunch_hour]
+    weekday_slots = {day: list(hours) for day in WORKING_DAYS}
+    weekday_slots["Saturday"] = hours[:len(hours) // 2]
+    weekday_slots["Sunday"] = ["No working hours."]
+    return weekday_slots
+
+# The vets work on consecutive (rotated) working days, so every day is covered
+def make_vet_schedules(spec: ClinicSpec) -> Dict[str, List[str]]:
+    return {f"Dr. Synthetic {number:03d}": [WORKING_DAYS[(number + day) % len(WORKING_DAYS)] for day in range(spec.days_per_vet)]
+            for number in range(spec.vets)}
+
+def generate_clinic(spec: ClinicSpec = ClinicSpec()) -> Clinic:
+    generator = random.Random(spec.seed)
+    weekday_slots, vet_schedules = make_weekday_slots(spec), make_vet_schedules(spec)
+    veterinarians = {f"v{number:03d}": vet for number, vet in enumerate(vet_schedules)}
+    clinic = Clinic(spec, veterinarians, weekday_slots, vet_schedules)
+    customers = [f"Customer {number:06d}" for number in range(spec.customers)]
+    for date in clinic.dates:
+        weekday = constants.WEEKDAYS[date.weekday()]
+        times = [dt.datetime.combine(date, dt.time.fromisoformat(shift)) for shift in weekday_slots[weekday] if ":" in shift]
+        for vet, days in vet_schedules.items():
+            if weekday not in days:
+                continue
+            for date_time in times:
+                slot = Slot(date_time, vet)
+                draw = generator.random()
+                if draw < spec.booking_density:
+                    clinic.appointments.append(Appointment(generator.choice(customers), slot))
+                    clinic.reserved_slots.append(slot)
+                elif draw < spec.booking_density + spec.reserved_density:
+                    clinic.reserved_slots.append(slot)
+                else:
+                    clinic.available_slots.append(slot)
+    return clinic
+
+# Swaps the clinic schedule into the constants (the dictionaries are updated in place, since the
+# modules hold references to them); the slot templates and the availability caches are invalidated
+@contextmanager
+def installed_clinic(clinic: Clinic) -> Iterator[Clinic]:
+    originals = [(target, dict(target)) for target in (constants.VETERINARIANS, constants.WEEKDAY_SLOTS, constants.VET_SCHEDULES)]
+    try:
+        for (target, _), replacement in zip(originals, (clinic.veterinarians, clinic.weekday_slots, clinic.vet_schedules)):
+            target.clear()
+            target.update(replacement)
+        invalidate_slot_templates()
+        yield clinic
+    finally:
+        for target, original in originals:
+            target.clear()
+            target.update(original)
+        invalidate_slot_templates()
@@ -0,0 +1,68 @@
+# Async load generator for the booking server (server.py): throughput and tail latency
+# Run with: python -m benchmarks.load_client [--connections 1000] [--requests 20] [--book-share 0.2]
+import argparse
+import asyncio
+import datetime as dt
+import json
+import random
+import statistics
+import time
+from typing import List
+
+from constants import VETERINARIANS
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def make_request(generator: random.Random, request_id: int, customer: str, start: dt.date, book_share: float) -> dict:
+    vet = generator.choice(list(VETERINARIANS))
+    date = start + dt.timedelta(days=generator.randrange(84))
+    if generator.random() < book_share:
+        date_time = dt.datetime.combine(date, dt.time(generator.choice((9, 10, 11, 12, 14, 15, 16))))
+        return {"id": request_id, "op": "book", "customer": customer, "vet": vet, "datetime": date_time.isoformat()}
+    return {"id": request_id, "op": "availability", "vet": vet, "date": date.isoformat()}
+
+async def client(number: int, arguments, latencies: List[float], outcomes: dict) -> None:
+    generator = random.Random(number)
+    if arguments.unix:
+        reader, writer = await asyncio.open_unix_connection(arguments.unix)
+    else:
+        reader, writer = await asyncio.open_connection(arguments.host, arguments.port)
+    start = dt.date.fromisoformat(arguments.start)
+    try:
+        for request_number in range(arguments.requests):
+            request = make_request(generator, request_number, f"Customer {number}", start, arguments.book_share)
+            begin = time.perf_counter()
+            writer.write(json.dumps(request).encode("utf-8") + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - begin)
+            key = f"{request['op']} {'ok' if response['ok'] else 'rejected'}"
+            outcomes[key] = outcomes.get(key, 0) + 1
+    finally:
+        writer.close()
+
+async def main(arguments) -> None:
+    latencies: List[float] = []
+    outcomes: dict = {}
+    begin = time.perf_counter()
+    await asyncio.gather(*(client(number, arguments, latencies, outcomes) for number in range(arguments.connections)))
+    elapsed = time.perf_counter() - begin
+    print(f"{arguments.connections} connections x {arguments.requests} requests in {elapsed:.2f}s: "
+          f"{len(latencies) / elapsed:.0f} requests/sec")
+    print(f"  latency p50 {percentile(latencies, 0.50) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms, "
+          f"max {max(latencies) * 1000:.2f} ms, mean {statistics.mean(latencies) * 1000:.2f} ms")
+    print("  " + ", ".join(f"{key}: {count}" for key, count in sorted(outcomes.items())))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the booking server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None)
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--book-share", type=float, default=0.2)
+    parser.add_argument("--start", default=(dt.date.today() + dt.timedelta(days=1)).isoformat(),
+                        help="first date of the booked window (the server refuses past slots)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,193 @@
+# Benchmark suite of the hot paths on a synthetic clinic (benchmarks.clinic): ops/sec, p50/p99
+# latency and peak memory, saved as JSON and compared against a stored baseline
+# Run with: python -m benchmarks.suite [--profile small] [--operations 2000] [--output results.json]
+#                                      [--repeat 3] [--baseline PATH] [--save-baseline] [--threshold 0.25]
+# The exit status is 1 when a case regressed beyond the threshold.
+import argparse
+import datetime as dt
+import json
+import logging
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import constants
+import storage_logic
+from slot_times import make_daily_slots
+from appointments_logic.core import Appointment, update_current_appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.service import create_appointment, get_available_slots_for_vet
+from benchmarks.clinic import PROFILES, Clinic, generate_clinic, installed_clinic
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+# Operations of the whole-state cases (load_state/save_state), which take much longer each
+STATE_OPERATIONS = 5
+# Allowed relative slowdown (ops/sec, p99) or growth (peak memory) before a case is a regression
+REGRESSION_THRESHOLD = 0.25
+# Timing passes per case
+REPEAT = 3
+
+# A case prepares its data and returns the function to time with the arguments of every call
+Case = Callable[[Clinic, int, random.Random], Tuple[Callable, List[tuple]]]
+
+def make_daily_slots_case(clinic: Clinic, operations: int, generator: random.Random):
+    dates = clinic.dates
+    return make_daily_slots, [(constants.WEEKDAY_SLOTS, generator.choice(dates)) for _ in range(operations)]
+
+def available_slots_case(clinic: Clinic, operations: int, generator: random.Random):
+    dates, vets = clinic.dates, list(clinic.vet_schedules)
+    reserved = list(clinic.reserved_slots)
+    return get_available_slots_for_vet, [(generator.choice(vets), dt.datetime.combine(generator.choice(dates), dt.time()),
+                                          constants.VET_SCHEDULES, reserved) for _ in range(operations)]
+
+def create_appointment_case(clinic: Clinic, operations: int, generator: random.Random):
+    appointments = AppointmentIndex(clinic.appointments)
+    available, reserved = list(clinic.available_slots), list(clinic.reserved_slots)
+    slots = generator.sample(clinic.available_slots, min(operations, len(clinic.available_slots)))
+    return create_appointment, [(appointments, Appointment(f"New customer {number}", slot), available, reserved)
+                                for number, slot in enumerate(slots)]
+
+def update_appointment_case(clinic: Clinic, operations: int, generator: random.Random):
+    appointments = AppointmentIndex(clinic.appointments)
+    count = min(operations, len(clinic.appointments), len(clinic.available_slots))
+    old = generator.sample(clinic.appointments, count)
+    slots = generator.sample(clinic.available_slots, count)
+    return update_current_appointment, [(appointments, appointment, Appointment(appointment.customer, slot))
+                                        for appointment, slot in zip(old, slots)]
+
+# The storage cases run on a copy of the clinic saved in a temporary data directory
+def find_appointment_case(clinic: Clinic, operations: int, generator: random.Random):
+    storage = storage_logic.AppointmentStorage()
+    probes = [(appointment.customer, appointment.slot) for appointment in generator.choices(clinic.appointments, k=operations)]
+    # one lookup in ten misses
+    for index in range(0, len(probes), 10):
+        probes[index] = ("Unknown customer", probes[index][1])
+    return storage.find_appointment, probes
+
+def save_state_case(clinic: Clinic, operations: int, generator: random.Random):
+    return storage_logic.save_state, [(clinic.appointments, clinic.available_slots, clinic.reserved_slots)] * STATE_OPERATIONS
+
+def load_state_case(clinic: Clinic, operations: int, generator: random.Random):
+    return storage_logic.load_state, [()] * STATE_OPERATIONS
+
+CASES: Dict[str, Case] = {
+    "make_daily_slots": make_daily_slots_case,
+    "get_available_slots_for_vet": available_slots_case,
+    "create_appointment": create_appointment_case,
+    "update_current_appointment": update_appointment_case,
+    "AppointmentStorage.find_appointment": find_appointment_case,
+    "save_state": save_state_case,
+    "load_state": load_state_case,
+}
+
+def percentile(ordered: List[float], share: float) -> float:
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def timing_pass(case: Case, clinic: Clinic, operations: int, seed: int) -> List[float]:
+    function, calls = case(clinic, operations, random.Random(seed))
+    latencies = []
+    for arguments in calls:
+        begin = time.perf_counter()
+        function(*arguments)
+        latencies.append(time.perf_counter() - begin)
+    return latencies
+
+# Timing passes (one perf_counter pair per call; the fastest of `repeat` passes is kept, the
+# others mostly measure the noise of the machine), then a separate pass under tracemalloc for
+# the peak memory, on freshly prepared data, so the tracing does not distort the latencies
+def run_case(name: str, case: Case, clinic: Clinic, operations: int, seed: int, repeat: int = REPEAT) -> Dict:
+    latencies = min((timing_pass(case, clinic, operations, seed) for _ in range(max(1, repeat))), key=sum)
+
+    function, calls = case(clinic, operations, random.Random(seed))
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline_memory = tracemalloc.get_traced_memory()[0]
+        for arguments in calls:
+            function(*arguments)
+        peak_memory = tracemalloc.get_traced_memory()[1] - baseline_memory
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(latencies)
+    return {"operations": len(latencies), "ops_per_sec": round(len(latencies) / sum(latencies), 1),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 4), "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+            "peak_memory_kib": round(peak_memory / 1024, 1)}
+
+def run_suite(profile: str = "small", operations: int = 2000, cases: Optional[List[str]] = None, repeat: int = REPEAT) -> Dict:
+    spec = PROFILES[profile]
+    clinic = generate_clinic(spec)
+    results = {}
+    with installed_clinic(clinic), tempfile.TemporaryDirectory() as directory:
+        data_dir = storage_logic.DATA_DIR
+        storage_logic.set_data_dir(Path(directory))
+        try:
+            storage_logic.save_state(clinic.appointments, clinic.available_slots, clinic.reserved_slots)
+            for name in cases or CASES:
+                results[name] = run_case(name, CASES[name], clinic, operations, spec.seed, repeat)
+                print(f"  {name:<38} {results[name]['ops_per_sec']:>12.1f} ops/sec  p50 {results[name]['p50_ms']:>9.4f} ms  "
+                      f"p99 {results[name]['p99_ms']:>9.4f} ms  peak {results[name]['peak_memory_kib']:>10.1f} KiB")
+        finally:
+            storage_logic.set_data_dir(data_dir)
+    return {"profile": profile, "spec": spec.as_dict(), "operations": operations, "repeat": repeat,
+            "appointments": len(clinic.appointments), "python": platform.python_version(),
+            "machine": platform.machine(), "results": results}
+
+# Relative changes against the baseline; a case regresses when its throughput drops, or its p99
+# latency or peak memory grows, by more than the threshold (the memory growth is counted against
+# at least 64 KiB, so that tiny peaks do not flag)
+def compare(results: Dict, baseline: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    regressions = []
+    for name, current in results["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        throughput = current["ops_per_sec"] / previous["ops_per_sec"] - 1
+        latency = current["p99_ms"] / previous["p99_ms"] - 1 if previous["p99_ms"] else 0.0
+        memory = (current["peak_memory_kib"] - previous["peak_memory_kib"]) / max(previous["peak_memory_kib"], 64.0)
+        worse = [f"{metric} {change:+.0%}" for metric, change, regressed in
+                 (("ops/sec", throughput, throughput < -threshold), ("p99", latency, latency > threshold), ("peak memory", memory, memory > threshold))
+                 if regressed]
+        print(f"  {name:<38} ops/sec {throughput:+7.1%}  p99 {latency:+7.1%}  peak memory {memory:+7.1%}  "
+              f"{'REGRESSION' if worse else 'ok'}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+def main(arguments: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark suite of the hot paths on a synthetic clinic.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--operations", type=int, default=2000, help="calls per case (the state cases run fewer)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timing passes per case (the fastest is kept)")
+    parser.add_argument("--case", dest="cases", action="append", choices=list(CASES), help="run only this case (repeatable)")
+    parser.add_argument("--output", type=Path, default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, default=None, help="baseline to compare with (default: baselines/<profile>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    options = parser.parse_args(arguments)
+    logging.disable(logging.WARNING)
+
+    print(f"Profile '{options.profile}': {PROFILES[options.profile]}")
+    results = run_suite(options.profile, options.operations, options.cases, options.repeat)
+    if options.output is not None:
+        options.output.write_text(json.dumps(results, indent=4))
+    baseline_path = options.baseline or BASELINE_DIR / f"{options.profile}.json"
+    if options.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=4) + "\n")
+        print(f"Saved the baseline {baseline_path}.")
+        return 0
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path} (run with --save-baseline to store one).")
+        return 0
+    print(f"Compared with {baseline_path}:")
+    regressions = compare(results, json.loads(baseline_path.read_text()), options.threshold)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,137 @@
+# Logging configuration: the records are handed to a queue and written by a background thread
+# (QueueHandler/QueueListener), so the formatting and the I/O stay off the booking path, and the
+# high-frequency messages are rate-limited per message template
+import atexit
+import datetime as dt
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from slot_times import Slot
+from appointments_logic.core import Appointment
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Default rate limit: records of one message template allowed per interval (seconds); the ERROR
+# records and above are never dropped
+RATE_LIMIT_BURST = 20
+RATE_LIMIT_INTERVAL = 1.0
+
+_listener: Optional[QueueListener] = None
+
+
+# Per-template rate limit: the key is the logger and the unformatted message (the %-style
+# template), so all the "Appointment %s was added" records share one budget. The count of the
+# dropped records is reported on the next record of the template that passes.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst: int = RATE_LIMIT_BURST, interval: float = RATE_LIMIT_INTERVAL, max_level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_level = max_level
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        # key -> [window start, records in the window, records dropped in the window]
+        self._windows: Dict[Tuple[str, str], List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = f"({dropped} similar messages suppressed) {record.msg}"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed += 1
+            return False
+
+
+# Arguments that cannot change after the call; the records holding only these are formatted by
+# the listener thread, the others are formatted when they are queued (as QueueHandler does)
+IMMUTABLE_ARGUMENTS = (str, int, float, bool, type(None), bytes, frozenset, dt.date, dt.time, dt.timedelta,
+                       Slot, Appointment, BaseException)
+
+def _immutable(argument) -> bool:
+    if isinstance(argument, tuple):
+        return all(_immutable(item) for item in argument)
+    return isinstance(argument, IMMUTABLE_ARGUMENTS)
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not all(_immutable(argument) for argument in (args.values() if isinstance(args, dict) else args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+# The LogRecord attributes that cost time to collect on every call (the caller lookup walks the
+# stack); they are only collected if the format uses them (the "Optimization" section of the
+# logging HOWTO). These are settings of the logging module itself, so stop_logging() puts back
+# the values found at import.
+_COLLECTED_ATTRIBUTES = ("_srcfile", "logProcesses", "logMultiprocessing", "logThreads")
+_collected_defaults = {name: getattr(logging, name) for name in _COLLECTED_ATTRIBUTES}
+
+def _collect_only_used_attributes(log_format: str) -> None:
+    if not any(field in log_format for field in ("%(pathname)", "%(filename)", "%(module)", "%(lineno)", "%(funcName)")):
+        logging._srcfile = None
+    logging.logProcesses = "%(process)" in log_format
+    logging.logMultiprocessing = "%(processName)" in log_format
+    logging.logThreads = "%(thread)" in log_format
+    return None
+
+def _collect_all_attributes() -> None:
+    for name, value in _collected_defaults.items():
+        setattr(logging, name, value)
+    return None
+
+# Configure the root logger. With asynchronous=True (the default) the records go through a
+# queue to a listener thread that owns the real handlers; the listener is stopped (and the queue
+# drained) at exit or by stop_logging(). rate_limit=None disables the rate limiting.
+def configure_logging(level: int = logging.INFO, filename: Optional[str] = None, asynchronous: bool = True,
+                      rate_limit: Optional[Tuple[int, float]] = (RATE_LIMIT_BURST, RATE_LIMIT_INTERVAL),
+                      log_format: str = LOG_FORMAT) -> Optional[QueueListener]:
+    global _listener
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level)
+    _collect_only_used_attributes(log_format)
+
+    output = logging.FileHandler(filename, encoding="utf-8") if filename else logging.StreamHandler(sys.stderr)
+    output.setFormatter(logging.Formatter(log_format))
+    front = LazyQueueHandler(queue.SimpleQueue()) if asynchronous else output
+    if rate_limit is not None:
+        front.addFilter(RateLimitFilter(*rate_limit))
+    root.addHandler(front)
+    if asynchronous:
+        _listener = QueueListener(front.queue, output, respect_handler_level=True)
+        _listener.start()
+    return _listener
+
+# Flush the queued records and stop the listener thread; the record attributes are collected
+# again as by default
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.flush()
+        _listener = None
+    _collect_all_attributes()
+    return None
+
+atexit.register(stop_logging)
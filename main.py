@@ -1,23 +1,28 @@
-import logging
-from appointments_logic.core import (appointment_slot, appointment_customer, add_appointment, check_appointment_status, remove_appointment)
-from appointments_logic.service import create_appointment, make_appointment, get_available_slots_for_vet
-from constants import *
 import datetime as dt
 import logging
-from slot_times import * # has to be refined, can't go slot_times logic and storage_logic functions simulaneously
-from storage_logic import *
+from appointments_logic.core import (appointment_slot, appointment_customer, add_appointment, check_appointment_status, remove_appointment)
+from appointments_logic.service import create_appointment, make_appointment, get_available_slots_for_vet, get_current_day
+from constants import VETERINARIANS, VET_SCHEDULES, WEEKDAY_SLOTS
+from slot_times import subdivise_day
+from storage_logic import shared_storage
+from logging_setup import configure_logging
+from availability_logic.cache import AvailabilityCache
+
+# Defining the global logger (configured when the application starts, see logging_setup)
+logger = logging.getLogger(__name__)
+
+# The state is loaded from the storage on first use (shared_storage), not at import
 
-# Defining the global logger
-logging.basicConfig(
-  level=logging.INFO,
-  format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-  )
+# Most appointments listed by a customer search (Option [8])
+MAX_SEARCH_RESULTS = 50
 
-# Initializing the storage system
-storage = AppointmentStorage()
+# The availability per (vet, date), kept until a booking/cancel/reservation touches it
+availability_cache = AvailabilityCache()
 
-# Loading the existing state from storage:
-appointments, reserved_slots, available_slots = load_state()
+# The available slots of a vet on a date (Option [4])
+def vet_availability(vet_choice, date):
+  date_time = dt.datetime.combine(date, dt.time())
+  return get_available_slots_for_vet(vet_choice, date_time, VET_SCHEDULES, shared_storage().reserved_slots, cache=availability_cache)
 
 # Helper function to print veterinarian options: 
 def print_veterinarians(VETERINARIANS):
@@ -54,9 +59,20 @@ def make_date_time():
   time = request_time()
   return dt.datetime.combine(date, time)
 
-# Interactive helper to check an existing appointment (Option [8])
+# Interactive helper to check an existing appointment (Option [8]): the upcoming appointments
+# of the customers whose name starts with the given text
 def check_existing_appointment_interactive():
-  pass
+  prefix = input("Please, enter the customer name (or its beginning): ").strip()
+  if not prefix:
+    print("Please, enter at least one letter of the name.")
+    return None
+  appointments = shared_storage().upcoming_appointments(prefix, limit=MAX_SEARCH_RESULTS)
+  if not appointments:
+    print(f"No upcoming appointment was found for a customer starting with '{prefix}'.")
+    return None
+  for appointment in appointments:
+    print(f"{appointment.customer}: {appointment.slot.datetime:%Y-%m-%d %H:%M} with {appointment.slot.vet}")
+  return appointments
 
 # Application logic starts here:
 def main():
@@ -93,7 +109,7 @@ def main():
       print_veterinarians(VETERINARIANS)
       vet_choice = input("Please, enter the letter corresponding to the vet of your choice:\n")
       if isinstance(vet_choice, str) is False:
-        logging.error(f"The given input is not valid: {vet_choice}.")
+        logger.error("The given input is not valid: %s.", vet_choice)
         print("Please, restart the process.")
         return False
       else:
@@ -109,8 +125,8 @@ def main():
             return None
     elif message == "4":
       print("Here are our lovely veterinarians: ", list(VETERINARIANS.values()))
-      availability = get_available_slots_for_vet()
-      print(availability)
+      vet_choice = input("Please, enter the letter corresponding to the vet of your choice:\n")
+      print(sorted(vet_availability(vet_choice, request_date())))
     elif message == "5":
       pass
     elif message == "6":
@@ -118,7 +134,7 @@ def main():
     elif message == "7":
       pass
     elif message == "8":
-      pass
+      check_existing_appointment_interactive()
 
     elif message == "9":
       print("For medical emergencies, please contact our 24/7 emergency line at (555) 123-4567. Our on-call veterinarian will assist you promptly.")
@@ -127,4 +143,6 @@ def main():
       exit()     
 
 if __name__ == "__main__":
+    # records written by a background thread, see logging_setup
+    configure_logging(level=logging.INFO)
     main()
@@ -0,0 +1,313 @@
+# Operation-level metrics (counters and timers) and opt-in profiling of single requests
+#
+# The instrumentation is off by default: the timers and lock helpers then only test one module
+# flag. Enable it with enable_metrics() or the VET_METRICS=1 environment variable.
+import io
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets, as the Prometheus client defaults
+# shifted down to the microsecond range of the in-memory operations
+TIMER_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+METRIC_PREFIX = "vet_clinic"
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_enabled = os.environ.get("VET_METRICS", "") not in ("", "0")
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+def enable_metrics() -> None:
+    global _enabled
+    _enabled = True
+    return None
+
+def disable_metrics() -> None:
+    global _enabled
+    _enabled = False
+    return None
+
+def _key(name: str, labels: Optional[Dict[str, str]]) -> MetricKey:
+    return (name, tuple(sorted(labels.items())) if labels else ())
+
+
+class TimerStats:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(TIMER_BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(TIMER_BUCKETS, seconds)] += 1
+        return None
+
+    def as_dict(self) -> Dict:
+        return {"count": self.count, "total_seconds": self.total, "max_seconds": self.max,
+                "mean_seconds": self.total / self.count if self.count else 0.0,
+                "buckets": {str(bound): count for bound, count in zip(TIMER_BUCKETS + ("+Inf",), self.buckets)}}
+
+
+# The registry of the counters and timers; the updates take one short lock, so the numbers
+# stay exact under the threaded storage
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self._counters: Dict[MetricKey, float] = {}
+        self._timers: Dict[MetricKey, TimerStats] = {}
+
+    def count(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        return None
+
+    def observe(self, name: str, seconds: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            stats = self._timers.get(key)
+            if stats is None:
+                stats = self._timers[key] = TimerStats()
+            stats.observe(seconds)
+        return None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+        return None
+
+    # {"counters": {"name{label=value}": value}, "timers": {"name{...}": {...}}}
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"counters": {_display_name(key): value for key, value in sorted(self._counters.items())},
+                    "timers": {_display_name(key): stats.as_dict() for key, stats in sorted(self._timers.items())}}
+
+    # Prometheus text exposition format: the counters as counters, the timers as histograms
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted({key[0] for key in self._counters}):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_prometheus_labels(labels)} {_number(value)}"
+                             for (counter, labels), value in sorted(self._counters.items()) if counter == name)
+            for name in sorted({key[0] for key in self._timers}):
+                metric = f"{METRIC_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (timer, labels), stats in sorted(self._timers.items()):
+                    if timer != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(TIMER_BUCKETS + ("+Inf",), stats.buckets):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_prometheus_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{metric}_sum{_prometheus_labels(labels)} {_number(stats.total)}")
+                    lines.append(f"{metric}_count{_prometheus_labels(labels)} {stats.count}")
+        return "\n".join(lines) + "\n"
+
+def _display_name(key: MetricKey) -> str:
+    name, labels = key
+    return name + ("{" + ",".join(f"{label}={value}" for label, value in labels) + "}" if labels else "")
+
+def _prometheus_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + "}"
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# The process-wide registry
+METRICS = Metrics()
+
+def snapshot() -> Dict:
+    return METRICS.snapshot()
+
+def prometheus_text() -> str:
+    return METRICS.prometheus_text()
+
+def reset_metrics() -> None:
+    return METRICS.reset()
+
+# Instrumentation helpers; each one is a plain call (or a no-op context) while disabled
+def count(name: str, value: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+    if _enabled:
+        METRICS.count(name, value, labels)
+    return None
+
+@contextmanager
+def _timing(name: str, labels: Optional[Dict[str, str]]) -> Iterator[None]:
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe(name, time.perf_counter() - begin, labels)
+
+class _NoTiming:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_TIMING = _NoTiming()
+
+def timer(name: str, labels: Optional[Dict[str, str]] = None):
+    return _timing(name, labels) if _enabled else _NO_TIMING
+
+# Decorator: times every call of the function (also the ones that raise)
+def timed(name: str, labels: Optional[Dict[str, str]] = None) -> Callable:
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            begin = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.observe(name, time.perf_counter() - begin, labels)
+        return wrapper
+    return decorator
+
+# Lock acquisition with contention accounting: a lock that is free is taken without a clock
+# read; otherwise the wait is timed ("lock_wait" timer) and counted as contended
+def acquire(lock, name: str) -> None:
+    if not _enabled:
+        lock.acquire()
+        return None
+    labels = {"lock": name}
+    METRICS.count("lock_acquisitions", 1, labels)
+    if lock.acquire(blocking=False):
+        return None
+    METRICS.count("lock_contentions", 1, labels)
+    begin = time.perf_counter()
+    lock.acquire()
+    METRICS.observe("lock_wait", time.perf_counter() - begin, labels)
+    return None
+
+@contextmanager
+def acquired(lock, name: str) -> Iterator[None]:
+    acquire(lock, name)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+# The allocations of the profiling modules themselves, left out of the memory reports
+def _capture_filters() -> list:
+    import cProfile, pstats, tracemalloc
+    return [tracemalloc.Filter(False, module.__file__) for module in (cProfile, pstats, tracemalloc)] + \
+           [tracemalloc.Filter(False, __file__)]
+
+# Raised by a capture started while another one is active
+class CaptureBusyError(RuntimeError):
+    pass
+
+# A single capture at a time in the process: a second cProfile profiler fails to enable (3.12+)
+# or replaces the first one (the first disable() then stops both), and tracemalloc is global
+_capture_lock = Lock()
+
+# Opt-in capture of one request: cProfile (the functions by cumulative time) and/or tracemalloc
+# (the allocation sites by size); the reports are filled in when the block exits. The profiling
+# modules are imported by the first capture, not with the metrics. Entering a capture while
+# another one is active raises CaptureBusyError.
+class Capture:
+    def __init__(self, cpu: bool = True, memory: bool = False, top: int = 20):
+        self.cpu = cpu
+        self.memory = memory
+        self.top = top
+        self.elapsed = 0.0
+        self.cpu_report = ""
+        self.memory_report = ""
+        self.memory_peak = 0
+        self._profiler = None
+
+    def __enter__(self) -> "Capture":
+        if not _capture_lock.acquire(blocking=False):
+            raise CaptureBusyError("another capture is in progress")
+        try:
+            return self._start()
+        except BaseException:
+            _capture_lock.release()
+            raise
+
+    def _start(self) -> "Capture":
+        # all of them before the memory snapshot, so the import is not part of the report
+        import cProfile, pstats, tracemalloc
+        if self.memory:
+            # tracemalloc may already be tracing (e.g. the benchmark suite): leave it running then
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._memory_before = tracemalloc.take_snapshot()
+        if self.cpu:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        try:
+            self._stop()
+        finally:
+            _capture_lock.release()
+        return False
+
+    def _stop(self) -> None:
+        import pstats, tracemalloc
+        self.elapsed = time.perf_counter() - self._begin
+        if self._profiler is not None:
+            self._profiler.disable()
+        # the memory is read before the profile is formatted; the allocations of the profiler
+        # itself are filtered out
+        if self.memory:
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            filters = _capture_filters()
+            memory_after = tracemalloc.take_snapshot().filter_traces(filters)
+            statistics = memory_after.compare_to(self._memory_before.filter_traces(filters), "lineno")
+            self.memory_report = "\n".join(str(statistic) for statistic in statistics[:self.top])
+            if self._started_tracing:
+                tracemalloc.stop()
+        if self._profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(self._profiler, stream=output).sort_stats("cumulative").print_stats(self.top)
+            self.cpu_report = output.getvalue()
+        return None
+
+    def report(self) -> str:
+        parts = [f"elapsed: {self.elapsed * 1000:.3f} ms"]
+        if self.cpu:
+            parts.append(self.cpu_report)
+        if self.memory:
+            parts.append(f"peak traced memory: {self.memory_peak / 1024:.1f} KiB\n{self.memory_report}")
+        return "\n".join(parts)
+
+def capture(cpu: bool = True, memory: bool = False, top: int = 20) -> Capture:
+    return Capture(cpu, memory, top)
+
+# Runs one call under a capture; returns the result and the capture
+def profile_call(function: Callable, *args, cpu: bool = True, memory: bool = False, top: int = 20, **kwargs):
+    with capture(cpu, memory, top) as captured:
+        result = function(*args, **kwargs)
+    return result, captured
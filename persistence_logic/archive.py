@@ -0,0 +1,172 @@
+# Cold tier of the storage: the past appointments and slots, moved out of the working set into
+# append-only segments (gzip-compressed JSON lines, never rewritten). The manifest lists the
+# segments with the time range they cover, so a lookup only decompresses the segments that can
+# hold its answer; nothing is read before the first lookup.
+import datetime as dt
+import gzip
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from metrics import timed, timer
+from storage_logic import (atomic_read_json, atomic_write_json, deserialize_appointment, deserialize_slot,
+                           serialize_appointment, serialize_slot)
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# The record kinds of a segment (the lists of the storage state)
+SEGMENT_LISTS = ("appointments", "available_slots", "reserved_slots")
+# Decompressed segments kept in memory
+ARCHIVE_SEGMENT_CACHE = 4
+
+def segment_file_name(number: int) -> str:
+    return f"segment-{number:06d}.jsonl.gz"
+
+# Atomic write of a compressed segment (temporary file, fsync, rename)
+def write_segment_file(file_path: Path, records: Iterable[Dict]) -> None:
+    temp_file_handle, temp_file_path = tempfile.mkstemp(dir=str(file_path.parent))
+    try:
+        with os.fdopen(temp_file_handle, "wb") as temp_file:
+            with gzip.GzipFile(fileobj=temp_file, mode="wb") as compressed:
+                with timer("serialization", {"format": "archive"}):
+                    for record in records:
+                        compressed.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+            temp_file.flush()
+            with timer("fsync", {"file": "archive"}):
+                os.fsync(temp_file.fileno())
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+    return None
+
+
+class ArchiveStore:
+    def __init__(self, directory: Path, cache_segments: int = ARCHIVE_SEGMENT_CACHE):
+        self.directory = Path(directory)
+        self.cache_segments = cache_segments
+        self._manifest: Optional[List[Dict]] = None
+        self._segments: "OrderedDict[str, Dict[str, List]]" = OrderedDict()
+        self._lock = Lock()
+        self.segment_loads = 0
+
+    @property
+    def manifest(self) -> List[Dict]:
+        if self._manifest is None:
+            manifest_path = self.directory / MANIFEST_NAME
+            manifest = atomic_read_json(manifest_path) if manifest_path.exists() else {}
+            self._manifest = manifest.get("segments", []) if isinstance(manifest, dict) else []
+        return self._manifest
+
+    # Appends the given records as one segment per month (so that a lookup decompresses a month
+    # at most); the manifest is only updated once the segments are durable, so a crash leaves at
+    # worst unlisted segment files behind
+    @timed("archive_write")
+    def append(self, appointments: List, available_slots: List, reserved_slots: List) -> List[Dict]:
+        months: Dict[str, Dict[str, List]] = {}
+        for name, records in (("appointments", appointments), ("available_slots", available_slots), ("reserved_slots", reserved_slots)):
+            for record in records:
+                date_time = record.slot.datetime if name == "appointments" else record.datetime
+                months.setdefault(date_time.strftime("%Y-%m"), {list_name: [] for list_name in SEGMENT_LISTS})[name].append(record)
+        if not months:
+            return []
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            segments = list(self.manifest)
+            added = []
+            for month in sorted(months):
+                lists = months[month]
+                times = [appointment.slot.datetime for appointment in lists["appointments"]] + \
+                        [slot.datetime for slot in lists["available_slots"] + lists["reserved_slots"]]
+                number = max((segment["number"] for segment in segments + added), default=0) + 1
+                entry = {"file": segment_file_name(number), "number": number,
+                         "first": min(times).isoformat(), "last": max(times).isoformat(),
+                         **{name: len(records) for name, records in lists.items()}}
+                write_segment_file(self.directory / entry["file"], self._records(lists))
+                added.append(entry)
+            atomic_write_json(self.directory / MANIFEST_NAME, {"version": MANIFEST_VERSION, "segments": segments + added}, indent=None)
+            self._manifest = segments + added
+        logger.info("Archived %s appointments and %s slots into %s segments.", len(appointments),
+                    len(available_slots) + len(reserved_slots), len(added))
+        return added
+
+    @staticmethod
+    def _records(lists: Dict[str, List]) -> Iterator[Dict]:
+        for appointment in lists["appointments"]:
+            yield {"list": "appointments", "data": serialize_appointment(appointment)}
+        for name in ("available_slots", "reserved_slots"):
+            for slot in lists[name]:
+                yield {"list": name, "data": serialize_slot(slot)}
+
+    # The decompressed segment (kept in a small LRU)
+    def _segment(self, entry: Dict) -> Dict[str, List]:
+        with self._lock:
+            segment = self._segments.get(entry["file"])
+            if segment is not None:
+                self._segments.move_to_end(entry["file"])
+                return segment
+        segment = {name: [] for name in SEGMENT_LISTS}
+        with timer("deserialization", {"format": "archive"}):
+            with gzip.open(self.directory / entry["file"], "rb") as compressed:
+                for line in compressed:
+                    record = json.loads(line)
+                    deserialize = deserialize_appointment if record["list"] == "appointments" else deserialize_slot
+                    segment[record["list"]].append(deserialize(record["data"]))
+        with self._lock:
+            self.segment_loads += 1
+            self._segments[entry["file"]] = segment
+            while len(self._segments) > self.cache_segments:
+                self._segments.popitem(last=False)
+        return segment
+
+    # The segments that may hold records with start <= datetime < end
+    def _overlapping(self, start: Optional[dt.datetime], end: Optional[dt.datetime]) -> List[Dict]:
+        return [entry for entry in self.manifest
+                if (end is None or dt.datetime.fromisoformat(entry["first"]) < end) and
+                   (start is None or dt.datetime.fromisoformat(entry["last"]) >= start)]
+
+    # Historical lookups. The same record may be in two segments (a crash between the archiving
+    # and the rewrite of the working files archives it again), so the results are deduplicated.
+    @timed("lookup", {"layer": "archive"})
+    def between(self, start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None) -> List:
+        return self._appointments(self._overlapping(start, end), lambda appointment:
+                                  (start is None or appointment.slot.datetime >= start) and (end is None or appointment.slot.datetime < end))
+
+    def _appointments(self, entries: List[Dict], matches) -> List:
+        found = {}
+        for entry in entries:
+            for appointment in self._segment(entry)["appointments"]:
+                if matches(appointment):
+                    found[(appointment.slot.datetime, appointment.slot.vet, appointment.customer)] = appointment
+        return [found[key] for key in sorted(found)]
+
+    def slots_between(self, start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None, name: str = "reserved_slots") -> List:
+        found = set()
+        for entry in self._overlapping(start, end):
+            found.update(slot for slot in self._segment(entry)[name]
+                         if (start is None or slot.datetime >= start) and (end is None or slot.datetime < end))
+        return sorted(found)
+
+    def find(self, customer: str, slot) -> Optional[object]:
+        for appointment in self.between(slot.datetime, slot.datetime + dt.timedelta(microseconds=1)):
+            if appointment.customer == customer and appointment.slot.vet == slot.vet:
+                return appointment
+        return None
+
+    # Every segment is scanned (one at a time, through the LRU)
+    def by_customer(self, customer: str) -> List:
+        return self._appointments(self.manifest, lambda appointment: appointment.customer == customer)
+
+    def stats(self) -> Dict:
+        segments = self.manifest
+        return {"segments": len(segments), "segment_loads": self.segment_loads,
+                "bytes": sum((self.directory / entry["file"]).stat().st_size for entry in segments),
+                **{name: sum(entry[name] for entry in segments) for name in SEGMENT_LISTS}}
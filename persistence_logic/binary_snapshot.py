@@ -0,0 +1,216 @@
+# Binary snapshot format, memory-mapped on load; the Python objects are only built on demand
+#
+# Layout (native byte order, recorded in the header):
+#   header      MAGIC, then the counts and offsets below as unsigned 64-bit integers
+#   strings     sorted string table (vets and customers): uint64 offsets (count + 1), utf-8 blob
+#   columns     per list, fixed-width columns: int64 minutes, uint32 vet id (+ uint32 customer id
+#               for the appointments); each list is sorted by (minutes, vet, customer)
+# The minutes are counted from the proleptic ordinal epoch (as the Slot key), so only whole
+# minutes are kept.
+import bisect
+from array import array
+import datetime as dt
+import logging
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from slot_times import Slot
+from appointments_logic.core import Appointment
+from persistence_logic.engines import State
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+MAGIC = b"VETSNAP1"
+BYTE_ORDER = b"L" if sys.byteorder == "little" else b"B"
+# counts: strings, blob size, appointments, available slots, reserved slots
+HEADER = struct.Struct("=8sc7x5Q")
+COLUMN_ALIGNMENT = 8
+
+# Minutes <-> datetime conversions
+def datetime_minutes(datetime: dt.datetime) -> int:
+    return datetime.toordinal() * 1440 + datetime.hour * 60 + datetime.minute
+
+def minutes_datetime(minutes: int) -> dt.datetime:
+    days, minutes = divmod(minutes, 1440)
+    return dt.datetime.fromordinal(days) + dt.timedelta(minutes=minutes)
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % COLUMN_ALIGNMENT)
+
+# Write the state as a binary snapshot (atomically, as the JSON files)
+def write_snapshot(file_path: Path, appointments: Iterable, available_slots: Iterable, reserved_slots: Iterable) -> None:
+    appointments = list(appointments)
+    available_slots, reserved_slots = list(available_slots), list(reserved_slots)
+    strings = sorted({appointment.customer for appointment in appointments} |
+                     {appointment.slot.vet for appointment in appointments} |
+                     {slot.vet for slot in available_slots} | {slot.vet for slot in reserved_slots})
+    string_ids = {string: index for index, string in enumerate(strings)}
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    blob = b"".join(encoded)
+
+    appointment_rows = sorted((datetime_minutes(appointment.slot.datetime), string_ids[appointment.slot.vet], string_ids[appointment.customer])
+                              for appointment in appointments)
+    available_rows = sorted((datetime_minutes(slot.datetime), string_ids[slot.vet]) for slot in available_slots)
+    reserved_rows = sorted((datetime_minutes(slot.datetime), string_ids[slot.vet]) for slot in reserved_slots)
+
+    parts = [HEADER.pack(MAGIC, BYTE_ORDER, len(strings), len(blob), len(appointment_rows), len(available_rows), len(reserved_rows))]
+    parts.append(array("Q", offsets).tobytes())
+    parts.append(blob + _padding(len(blob)))
+    for rows, columns in ((appointment_rows, ("q", "I", "I")), (available_rows, ("q", "I")), (reserved_rows, ("q", "I"))):
+        for position, code in enumerate(columns):
+            column = array(code, (row[position] for row in rows)).tobytes()
+            parts.append(column + _padding(len(column)))
+
+    file_path = Path(file_path)
+    temp_path = file_path.with_name(file_path.name + ".tmp")
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(temp_path, "wb") as snapshot_file:
+        for part in parts:
+            snapshot_file.write(part)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, file_path)
+    logger.info("Wrote the binary snapshot %s (%s appointments).", file_path, len(appointment_rows))
+    return None
+
+
+# A memory-mapped snapshot. The queries read the columns directly (binary search on the
+# minutes); Slot/Appointment objects are only built for the records that are returned.
+class BinarySnapshot:
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self._file = open(self.file_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, byte_order, strings, blob_size, appointments, available, reserved = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.file_path} is not a binary snapshot.")
+        if byte_order != BYTE_ORDER:
+            raise ValueError(f"{self.file_path} was written with a different byte order.")
+        view = memoryview(self._map)
+        position = HEADER.size
+
+        def column(code: str, count: int, size: int):
+            nonlocal position
+            data = view[position:position + count * size].cast(code)
+            position += count * size + (-(count * size) % COLUMN_ALIGNMENT)
+            return data
+
+        self._offsets = column("Q", strings + 1, 8)
+        self._blob = view[position:position + blob_size]
+        position += blob_size + (-blob_size % COLUMN_ALIGNMENT)
+        self._appointment_minutes = column("q", appointments, 8)
+        self._appointment_vets = column("I", appointments, 4)
+        self._appointment_customers = column("I", appointments, 4)
+        self._available_minutes = column("q", available, 8)
+        self._available_vets = column("I", available, 4)
+        self._reserved_minutes = column("q", reserved, 8)
+        self._reserved_vets = column("I", reserved, 4)
+        self._string_count = strings
+        self._strings: Dict[int, str] = {}
+
+    # String table access (decoded and cached on first use)
+    def string(self, string_id: int) -> str:
+        value = self._strings.get(string_id)
+        if value is None:
+            value = self._strings[string_id] = bytes(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]]).decode("utf-8")
+        return value
+
+    # The id of a string, by binary search in the sorted table (None if absent)
+    def string_id(self, value: str) -> Optional[int]:
+        low, high = 0, self._string_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.string(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self._string_count and self.string(low) == value else None
+
+    def __len__(self) -> int:
+        return len(self._appointment_minutes)
+
+    # The raw appointment columns (minutes, vet string ids, customer string ids), as views of the
+    # mapping (e.g. for numpy.frombuffer); valid until close()
+    def appointment_columns(self) -> Tuple[memoryview, memoryview, memoryview]:
+        return self._appointment_minutes, self._appointment_vets, self._appointment_customers
+
+    # Object builders
+    def appointment(self, index: int) -> Appointment:
+        slot = Slot(minutes_datetime(self._appointment_minutes[index]), self.string(self._appointment_vets[index]))
+        return Appointment(self.string(self._appointment_customers[index]), slot)
+
+    def appointments(self) -> Iterator[Appointment]:
+        return (self.appointment(index) for index in range(len(self)))
+
+    def _slots(self, minutes, vets) -> Iterator[Slot]:
+        return (Slot(minutes_datetime(minutes[index]), self.string(vets[index])) for index in range(len(minutes)))
+
+    def _range(self, minutes, start: dt.datetime, end: dt.datetime) -> Tuple[int, int]:
+        return bisect.bisect_left(minutes, datetime_minutes(start)), bisect.bisect_left(minutes, datetime_minutes(end))
+
+    # Queries on the columns
+    def has_appointment(self, customer: str, slot: Slot) -> bool:
+        vet_id, customer_id = self.string_id(slot.vet), self.string_id(customer)
+        if vet_id is None or customer_id is None:
+            return False
+        minutes = datetime_minutes(slot.datetime)
+        index = bisect.bisect_left(self._appointment_minutes, minutes)
+        while index < len(self) and self._appointment_minutes[index] == minutes:
+            if self._appointment_vets[index] == vet_id and self._appointment_customers[index] == customer_id:
+                return True
+            index += 1
+        return False
+
+    def _contains_slot(self, minutes_column, vets_column, slot: Slot) -> bool:
+        vet_id = self.string_id(slot.vet)
+        if vet_id is None:
+            return False
+        minutes = datetime_minutes(slot.datetime)
+        index = bisect.bisect_left(minutes_column, minutes)
+        while index < len(minutes_column) and minutes_column[index] == minutes:
+            if vets_column[index] == vet_id:
+                return True
+            index += 1
+        return False
+
+    def is_booked(self, slot: Slot) -> bool:
+        return self._contains_slot(self._appointment_minutes, self._appointment_vets, slot)
+
+    def is_reserved(self, slot: Slot) -> bool:
+        return self._contains_slot(self._reserved_minutes, self._reserved_vets, slot)
+
+    # The booked and reserved slots of a vet between start and end (for the availability queries)
+    def taken_slots(self, vet: str, start: dt.datetime, end: dt.datetime) -> List[Slot]:
+        vet_id = self.string_id(vet)
+        if vet_id is None:
+            return []
+        taken = []
+        for minutes_column, vets_column in ((self._appointment_minutes, self._appointment_vets), (self._reserved_minutes, self._reserved_vets)):
+            low, high = self._range(minutes_column, start, end)
+            taken.extend(Slot(minutes_datetime(minutes_column[index]), vet) for index in range(low, high) if vets_column[index] == vet_id)
+        return taken
+
+    def appointments_between(self, start: dt.datetime, end: dt.datetime) -> List[Appointment]:
+        low, high = self._range(self._appointment_minutes, start, end)
+        return [self.appointment(index) for index in range(low, high)]
+
+    # Full materialization (as load_state)
+    def load(self) -> State:
+        return (list(self.appointments()), list(self._slots(self._available_minutes, self._available_vets)),
+                list(self._slots(self._reserved_minutes, self._reserved_vets)))
+
+    def close(self) -> None:
+        for name in ("_offsets", "_blob", "_appointment_minutes", "_appointment_vets", "_appointment_customers",
+                     "_available_minutes", "_available_vets", "_reserved_minutes", "_reserved_vets"):
+            getattr(self, name).release()
+        self._map.close()
+        self._file.close()
+        return None
@@ -0,0 +1,61 @@
+# Storage engine interface behind AppointmentStorage
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# The in-memory state handled by the engines: appointments, available slots, reserved slots
+State = Tuple[List, List, List]
+
+# Raised by the engines that enforce one booking/reservation per slot
+class DoubleBookingError(Exception):
+    def __init__(self, message, slot=None):
+        super().__init__(message)
+        self.slot = slot
+
+# Raised when a transaction does not hold against the current state; none of its operations
+# are applied
+class TransactionError(Exception):
+    pass
+
+
+# Base class for the storage engines. The mutations are handed over as the journal records
+# ("add", "remove", "update", "reserve" with their serialized data), so that every engine
+# can decide between a single-row write and a full rewrite of the state. A transaction is
+# handed over as one "batch" ({"records": [...]}) that is persisted all or none.
+class StorageEngine:
+    name = "base"
+
+    # Read the whole state (appointments, available slots, reserved slots)
+    def load(self) -> State:
+        raise NotImplementedError
+
+    # Write the whole state
+    def save(self, appointments, available_slots, reserved_slots) -> None:
+        raise NotImplementedError
+
+    # Persist one mutation; may return a handle that wait() blocks on (deferred durability)
+    def commit(self, operation: str, data: Dict, state: State):
+        raise NotImplementedError
+
+    def wait(self, pending) -> None:
+        if pending is not None:
+            pending.wait()
+        return None
+
+    # Whether the engine wants checkpoint() to be called (e.g. a journal that grew too long)
+    def needs_checkpoint(self) -> bool:
+        return False
+
+    def checkpoint(self, state: State) -> None:
+        return None
+
+    def close(self, state: State) -> None:
+        return None
+
+    # Where a file kept with the engine's data goes (e.g. the series log), so that two storages
+    # of different engines/paths do not share it; None: the default data directory
+    def companion_path(self, name: str) -> Optional[Path]:
+        return None
@@ -0,0 +1,105 @@
+# Group commit writer: concurrent mutations share one journal write and one fsync
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from persistence_logic.journal import Journal
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Default latency window (seconds) and the upper bound of records flushed together
+GROUP_COMMIT_LATENCY = 0.0005
+GROUP_COMMIT_MAX_BATCH = 512
+
+
+# A queued record; the caller waits on it until the batch holding it is durable
+class PendingRecord:
+    __slots__ = ("record", "done", "error")
+
+    def __init__(self, record: Dict):
+        self.record = record
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> None:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return None
+
+
+class GroupCommitWriter:
+    def __init__(self, journal: Journal, latency: float = GROUP_COMMIT_LATENCY, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.journal = journal
+        self.latency = latency
+        self.max_batch = max_batch
+        self.batches = 0
+        self.records = 0
+        self._queue: "queue.Queue[Optional[PendingRecord]]" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    # Queue a record without waiting; the returned handle is released once the record is durable
+    def submit(self, op: str, data: Dict) -> PendingRecord:
+        if self._closed:
+            raise RuntimeError("The group commit writer is closed.")
+        pending = PendingRecord({"op": op, "data": data})
+        self._queue.put(pending)
+        return pending
+
+    # Queue a record and block until it is durable
+    def write(self, op: str, data: Dict) -> None:
+        self.submit(op, data).wait()
+        return None
+
+    # Collect the records arriving within the latency window (or until max_batch)
+    def _collect(self, first: PendingRecord) -> List[PendingRecord]:
+        batch = [first]
+        deadline = time.monotonic() + self.latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                # keep the stop marker for _run, after this last batch is flushed
+                self._queue.put(None)
+                break
+            batch.append(pending)
+        return batch
+
+    def _flush(self, batch: List[PendingRecord]) -> None:
+        try:
+            self.journal.append_many([pending.record for pending in batch])
+            self.batches += 1
+            self.records += len(batch)
+        except BaseException as err:
+            logger.error("Group commit of %s records failed: %s", len(batch), err)
+            for pending in batch:
+                pending.error = err
+        finally:
+            for pending in batch:
+                pending.done.set()
+        return None
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            self._flush(self._collect(first))
+        return None
+
+    # Flush what is queued and stop the writer thread
+    def close(self) -> None:
+        if self._closed:
+            return None
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        return None
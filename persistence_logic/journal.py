@@ -0,0 +1,140 @@
+# Append-only write-ahead journal for the storage mutations
+import json
+import logging
+import os
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Tuple
+
+from metrics import count, timer
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# The journaled operations; a "batch" record ({"records": [...]}) carries the operations of one
+# transaction, so they are replayed all or none
+BATCHED_OPERATIONS = ("add", "remove", "reserve", "update")
+JOURNAL_OPERATIONS = BATCHED_OPERATIONS + ("batch",)
+
+# Customer exception for the journal records
+class JournalError(Exception):
+    pass
+
+# One record per line: "<crc32 in hex> <json payload>\n"; the checksum catches torn/partial writes
+def encode_record(record: Dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+def decode_record(line: bytes, operations: Tuple[str, ...] = JOURNAL_OPERATIONS) -> Dict:
+    if not line.endswith(b"\n"):
+        raise JournalError("The record is truncated (missing the line terminator).")
+    checksum, _, payload = line.rstrip(b"\n").partition(b" ")
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            raise JournalError("The record checksum does not match.")
+        record = json.loads(payload)
+    except ValueError as err:
+        raise JournalError(f"The record could not be decoded: {err}") from err
+    if record.get("op") not in operations:
+        raise JournalError(f"Unknown journal operation: {record.get('op')}.")
+    return record
+
+
+# `operations` are the record types the journal accepts (the storage mutations by default)
+class Journal:
+    def __init__(self, file_path: Path, operations: Tuple[str, ...] = JOURNAL_OPERATIONS):
+        self.file_path = Path(file_path)
+        self.operations = operations
+        self._lock = Lock()
+        self._file = None
+        self.records_since_checkpoint = 0
+
+    def _open(self):
+        if self._file is None:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.file_path, "ab")
+        return self._file
+
+    # Append a single record and make it durable (one write, one fsync)
+    def append(self, op: str, data: Dict) -> None:
+        self.append_many([{"op": op, "data": data}])
+        return None
+
+    # Append several records with one write and one fsync
+    def append_many(self, records: List[Dict]) -> None:
+        for record in records:
+            if record.get("op") not in self.operations:
+                raise JournalError(f"Unknown journal operation: {record.get('op')}.")
+            if record["op"] == "batch" and any(inner.get("op") not in BATCHED_OPERATIONS for inner in record["data"]["records"]):
+                raise JournalError("A batch record may only hold add, remove, reserve and update records.")
+        buffer = b"".join(encode_record(record) for record in records)
+        with self._lock:
+            journal_file = self._open()
+            journal_file.write(buffer)
+            journal_file.flush()
+            with timer("fsync", {"file": "journal"}):
+                os.fsync(journal_file.fileno())
+            self.records_since_checkpoint += len(records)
+        count("journal_records", len(records))
+        return None
+
+    # Read back the valid records; a torn tail record (crash during the write) is cut off the file
+    def replay(self) -> Iterator[Dict]:
+        if not self.file_path.exists():
+            return iter(())
+        records = []
+        valid_size = 0
+        with self._lock, open(self.file_path, "rb") as journal_file:
+            for line in journal_file:
+                try:
+                    records.append(decode_record(line, self.operations))
+                except JournalError as err:
+                    logger.warning("Journal %s: dropping the tail from offset %s. Reason: %s", self.file_path, valid_size, err)
+                    break
+                valid_size += len(line)
+        if valid_size < self.file_path.stat().st_size:
+            with self._lock, open(self.file_path, "r+b") as journal_file:
+                journal_file.truncate(valid_size)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        self.records_since_checkpoint = len(records)
+        return iter(records)
+
+    # Replace the whole journal by these records (written to a temporary file, then renamed),
+    # e.g. to compact it
+    def rewrite(self, records: List[Dict]) -> None:
+        buffer = b"".join(encode_record(record) for record in records)
+        temp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, "wb") as journal_file:
+                journal_file.write(buffer)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            os.replace(temp_path, self.file_path)
+            self.records_since_checkpoint = len(records)
+        return None
+
+    # Empty the journal once its records are part of the snapshot files
+    def reset(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.file_path, "wb") as journal_file:
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self.records_since_checkpoint = 0
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return None
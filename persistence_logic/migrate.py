@@ -0,0 +1,87 @@
+# Migration tool: convert the JSON data files (and a pending journal) into an SQLite database
+# Run with: python -m persistence_logic.migrate [--force] [database path]
+#       or: python -m persistence_logic.migrate [--force] --shards [shard directory]
+# The JSON files must all exist and decode (a bad source is not read as an empty clinic), and a
+# target that already holds data is only overwritten with --force.
+import logging
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+from persistence_logic.sqlite_engine import SQLiteStorageEngine
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# A slot holds one booking (see AppointmentStorage), but JSON data written before the rule was
+# enforced may book one twice: the first booking of a slot (in the order of the data files) is
+# migrated, the others are left out and returned
+def split_double_bookings(appointments: List) -> Tuple[List, List]:
+    kept, duplicates = [], []
+    booked = set()
+    for appointment in appointments:
+        key = (appointment.slot.datetime, appointment.slot.vet)
+        (duplicates if key in booked else kept).append(appointment)
+        booked.add(key)
+    return kept, duplicates
+
+# The left-out bookings are logged and written to a report next to the migrated data, to be
+# rebooked by hand
+def report_double_bookings(duplicates: List, report_path: Path) -> None:
+    import storage_logic
+
+    if not duplicates:
+        return None
+    for appointment in duplicates:
+        logger.warning("Appointment %s was not migrated: its slot is already booked.", appointment)
+    storage_logic.atomic_write_json(report_path, [storage_logic.serialize_appointment(appointment) for appointment in duplicates])
+    logger.warning("%s double bookings were left out of the migration; they are listed in %s.", len(duplicates), report_path)
+    return None
+
+def migrate_json_to_sqlite(database_path: Path = None, force: bool = False) -> SQLiteStorageEngine:
+    # imported here so that the storage module reads its file locations at call time
+    import storage_logic
+
+    database_path = Path(database_path) if database_path is not None else storage_logic.SQLITE_FILE
+    appointments, available_slots, reserved_slots = storage_logic.load_state(strict=True)
+    appointments, duplicates = split_double_bookings(appointments)
+    engine = SQLiteStorageEngine(database_path)
+    if not force and any(engine.load()):
+        engine.close(None)
+        raise FileExistsError(f"The database {database_path} already holds data; use --force to overwrite it.")
+    engine.save(appointments, available_slots, reserved_slots)
+    report_double_bookings(duplicates, database_path.with_name(f"{database_path.stem}.duplicates.json"))
+    logger.info("Migrated %s appointments, %s available slots and %s reserved slots into %s.",
+                len(appointments), len(available_slots), len(reserved_slots), database_path)
+    return engine
+
+# Convert the JSON data files (and a pending journal) into the (vet, month) shards
+def migrate_json_to_shards(shard_dir: Path = None, force: bool = False):
+    import storage_logic
+    from persistence_logic.sharded_engine import ShardedStorageEngine
+
+    shard_dir = Path(shard_dir) if shard_dir is not None else storage_logic.SHARDS_DIR
+    appointments, available_slots, reserved_slots = storage_logic.load_state(strict=True)
+    appointments, duplicates = split_double_bookings(appointments)
+    engine = ShardedStorageEngine(shard_dir)
+    if not force and engine.shard_keys():
+        raise FileExistsError(f"The shard directory {shard_dir} already holds data; use --force to overwrite it.")
+    engine.save(appointments, available_slots, reserved_slots)
+    report_double_bookings(duplicates, shard_dir.with_name(f"{shard_dir.name}.duplicates.json"))
+    logger.info("Migrated %s appointments into %s shards in %s.", len(appointments), len(engine.shard_keys()), shard_dir)
+    return engine
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    arguments = sys.argv[1:]
+    force = "--force" in arguments
+    arguments = [argument for argument in arguments if argument != "--force"]
+    try:
+        if arguments and arguments[0] == "--shards":
+            migrate_json_to_shards(arguments[1] if len(arguments) > 1 else None, force)
+        else:
+            migrated = migrate_json_to_sqlite(arguments[0] if arguments else None, force)
+            migrated.close(None)
+    except (OSError, ValueError) as err:
+        logger.error("The migration was not done: %s", err)
+        sys.exit(1)
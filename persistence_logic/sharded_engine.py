@@ -0,0 +1,293 @@
+# Sharded JSON storage engine: one file per (vet, month) plus a small manifest
+import datetime as dt
+import logging
+import re
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from persistence_logic.engines import DoubleBookingError, State, StorageEngine
+from storage_logic import (atomic_read_json, atomic_write_json, deserialize_appointment, deserialize_slot,
+                           serialize_appointment, serialize_slot, unpack_records)
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+# The changes of a multi-shard batch, written before its shards and removed once they are all
+# written (or the batch failed and was undone); found on load, after a crash, it is rolled forward
+INTENT_NAME = "intent.json"
+MANIFEST_VERSION = 1
+# The lists kept in every shard, as in the monolithic files
+SHARD_LISTS = ("appointments", "available_slots", "reserved_slots")
+
+ShardKey = Tuple[str, str]
+
+# A shard is identified by the vet and the month ("YYYY-MM") of the slot
+def shard_key(vet: str, datetime: str) -> ShardKey:
+    return (vet, datetime[:7])
+
+# The directory of a vet is a readable slug followed by the hex of the name (UTF-8): the slug
+# alone maps "Dr. A", "Dr A" and "Dr-A" to the same place, the hex keeps the names apart (also on
+# case-insensitive file systems). The manifest keeps the file of every shard, so the shards
+# written under an older naming stay where they are.
+def shard_file_name(key: ShardKey) -> str:
+    vet, month = key
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', vet).strip('_')
+    return f"{slug + '_' if slug else ''}{vet.encode('utf-8').hex()}/{month}.json"
+
+def _month(date: dt.date) -> str:
+    return f"{date.year:04d}-{date.month:02d}"
+
+# Record keys inside a shard (the serialized records are kept as they are written)
+def _appointment_record_key(record: Dict) -> Tuple:
+    return (record["customer"], record["slot"]["datetime"], record["slot"]["vet"])
+
+def _slot_record_key(record: Dict) -> Tuple:
+    return (record["datetime"], record["vet"])
+
+
+class ShardedStorageEngine(StorageEngine):
+    name = "sharded"
+
+    # start/end (dates) restrict load() to the shards of the months in between
+    def __init__(self, shard_dir: Path, start: Optional[dt.date] = None, end: Optional[dt.date] = None):
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.start = start
+        self.end = end
+        self._lock = Lock()
+        self._manifest: Dict[str, Dict] = self._read_manifest()
+        # loaded shards: key -> list name -> record key -> serialized record
+        self._shards: Dict[ShardKey, Dict[str, Dict]] = {}
+        self._shard_locks: Dict[ShardKey, Lock] = {}
+        self._roll_forward()
+
+    # Manifest: "<vet>|<month>" -> {"vet", "month", "file"}
+    def _read_manifest(self) -> Dict[str, Dict]:
+        manifest = atomic_read_json(self.shard_dir / MANIFEST_NAME) if (self.shard_dir / MANIFEST_NAME).exists() else {}
+        shards = manifest.get("shards", {}) if isinstance(manifest, dict) else {}
+        files: Dict[str, str] = {}
+        for manifest_key, entry in shards.items():
+            other = files.setdefault(entry["file"], manifest_key)
+            if other != manifest_key:
+                logger.warning("The shards %s and %s share the file %s (older naming); their records are mixed.",
+                               other, manifest_key, entry["file"])
+        return shards
+
+    def _write_manifest(self) -> None:
+        atomic_write_json(self.shard_dir / MANIFEST_NAME, {"version": MANIFEST_VERSION, "shards": self._manifest})
+        return None
+
+    def shard_keys(self, start: Optional[dt.date] = None, end: Optional[dt.date] = None):
+        low = _month(start) if start is not None else None
+        high = _month(end) if end is not None else None
+        return [(entry["vet"], entry["month"]) for entry in self._manifest.values()
+                if (low is None or entry["month"] >= low) and (high is None or entry["month"] <= high)]
+
+    # Loads a shard on first use (also the shards outside the loaded range, before rewriting them)
+    def _shard(self, key: ShardKey) -> Dict[str, Dict]:
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = {name: {} for name in SHARD_LISTS}
+            entry = self._manifest.get("|".join(key))
+            if entry is not None:
+                data = atomic_read_json(self.shard_dir / entry["file"])
+                data = data if isinstance(data, dict) else {}
+                for record in data.get("appointments", []):
+                    shard["appointments"][_appointment_record_key(record)] = record
+                for name in ("available_slots", "reserved_slots"):
+                    for record in data.get(name, []):
+                        shard[name][_slot_record_key(record)] = record
+            self._shards[key] = shard
+        return shard
+
+    # Registers a new shard in the manifest (called while holding self._lock)
+    def _register_shard(self, key: ShardKey) -> Dict:
+        manifest_key = "|".join(key)
+        entry = self._manifest.get(manifest_key)
+        if entry is None:
+            entry = {"vet": key[0], "month": key[1], "file": shard_file_name(key)}
+            (self.shard_dir / entry["file"]).parent.mkdir(parents=True, exist_ok=True)
+            self._manifest[manifest_key] = entry
+            self._write_manifest()
+        return entry
+
+    # Writes one shard under its own lock; the contents are read once the lock is held, so the
+    # last writer of a shard always writes its latest contents
+    def _write_shard(self, key: ShardKey, entry: Dict) -> None:
+        with self._shard_lock(key):
+            shard = self._shards[key]
+            contents = {name: list(shard[name].values()) for name in SHARD_LISTS}
+            atomic_write_json(self.shard_dir / entry["file"], contents, indent=None)
+        return None
+
+    def _shard_lock(self, key: ShardKey) -> Lock:
+        shard_lock = self._shard_locks.get(key)
+        if shard_lock is None:
+            shard_lock = self._shard_locks.setdefault(key, Lock())
+        return shard_lock
+
+    def load(self) -> State:
+        return self.load_range(self.start, self.end)
+
+    # The state of the months between start and end (every shard if they are None)
+    def load_range(self, start: Optional[dt.date] = None, end: Optional[dt.date] = None) -> State:
+        appointments, available_slots, reserved_slots = [], [], []
+        with self._lock:
+            keys = self.shard_keys(start, end)
+            for key in keys:
+                shard = self._shard(key)
+                appointments.extend(deserialize_appointment(record) for record in shard["appointments"].values())
+                available_slots.extend(deserialize_slot(record) for record in shard["available_slots"].values())
+                reserved_slots.extend(deserialize_slot(record) for record in shard["reserved_slots"].values())
+        logger.info("Successfully loaded %s shards from %s.", len(keys), self.shard_dir)
+        return appointments, available_slots, reserved_slots
+
+    def _in_range(self, key: ShardKey) -> bool:
+        month = key[1]
+        return ((self.start is None or month >= _month(self.start)) and
+                (self.end is None or month <= _month(self.end)))
+
+    # Full rewrite of the shards of the loaded range; the shards outside it only hold part of
+    # their records in memory, they are kept up to date by commit() instead
+    def save(self, appointments: Iterable, available_slots: Iterable, reserved_slots: Iterable) -> None:
+        with self._lock:
+            shards: Dict[ShardKey, Dict[str, Dict]] = {}
+            def bucket(vet: str, datetime: str, name: str) -> Dict:
+                return shards.setdefault(shard_key(vet, datetime), {list_name: {} for list_name in SHARD_LISTS})[name]
+            for appointment in appointments:
+                record = serialize_appointment(appointment)
+                bucket(record["slot"]["vet"], record["slot"]["datetime"], "appointments")[_appointment_record_key(record)] = record
+            for name, slots in (("available_slots", available_slots), ("reserved_slots", reserved_slots)):
+                for slot in slots:
+                    record = serialize_slot(slot)
+                    bucket(record["vet"], record["datetime"], name)[_slot_record_key(record)] = record
+            # the loaded shards that have no records left are rewritten empty
+            for key in self._shards:
+                shards.setdefault(key, {list_name: {} for list_name in SHARD_LISTS})
+            shards = {key: shard for key, shard in shards.items() if self._in_range(key)}
+            self._shards.update(shards)
+            entries = {key: self._register_shard(key) for key in shards}
+        for key, entry in entries.items():
+            self._write_shard(key, entry)
+        return None
+
+    # A mutation rewrites only the shard(s) of its slot(s); mutations of different shards write
+    # in parallel. A "batch" over several shards is all or none: its changes are written to the
+    # intent file first, then its shards (each one atomically) while holding the engine lock, so
+    # no other change goes in between; a crash in between is rolled forward on load. A failed
+    # write undoes the changes in the loaded shards (and on disk for the shards already written).
+    def commit(self, operation: str, data: Dict, state: State):
+        with self._lock:
+            changes = []
+            for change, record in unpack_records([{"op": operation, "data": data}]):
+                if change in ("add", "remove", "reserve"):
+                    changes.append((change, record))
+                elif change == "update":
+                    changes.extend([("remove", record["old"]), ("add", record["new"])])
+                else:
+                    raise ValueError(f"Unknown storage operation: {change}.")
+            if len({self._change_key(change, record) for change, record in changes}) > 1:
+                return self._commit_batch(changes)
+            touched, undo = self._apply_changes(changes)
+        try:
+            for key, entry in touched.items():
+                self._write_shard(key, entry)
+        except Exception:
+            with self._lock:
+                self._revert(undo)
+            raise
+        return None
+
+    # A multi-shard batch (called while holding self._lock)
+    def _commit_batch(self, changes: List) -> None:
+        intent_path = self.shard_dir / INTENT_NAME
+        atomic_write_json(intent_path, {"changes": changes}, indent=None)
+        touched, undo, written = {}, [], []
+        try:
+            touched, undo = self._apply_changes(changes)
+            for key, entry in touched.items():
+                self._write_shard(key, entry)
+                written.append(key)
+        except Exception:
+            self._revert(undo)
+            try:
+                for key in written:
+                    self._write_shard(key, touched[key])
+            except Exception as err:
+                # the intent is kept: on load the batch is rolled forward, the shards agree again
+                logger.error("The shards of a failed transaction could not be restored: %s", err)
+                raise
+            intent_path.unlink()
+            raise
+        intent_path.unlink()
+        return None
+
+    @staticmethod
+    def _change_key(change: str, record: Dict) -> ShardKey:
+        if change == "reserve":
+            return shard_key(record["vet"], record["datetime"])
+        return shard_key(record["slot"]["vet"], record["slot"]["datetime"])
+
+    # Apply the changes to the loaded shards (called while holding self._lock); the changes are
+    # idempotent, so a batch can be applied again. Returns the manifest entries of the shards and
+    # the steps that undo the changes (see _revert); if a change fails, the previous ones are undone.
+    # An "add" on a slot booked by another appointment raises DoubleBookingError, as the SQLite
+    # UNIQUE constraint does: the storage only checks the shards of its loaded range.
+    def _apply_changes(self, changes, check: bool = True) -> Tuple[Dict[ShardKey, Dict], List]:
+        touched = {}
+        undo = []
+        try:
+            for change, record in changes:
+                key = self._change_key(change, record)
+                if change == "reserve":
+                    records, record_key = self._shard(key)["reserved_slots"], _slot_record_key(record)
+                else:
+                    records, record_key = self._shard(key)["appointments"], _appointment_record_key(record)
+                    if change == "add" and check and self._slot_booked(records, record_key):
+                        raise DoubleBookingError(f"The slot is already taken (add): {record['slot']}", slot=record["slot"])
+                undo.append((records, record_key, records.get(record_key)))
+                if change == "remove":
+                    records.pop(record_key, None)
+                else:
+                    records[record_key] = record
+                touched[key] = self._register_shard(key)
+        except BaseException:
+            self._revert(undo)
+            raise
+        return touched, undo
+
+    @staticmethod
+    def _slot_booked(appointments: Dict, record_key: Tuple) -> bool:
+        return any(key[1:] == record_key[1:] and key != record_key for key in appointments)
+
+    # Puts back the records as they were before the changes, latest first
+    @staticmethod
+    def _revert(undo: List) -> None:
+        for records, record_key, previous in reversed(undo):
+            if previous is None:
+                records.pop(record_key, None)
+            else:
+                records[record_key] = previous
+        return None
+
+    # A batch interrupted between its shard writes: its changes (checked before the intent was
+    # written) are applied again and its shards rewritten, then the intent is removed
+    def _roll_forward(self) -> None:
+        intent_path = self.shard_dir / INTENT_NAME
+        if not intent_path.exists():
+            return None
+        intent = atomic_read_json(intent_path)
+        changes = intent.get("changes", []) if isinstance(intent, dict) else []
+        with self._lock:
+            touched, _ = self._apply_changes(changes, check=False)
+        for key, entry in touched.items():
+            self._write_shard(key, entry)
+        intent_path.unlink()
+        logger.warning("Rolled forward an interrupted transaction of %s changes over %s shards.", len(changes), len(touched))
+        return None
+
+    # In the shard directory, with the manifest
+    def companion_path(self, name: str) -> Path:
+        return self.shard_dir / name
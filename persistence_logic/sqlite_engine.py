@@ -0,0 +1,143 @@
+# SQLite storage engine: single-row mutations, double-booking rejected by the database
+import datetime as dt
+import logging
+import sqlite3
+from pathlib import Path
+from threading import RLock
+from typing import Dict, Iterable
+
+from slot_times import Slot
+from appointments_logic.core import Appointment
+from persistence_logic.engines import DoubleBookingError, State, StorageEngine
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# The schema; a slot is a (datetime, vet) pair, stored as ISO text (sorts chronologically)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY,
+    customer TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    vet TEXT NOT NULL,
+    UNIQUE (datetime, vet)
+);
+CREATE INDEX IF NOT EXISTS appointments_vet_datetime ON appointments (vet, datetime);
+CREATE INDEX IF NOT EXISTS appointments_customer ON appointments (customer);
+CREATE TABLE IF NOT EXISTS available_slots (
+    datetime TEXT NOT NULL,
+    vet TEXT NOT NULL,
+    PRIMARY KEY (datetime, vet)
+);
+CREATE TABLE IF NOT EXISTS reserved_slots (
+    datetime TEXT NOT NULL,
+    vet TEXT NOT NULL,
+    PRIMARY KEY (datetime, vet)
+);
+"""
+
+# The statements (parametrized, so sqlite3 prepares them once and reuses them from its cache)
+INSERT_APPOINTMENT = "INSERT INTO appointments (customer, datetime, vet) VALUES (?, ?, ?)"
+DELETE_APPOINTMENT = "DELETE FROM appointments WHERE customer = ? AND datetime = ? AND vet = ?"
+INSERT_RESERVED_SLOT = "INSERT INTO reserved_slots (datetime, vet) VALUES (?, ?)"
+RESTORE_RESERVED_SLOT = "INSERT OR IGNORE INTO reserved_slots (datetime, vet) VALUES (?, ?)"
+INSERT_AVAILABLE_SLOT = "INSERT OR IGNORE INTO available_slots (datetime, vet) VALUES (?, ?)"
+
+# Row helpers for the serialized records
+def _appointment_row(data: Dict):
+    return (data["customer"], data["slot"]["datetime"], data["slot"]["vet"])
+
+def _slot_row(data: Dict):
+    return (data["datetime"], data["vet"])
+
+def _slot(datetime: str, vet: str) -> Slot:
+    return Slot(datetime=dt.datetime.fromisoformat(datetime), vet=vet)
+
+
+class SQLiteStorageEngine(StorageEngine):
+    name = "sqlite"
+
+    def __init__(self, database_path: Path):
+        self.database_path = Path(database_path)
+        self.database_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = RLock()
+        # the connection is shared by the threads; every use goes through self._lock
+        self._connection = sqlite3.connect(str(self.database_path), check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(SCHEMA)
+
+    def load(self) -> State:
+        with self._lock:
+            cursor = self._connection.cursor()
+            appointments = [Appointment(customer, _slot(datetime, vet)) for customer, datetime, vet in
+                            cursor.execute("SELECT customer, datetime, vet FROM appointments ORDER BY id")]
+            available_slots = [_slot(datetime, vet) for datetime, vet in
+                               cursor.execute("SELECT datetime, vet FROM available_slots ORDER BY datetime, vet")]
+            reserved_slots = [_slot(datetime, vet) for datetime, vet in
+                              cursor.execute("SELECT datetime, vet FROM reserved_slots ORDER BY datetime, vet")]
+        logger.info("Successfully loaded the state/data from the SQLite database %s.", self.database_path)
+        return appointments, available_slots, reserved_slots
+
+    # Full rewrite, used by the migration and by AppointmentStorage.save()
+    def save(self, appointments: Iterable, available_slots: Iterable, reserved_slots: Iterable) -> None:
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("DELETE FROM appointments")
+                cursor.execute("DELETE FROM available_slots")
+                cursor.execute("DELETE FROM reserved_slots")
+                cursor.executemany(INSERT_APPOINTMENT, ((appointment.customer, appointment.slot.datetime.isoformat(), appointment.slot.vet) for appointment in appointments))
+                cursor.executemany(INSERT_AVAILABLE_SLOT, ((slot.datetime.isoformat(), slot.vet) for slot in available_slots))
+                cursor.executemany(RESTORE_RESERVED_SLOT, ((slot.datetime.isoformat(), slot.vet) for slot in reserved_slots))
+                cursor.execute("COMMIT")
+            except sqlite3.Error as err:
+                cursor.execute("ROLLBACK")
+                logger.error("An error has occured while saving the state to %s: %s", self.database_path, err)
+                raise err
+        return None
+
+    @staticmethod
+    def _execute(cursor, operation: str, data: Dict) -> None:
+        if operation == "add":
+            cursor.execute(INSERT_APPOINTMENT, _appointment_row(data))
+        elif operation == "remove":
+            cursor.execute(DELETE_APPOINTMENT, _appointment_row(data))
+        elif operation == "update":
+            cursor.execute(DELETE_APPOINTMENT, _appointment_row(data["old"]))
+            cursor.execute(INSERT_APPOINTMENT, _appointment_row(data["new"]))
+        elif operation == "reserve":
+            cursor.execute(INSERT_RESERVED_SLOT, _slot_row(data))
+        else:
+            raise ValueError(f"Unknown storage operation: {operation}.")
+        return None
+
+    # Single-row mutations, each one in its own transaction; the operations of a "batch" share one
+    def commit(self, operation: str, data: Dict, state: State):
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                if operation == "batch":
+                    for record in data["records"]:
+                        self._execute(cursor, record["op"], record["data"])
+                else:
+                    self._execute(cursor, operation, data)
+                cursor.execute("COMMIT")
+            except sqlite3.IntegrityError as err:
+                cursor.execute("ROLLBACK")
+                raise DoubleBookingError(f"The slot is already taken ({operation}): {err}", slot=data) from err
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        return None
+
+    def close(self, state: State) -> None:
+        with self._lock:
+            self._connection.close()
+        return None
+
+    # next to the database, named after it: appointments.db -> appointments.series.log
+    def companion_path(self, name: str) -> Path:
+        return self.database_path.with_name(f"{self.database_path.stem}.{name}")
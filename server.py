@@ -0,0 +1,420 @@
+# Asyncio booking service: newline-delimited JSON requests over a TCP or Unix socket
+#
+# Requests (one JSON object per line; "id" is echoed back):
+#   {"id": 1, "op": "availability", "vet": "a", "date": "2026-10-19"}
+#   {"id": 2, "op": "book", "customer": "Ann", "vet": "a", "datetime": "2026-10-19T09:00"}
+#   {"id": 3, "op": "cancel", "customer": "Ann", "vet": "a", "datetime": "2026-10-19T09:00"}
+#   {"id": 4, "op": "status", "customer": "Ann", "vet": "a", "datetime": "2026-10-19T09:00"}
+#   {"id": 5, "op": "next", "from": "2026-10-19T09:00", "count": 5, "vets": ["a", "b"], "weekdays": ["Monday"]}
+#   {"id": 6, "op": "metrics", "format": "prometheus"}          (or "json"; needs --metrics)
+#   {"id": 7, "op": "reschedule", "customer": "Ann", "vet": "a", "datetime": "2026-10-19T09:00",
+#    "new_vet": "b", "new_datetime": "2026-10-20T10:00"}         (one transaction; "new_vet" defaults to "vet")
+#   {"id": 8, "op": "search", "prefix": "an", "from": "2026-10-19T00:00", "limit": 20}   (upcoming, by customer name)
+#   {"id": 9, "op": "waitlist", "customer": "Ann", "from": "2026-10-19", "to": "2026-10-30", "vets": ["a"],
+#    "weekdays": ["Monday"], "priority": 0}                    (returns the entry id; "vets"/"weekdays" default to all)
+#   {"id": 10, "op": "withdraw", "entry": 12}
+#   {"id": 11, "op": "series", "customer": "Ann", "vet": "a", "datetime": "2026-10-19T09:00", "frequency": "weekly",
+#    "interval": 1, "count": 52, "until": "2027-10-18", "skip_conflicts": false}
+#                                                              (returns the series id; "count" and/or "until")
+# The occurrences of a series are cancelled, rescheduled and checked like single appointments.
+# A cancelled slot goes to the best matching waitlist entry, booked in the cancellation's transaction.
+# Slots in the past are refused (book, reschedule, series).
+# With --profile-requests, a request carrying "profile": "cpu", "memory" or "both" is run under
+# cProfile/tracemalloc and its report is added to the response ("profile"); a profiled request
+# runs alone (the other requests wait for it, and it waits for the ones in flight).
+# Responses: {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}
+import argparse
+import asyncio
+import datetime as dt
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from constants import VET_SCHEDULES
+from slot_times import make_daily_slots, make_slot, vet_name
+from appointments_logic.core import make_appointment
+from appointments_logic.series import make_rule
+from appointments_logic.locking import LOCK_STRIPES, vet_day_key
+from appointments_logic.service import get_available_slots_for_vet
+from appointments_logic.waitlist import Waitlist
+from availability_logic.bitset import AvailabilityBitset
+from availability_logic.horizon import HORIZON_DAYS, AvailabilityHorizon
+from availability_logic.search import next_free_slots
+from persistence_logic.engines import TransactionError
+from storage_logic import AppointmentStorage
+import metrics
+from logging_setup import configure_logging
+
+# Logger initialization
+logger = logging.getLogger(__name__)
+
+# Threads used for the blocking persistence calls (they share the group commits)
+PERSISTENCE_WORKERS = 32
+# Most slots returned by one "next" request
+MAX_NEXT_SLOTS = 100
+# Most appointments returned by one "search" request
+MAX_SEARCH_RESULTS = 100
+# Longest accepted request line (bytes)
+MAX_REQUEST_SIZE = 64 * 1024
+
+# Customer exception for the rejected requests
+class RequestError(Exception):
+    pass
+
+
+class BookingServer:
+    def __init__(self, storage: AppointmentStorage, executor: ThreadPoolExecutor = None, profile_requests: bool = False,
+                 horizon: Optional[AvailabilityHorizon] = None, waitlist: Optional[Waitlist] = None):
+        self.storage = storage
+        # the customers waiting for a cancellation; a freed slot is offered to them first
+        self.waitlist = waitlist if waitlist is not None else Waitlist()
+        self.profile_requests = profile_requests
+        # the availability queries inside the horizon window are read from it, if given
+        self.horizon = horizon
+        self.executor = executor or ThreadPoolExecutor(max_workers=PERSISTENCE_WORKERS, thread_name_prefix="persistence")
+        # the availability is answered from the bitset, kept in sync with the bookings below
+        self.availability = AvailabilityBitset(list(storage.reserved_slots) + [appointment.slot for appointment in storage.appointments]
+                                               + [appointment.slot for appointment in storage.series.occurrences_between(dt.datetime.now())])
+        # asyncio locks striped by vet-day (a fixed number, whatever the requests send): the check
+        # and the booking of a slot happen under the stripe, while the persistence runs in the executor
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self.connections = 0
+        # with profile_requests, a profiled request runs alone (see _admission)
+        self._admitted = asyncio.Condition()
+        self._in_flight = 0
+        self._profiling = False
+        self._profiled_waiting = 0
+
+    def _lock(self, slot) -> asyncio.Lock:
+        return self._locks[hash(vet_day_key(slot)) % len(self._locks)]
+
+    # The stripes of several slots, each once and in index order (two vet-days may share one)
+    def _locks_of(self, slots) -> List[asyncio.Lock]:
+        return [self._locks[index] for index in sorted({hash(vet_day_key(slot)) % len(self._locks) for slot in slots})]
+
+    # With profile_requests, a profiled request waits for the requests in flight and holds the new
+    # ones back until it is done, so that its profile only holds its own work (the other coroutines
+    # would run in its awaits otherwise); the profiled requests also run one at a time. Without
+    # profile_requests, the requests are not gated.
+    @asynccontextmanager
+    async def _admission(self, profiled: bool) -> AsyncIterator[None]:
+        if not self.profile_requests:
+            yield
+            return
+        async with self._admitted:
+            if profiled:
+                self._profiled_waiting += 1
+                try:
+                    await self._admitted.wait_for(lambda: not self._profiling and not self._in_flight)
+                finally:
+                    self._profiled_waiting -= 1
+                    # the requests held back for it may go if it was cancelled
+                    self._admitted.notify_all()
+                self._profiling = True
+            else:
+                await self._admitted.wait_for(lambda: not self._profiling and not self._profiled_waiting)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._admitted:
+                self._in_flight -= 1
+                if profiled:
+                    self._profiling = False
+                self._admitted.notify_all()
+
+    async def _persist(self, function, *arguments):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *arguments)
+
+    # Request parsing helpers
+    @staticmethod
+    def _vet(request: Dict) -> str:
+        vet = vet_name(str(request.get("vet")))
+        if vet is None:
+            raise RequestError(f"unknown vet: {request.get('vet')}")
+        return vet
+
+    def _appointment(self, request: Dict):
+        customer = request.get("customer")
+        if not isinstance(customer, str) or not customer:
+            raise RequestError("a customer name is required")
+        try:
+            date_time = dt.datetime.fromisoformat(request["datetime"])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError("a datetime in the format YYYY-MM-DDTHH:MM is required")
+        return make_appointment(customer, make_slot(date_time, self._vet(request)))
+
+    # A single appointment or an occurrence of a series
+    def _booked(self, appointment) -> bool:
+        return appointment in self.storage.appointments or self.storage.series.find(appointment.customer, appointment.slot) is not None
+
+    @staticmethod
+    def _not_past(slot) -> None:
+        if slot.datetime < dt.datetime.now():
+            raise RequestError("the slot is in the past")
+        return None
+
+    # Operations
+    async def availability_op(self, request: Dict):
+        try:
+            date = dt.date.fromisoformat(request["date"])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError("a date in the format YYYY-MM-DD is required")
+        date_time = dt.datetime.combine(date, dt.time())
+        slots = get_available_slots_for_vet(self._vet(request), date_time, VET_SCHEDULES, (), availability=self.availability,
+                                            horizon=self.horizon)
+        return [slot.datetime.isoformat(timespec="minutes") for slot in sorted(slots)]
+
+    async def next_op(self, request: Dict):
+        try:
+            start = dt.datetime.fromisoformat(request["from"]) if "from" in request else dt.datetime.now()
+            count = int(request.get("count", 5))
+        except (TypeError, ValueError):
+            raise RequestError("a datetime in the format YYYY-MM-DDTHH:MM and an integer count are required")
+        if not 0 < count <= MAX_NEXT_SLOTS:
+            raise RequestError(f"the count must be between 1 and {MAX_NEXT_SLOTS}")
+        vets = request.get("vets")
+        if vets is not None:
+            vets = [self._vet({"vet": vet}) for vet in vets]
+        slots = next_free_slots(start, count, vets=vets, weekdays=request.get("weekdays"), availability=self.availability)
+        return [{"vet": slot.vet, "datetime": slot.datetime.isoformat(timespec="minutes")} for slot in slots]
+
+    async def book_op(self, request: Dict):
+        appointment = self._appointment(request)
+        slot = appointment.slot
+        self._not_past(slot)
+        async with self._lock(slot):
+            if slot not in make_daily_slots(None, slot.datetime.date()) or not self.availability.is_free(slot):
+                raise RequestError("the slot is either reserved or unavailable")
+            self.availability.take(slot)
+            try:
+                added = await self._persist(self.storage.add_appointment, appointment)
+            except BaseException:
+                self.availability.release(slot)
+                raise
+            if added is None:
+                self.availability.release(slot)
+                raise RequestError("the appointment was not booked: the slot is already taken")
+        return True
+
+    async def cancel_op(self, request: Dict):
+        appointment = self._appointment(request)
+        async with self._lock(appointment.slot):
+            if not self._booked(appointment):
+                raise RequestError("the appointment was not found")
+            refilled = await self._persist(self.storage.remove_appointment, appointment, self.waitlist)
+            # the slot stays taken if it went to the waitlist
+            if refilled is None:
+                self.availability.release(appointment.slot)
+        return True
+
+    # The cancellation of the old appointment and the booking of the new one are a single
+    # storage transaction (one durable commit); the stripes of both vet-days are locked, in index order
+    async def reschedule_op(self, request: Dict):
+        old_appointment = self._appointment(request)
+        new_appointment = self._appointment({"customer": old_appointment.customer, "vet": request.get("new_vet", request.get("vet")),
+                                             "datetime": request.get("new_datetime")})
+        old_slot, new_slot = old_appointment.slot, new_appointment.slot
+        if new_slot == old_slot:
+            raise RequestError("the new slot is the current one")
+        self._not_past(new_slot)
+        async with AsyncExitStack() as stack:
+            for lock in self._locks_of((old_slot, new_slot)):
+                await stack.enter_async_context(lock)
+            if not self._booked(old_appointment):
+                raise RequestError("the appointment was not found")
+            if new_slot not in make_daily_slots(None, new_slot.datetime.date()) or not self.availability.is_free(new_slot):
+                raise RequestError("the new slot is either reserved or unavailable")
+            self.availability.take(new_slot)
+            try:
+                await self._persist(self._reschedule, old_appointment, new_appointment)
+            except TransactionError as err:
+                self.availability.release(new_slot)
+                raise RequestError(f"the appointment could not be rescheduled: {err}")
+            except BaseException:
+                self.availability.release(new_slot)
+                raise
+            self.availability.release(old_slot)
+        return True
+
+    def _reschedule(self, old_appointment, new_appointment) -> None:
+        if old_appointment not in self.storage.appointments:
+            # a series occurrence is moved as an exception of its series
+            return self.storage.update_appointment(old_appointment, new_appointment)
+        with self.storage.transaction() as transaction:
+            transaction.reschedule(old_appointment, new_appointment)
+        return None
+
+    async def search_op(self, request: Dict):
+        prefix = request.get("prefix")
+        if not isinstance(prefix, str) or not prefix:
+            raise RequestError("a customer name prefix is required")
+        try:
+            since = dt.datetime.fromisoformat(request["from"]) if "from" in request else None
+            limit = int(request.get("limit", MAX_SEARCH_RESULTS))
+        except (TypeError, ValueError):
+            raise RequestError("a datetime in the format YYYY-MM-DDTHH:MM and an integer limit are required")
+        if not 0 < limit <= MAX_SEARCH_RESULTS:
+            raise RequestError(f"the limit must be between 1 and {MAX_SEARCH_RESULTS}")
+        return [{"customer": appointment.customer, "vet": appointment.slot.vet, "datetime": appointment.slot.datetime.isoformat(timespec="minutes")}
+                for appointment in self.storage.upcoming_appointments(prefix, since, limit)]
+
+    async def waitlist_op(self, request: Dict):
+        try:
+            start = dt.date.fromisoformat(request["from"])
+            end = dt.date.fromisoformat(request["to"]) if "to" in request else None
+            priority = int(request.get("priority", 0))
+        except (KeyError, TypeError, ValueError):
+            raise RequestError("a date range in the format YYYY-MM-DD and an integer priority are required")
+        vets = request.get("vets")
+        if vets is not None:
+            vets = [self._vet({"vet": vet}) for vet in vets]
+        entry = self.waitlist.register(request.get("customer"), start, end, vets=vets, weekdays=request.get("weekdays"),
+                                       priority=priority)
+        if entry is None:
+            raise RequestError("the waitlist entry is not valid")
+        return entry.id
+
+    async def withdraw_op(self, request: Dict):
+        entry_id = request.get("entry")
+        if not isinstance(entry_id, int):
+            raise RequestError("an integer waitlist entry id is required")
+        if not self.waitlist.withdraw(entry_id):
+            raise RequestError("the waitlist entry is not waiting")
+        return True
+
+    async def status_op(self, request: Dict):
+        return self._booked(self._appointment(request))
+
+    # The stripes of every vet-day of the series are locked, in index order, while it is checked and booked
+    async def series_op(self, request: Dict):
+        appointment = self._appointment(request)
+        try:
+            until = dt.date.fromisoformat(request["until"]) if request.get("until") else None
+        except (TypeError, ValueError):
+            raise RequestError("the end of the series must be a date in the format YYYY-MM-DD")
+        rule = make_rule(appointment.slot.datetime, request.get("frequency", "weekly"), request.get("interval", 1),
+                         request.get("count"), until)
+        if rule is None:
+            raise RequestError("the series rule is not valid")
+        self._not_past(appointment.slot)
+        async with AsyncExitStack() as stack:
+            for lock in self._locks_of(make_slot(moment, appointment.slot.vet) for _, moment in rule.occurrences()):
+                await stack.enter_async_context(lock)
+            series = await self._persist(self.storage.book_series, appointment.customer, appointment.slot.vet, rule,
+                                         bool(request.get("skip_conflicts", False)))
+            if series is None:
+                raise RequestError("the series conflicts with booked, reserved or unscheduled slots")
+            self.availability.take_many(occurrence.slot for occurrence in series.occurrences())
+        return series.id
+
+    async def metrics_op(self, request: Dict):
+        if request.get("format", "json") == "prometheus":
+            return metrics.prometheus_text()
+        return metrics.snapshot()
+
+    OPERATIONS = {"availability": availability_op, "book": book_op, "cancel": cancel_op, "status": status_op,
+                  "next": next_op, "metrics": metrics_op, "reschedule": reschedule_op,
+                  "search": search_op, "waitlist": waitlist_op, "withdraw": withdraw_op,
+                  "series": series_op}
+
+    async def handle_request(self, line: bytes) -> Dict:
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("the request must be a JSON object")
+            request_id = request.get("id")
+            operation = self.OPERATIONS.get(request.get("op"))
+            if operation is None:
+                raise RequestError(f"unknown operation: {request.get('op')}")
+            mode = request.get("profile")
+            profiled = bool(mode) and self.profile_requests
+            async with self._admission(profiled):
+                if profiled:
+                    # the capture covers the event loop thread only (not the persistence executor)
+                    with metrics.capture(cpu=mode in ("cpu", "both", True), memory=mode in ("memory", "both")) as captured:
+                        result = await operation(self, request)
+                    return {"id": request_id, "ok": True, "result": result, "profile": captured.report()}
+                with metrics.timer("request", {"op": request.get("op")}):
+                    result = await operation(self, request)
+                return {"id": request_id, "ok": True, "result": result}
+        except metrics.CaptureBusyError as err:
+            return {"id": request_id, "ok": False, "error": f"the request could not be profiled: {err}"}
+        except (RequestError, ValueError) as err:
+            return {"id": request_id, "ok": False, "error": str(err)}
+        except Exception as err:
+            logger.error("The request %s failed: %s", request_id, err)
+            return {"id": request_id, "ok": False, "error": "internal error"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b'{"id": null, "ok": false, "error": "request too long"}\n')
+                    break
+                if not line:
+                    break
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+        return None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, unix_path: Optional[str] = None):
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_path, limit=MAX_REQUEST_SIZE, backlog=4096)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_SIZE, backlog=4096)
+
+    def close(self) -> None:
+        if self.horizon is not None:
+            self.horizon.close()
+        self.executor.shutdown(wait=True)
+        self.storage.close()
+        return None
+
+
+async def serve(host: str, port: int, unix_path: Optional[str] = None, profile_requests: bool = False,
+                archive_days: Optional[int] = None, horizon_days: int = HORIZON_DAYS) -> None:
+    storage = AppointmentStorage(group_commit=True)
+    if archive_days is not None:
+        storage.archive(dt.datetime.combine(dt.date.today() - dt.timedelta(days=archive_days), dt.time()))
+    horizon = AvailabilityHorizon(storage, horizon_days).start_worker() if horizon_days > 0 else None
+    booking_server = BookingServer(storage, profile_requests=profile_requests, horizon=horizon)
+    server = await booking_server.start(host, port, unix_path)
+    logger.info("Booking server listening on %s.", unix_path or f"{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        booking_server.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vet clinic booking server (newline-delimited JSON).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", dest="unix_path", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--metrics", action="store_true", help="collect the operation metrics (the \"metrics\" op)")
+    parser.add_argument("--profile-requests", action="store_true", help="honour the \"profile\" field of the requests")
+    parser.add_argument("--archive-after", type=int, default=None, metavar="DAYS",
+                        help="at startup, archive the appointments and slots older than DAYS days")
+    parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS, metavar="DAYS",
+                        help="days of availability materialized ahead by a background worker (0 disables it)")
+    arguments = parser.parse_args()
+    if arguments.metrics:
+        metrics.enable_metrics()
+    configure_logging(level=logging.WARNING)
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.unix_path, arguments.profile_requests, arguments.archive_after,
+                          arguments.horizon_days))
+    except KeyboardInterrupt:
+        pass
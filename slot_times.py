@@ -1,18 +1,112 @@
 import logging
 import datetime as dt
 from constants import *
-from dataclasses import dataclass
-from appointments_logic.service import get_current_day, find_vet_schedule
-from typing import Dict, List, Tuple, Set
+import sys
+from dataclasses import FrozenInstanceError
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple, Set
+from appointments_logic import events
 
 # Logger initialization
 logger = logging.getLogger(__name__)
 
-# Defining the Slot class
-@dataclass(order=True)
+# The clinic vet names are interned and numbered, so that the slots can share them and carry a
+# compact key. Any other vet name (read from a data file or a request) is not kept: its slots all
+# share the last id, and their equality and hash also look at the name.
+VET_ID_SPACE = 1 << 16
+OTHER_VET_ID = VET_ID_SPACE - 1
+_vet_ids: Dict[str, int] = {}
+_vet_names: Dict[str, str] = {}
+
+def intern_vet(vet: str) -> Tuple[str, int]:
+    vet_id = _vet_ids.get(vet)
+    if vet_id is None:
+        return vet, OTHER_VET_ID
+    return _vet_names[vet], vet_id
+
+# The clinic vets get the ids, in the VET_SCHEDULES order
+for _vet in VET_SCHEDULES:
+    _vet_names[_vet] = sys.intern(_vet)
+    _vet_ids[_vet] = len(_vet_ids)
+assert len(_vet_ids) <= OTHER_VET_ID, "too many vets for the compact slot keys"
+
+# Compact integer key of a slot: minutes since 0001-01-01 (proleptic ordinal) and the vet id
+def compact_slot_key(datetime: dt.datetime, vet_id: int) -> int:
+    assert 0 <= vet_id < VET_ID_SPACE
+    minutes = datetime.toordinal() * 1440 + datetime.hour * 60 + datetime.minute
+    return minutes * VET_ID_SPACE + vet_id
+
+# Defining the Slot class: immutable, hashable (hash cached), without a per-instance __dict__.
+# Slots are ordered by time, then by vet id (the VET_SCHEDULES order for the clinic vets, the
+# other vets after them, by name).
 class Slot:
-    datetime: dt.datetime
-    vet: str
+    __slots__ = ("datetime", "vet", "_key", "_hash")
+
+    def __init__(self, datetime: dt.datetime, vet: str):
+        key = key_hash = None
+        if isinstance(datetime, dt.datetime) and isinstance(vet, str):
+            vet, vet_id = intern_vet(vet)
+            key = compact_slot_key(datetime, vet_id)
+            key_hash = hash(key) if vet_id != OTHER_VET_ID else hash((key, vet))
+        object.__setattr__(self, "datetime", datetime)
+        object.__setattr__(self, "vet", vet)
+        object.__setattr__(self, "_key", key)
+        object.__setattr__(self, "_hash", key_hash)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        return (Slot, (self.datetime, self.vet))
+
+    def __repr__(self) -> str:
+        return f"Slot(datetime={self.datetime!r}, vet={self.vet!r})"
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            return hash((self.datetime, self.vet))
+        return self._hash
+
+    # the key only covers whole minutes (and not the names of the other vets), so equal keys
+    # still compare the datetimes and the names (the interned clinic names compare by identity)
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not Slot:
+            return NotImplemented
+        if self._key is None or other._key is None:
+            return (self.datetime, self.vet) == (other.datetime, other.vet)
+        return self._key == other._key and self.datetime == other.datetime and self.vet == other.vet
+
+    def _order(self, other):
+        if self._key is None or other._key is None or self._key == other._key:
+            return (self.datetime, self.vet), (other.datetime, other.vet)
+        return self._key, other._key
+
+    def __lt__(self, other) -> bool:
+        if other.__class__ is not Slot:
+            return NotImplemented
+        mine, theirs = self._order(other)
+        return mine < theirs
+
+    def __le__(self, other) -> bool:
+        if other.__class__ is not Slot:
+            return NotImplemented
+        mine, theirs = self._order(other)
+        return mine <= theirs
+
+    def __gt__(self, other) -> bool:
+        if other.__class__ is not Slot:
+            return NotImplemented
+        mine, theirs = self._order(other)
+        return mine > theirs
+
+    def __ge__(self, other) -> bool:
+        if other.__class__ is not Slot:
+            return NotImplemented
+        mine, theirs = self._order(other)
+        return mine >= theirs
 
 # Customer exception with context
 class InvalidSlotError(Exception):
@@ -41,9 +135,17 @@ def check_slot_error(slot):
         check_slot_format(slot)
         return True, None
     except InvalidSlotError as err:
-        logger.error(f"Slot format error: {err}")
+        logger.error("Slot format error: %s", err)
         return False, str(err)        
 
+# Check if the slot is part of the given slots
+def check_slot(slots, slot) -> bool:
+    valid, not_valid = check_slot_error(slot)
+    if not valid:
+        logger.warning("Can't check slot: slot not valid: %s", not_valid)
+        return False
+    return slot in slots
+
 # Basic layer of slot-time logic
 def make_slot(datetime, vet):
     return Slot(datetime=datetime, vet=vet)
@@ -54,74 +156,149 @@ def slot_vet(slot):
 def slot_date_time(slot):
     return slot.datetime
 
-# Adding a slot
+# Adding a slot (to a set, or to a list such as the storage reserved_slots)
 def add_slot(slots: Set[Slot], slot: Slot) -> Set[Slot]:
     valid, not_valid = check_slot_error(slot)
     if not valid:
-        logger.warning(f"Can't add slot: slot not valid: {not_valid}")
+        logger.warning("Can't add slot: slot not valid: %s", not_valid)
+        return slots
+    elif slot in slots:
+        logger.info("The slot already exists. Please, try again.")
         return slots
-    elif not(slot in slots and valid):
-        logger.info(f"UNKNOWN ERROR. Either the slot already exists or there is another issue. Please, try again.")
     else:
-        slots.add(slot)
-        logger.info(f"Slot added successfully.")
+        if isinstance(slots, list):
+            slots.append(slot)
+        else:
+            slots.add(slot)
+        logger.info("Slot added successfully.")
         return slots
     
 # Removing a slot
 def remove_slot(slots: Set[Slot], slot: Slot) -> Set[Slot]:
     valid, not_valid =check_slot_error(slot)
     if not valid:
-        logger.warning(f"Can't remove slot: slot not valid: {not_valid}")
+        logger.warning("Can't remove slot: slot not valid: %s", not_valid)
         return slots
     else:
         try:
             slots.remove(slot)
-            logger.info(f"Slot removed successfully.")
+            logger.info("Slot removed successfully.")
             return slots
         except KeyError:
-            logger.error(f"Can't remove slot: slot not found in slots.")
+            logger.error("Can't remove slot: slot not found in slots.")
             return slots
 
 # Defining the slot duration, appointment=1 hour
 SLOT_DURATION = dt.timedelta(hours=1)
 
-# The possible slots for a given day
-def subdivise_day(schedule: List[str], day: dt.date) -> List[dt.datetime]:
-    possible_slots = []
-    working_day = get_current_day(day)
-    shifts = find_vet_schedule(schedule, working_day)
+# Number of recently materialized dates kept by make_daily_slots
+DAILY_SLOTS_CACHE_SIZE = 512
+
+# Minute offsets (from midnight) of the slot starts of one shift string:
+# "09:00" is a single slot, "09:00-12:00" is subdivided into SLOT_DURATION slots
+@lru_cache(maxsize=None)
+def shift_offsets(shift: str) -> Tuple[int, ...]:
+    step = int(SLOT_DURATION.total_seconds() // 60)
+    start_string, _, end_string = shift.partition("-")
+    start_hour, start_minute = start_string.strip().split(":")
+    start = int(start_hour) * 60 + int(start_minute)
+    if not end_string:
+        return (start,)
+    end_hour, end_minute = end_string.strip().split(":")
+    return tuple(range(start, int(end_hour) * 60 + int(end_minute), step))
 
+# The minute offsets for a whole list of shifts; None for the non-working days
+def day_offsets(shifts: List[str]) -> Optional[Tuple[int, ...]]:
+    offsets = []
     for shift in shifts:
-        if "No working hours" in shift: 
-            print(shift)
+        if "No working hours" in shift:
             return None
-        else:
-            start_string, end_string = shift.split("-")
-            start_hour = dt.datetime.strptime(start_string, "%H:%M").time()
-            end_hour = dt.datetime.strptime(end_string, "%H:%M").time()
-            start_dt = dt.datetime.combine(day, start_hour)
-            end_dt = dt.datetime.combine(day, end_hour)
-            current = start_dt
-            while current < end_dt:
-                possible_slots.append(current)
-                current += SLOT_DURATION
-    return possible_slots
-  
-# Make the daily schedule slots
+        offsets.extend(shift_offsets(shift))
+    return tuple(sorted(set(offsets)))
+
+# Snapshot of the schedule constants; a different fingerprint means the constants were changed
+def schedule_fingerprint(weekday_slots: Dict = None, vet_schedules: Dict = None) -> Tuple:
+    weekday_slots = WEEKDAY_SLOTS if weekday_slots is None else weekday_slots
+    vet_schedules = VET_SCHEDULES if vet_schedules is None else vet_schedules
+    return (tuple((day, tuple(shifts)) for day, shifts in weekday_slots.items()),
+            tuple((vet, tuple(days)) for vet, days in vet_schedules.items()))
+
+# The weekday templates: weekday -> vet -> minute offsets of the slot starts,
+# derived once per schedule fingerprint from WEEKDAY_SLOTS/VET_SCHEDULES
+@lru_cache(maxsize=8)
+def _weekday_templates(fingerprint: Tuple) -> Dict[str, Dict[str, Tuple[int, ...]]]:
+    weekday_slots, vet_schedules = dict(fingerprint[0]), dict(fingerprint[1])
+    templates = {}
+    for weekday, shifts in weekday_slots.items():
+        offsets = day_offsets(shifts)
+        templates[weekday] = {vet: offsets for vet, days in vet_schedules.items() if offsets and weekday in days}
+    return templates
+
+def weekday_templates() -> Dict[str, Dict[str, Tuple[int, ...]]]:
+    return _weekday_templates(schedule_fingerprint())
+
+# Materialize the slots of one date from the weekday template (bounded LRU of recent dates)
+@lru_cache(maxsize=DAILY_SLOTS_CACHE_SIZE)
+def _materialize_day(date: dt.date, fingerprint: Tuple) -> FrozenSet["Slot"]:
+    midnight = dt.datetime.combine(date, dt.time())
+    template = _weekday_templates(fingerprint).get(WEEKDAYS[date.weekday()], {})
+    return frozenset(Slot(midnight + dt.timedelta(minutes=offset), vet)
+                     for vet, offsets in template.items() for offset in offsets)
+
+# Drop the cached templates and dates (called automatically when the fingerprint changes)
+_cached_fingerprint = None
+
+def invalidate_slot_templates() -> None:
+    global _cached_fingerprint
+    _cached_fingerprint = None
+    _weekday_templates.cache_clear()
+    _materialize_day.cache_clear()
+    events.emit("schedule")
+    return None
+
+def _current_fingerprint() -> Tuple:
+    global _cached_fingerprint
+    fingerprint = schedule_fingerprint()
+    if fingerprint != _cached_fingerprint:
+        if _cached_fingerprint is not None:
+            logger.info("The schedule constants changed; the slot templates are rebuilt.")
+            invalidate_slot_templates()
+        _cached_fingerprint = fingerprint
+    return fingerprint
+
+# The possible slots for a given day; the schedule is either the weekday -> shifts mapping
+# (e.g. WEEKDAY_SLOTS) or directly the list of shifts of that day
+def subdivise_day(schedule, day: dt.date) -> List[dt.datetime]:
+    if not isinstance(day, dt.date):
+        raise TypeError("Please, insert a valid date for the appointment.")
+    shifts = schedule.get(WEEKDAYS[day.weekday()], []) if isinstance(schedule, dict) else schedule
+    offsets = day_offsets(shifts)
+    if offsets is None:
+        logger.info("No working hours on %s.", day)
+        return None
+    midnight = dt.datetime.combine(day, dt.time())
+    return [midnight + dt.timedelta(minutes=offset) for offset in offsets]
+
+# Make the daily schedule slots (every vet working that day, from the cached templates)
 def make_daily_slots(WEEKDAYS_SLOTS: dict, date: dt.date) -> Set[Slot]:
-    slots = set()
-    for vet, schedule in WEEKDAY_SLOTS.items():
-        possible_slots = subdivise_day(schedule, date)
-        for datetime_point in possible_slots:
-            slot = Slot(datetime_point, vet)
-            add_slot(slots, slot)
-    return slots
+    if isinstance(date, dt.datetime):
+        date = date.date()
+    return set(_materialize_day(date, _current_fingerprint()))
 
 # Filtering functions
+# the vet is given either by its letter (VETERINARIANS keys) or by its name
+def vet_name(vet: str) -> Optional[str]:
+    if vet in VETERINARIANS:
+        return VETERINARIANS[vet]
+    elif vet in VETERINARIANS.values():
+        return vet
+    return None
+
 def filter_slots_by_vet(slots: Set, vet: str) -> Set[Slot]:
     filtered_slots = set()
-    if vet not in VETERINARIANS:
-        logger.warning(f"The specified vet does not exist. Please, try again.")
+    vet = vet_name(vet)
+    if vet is None:
+        logger.warning("The specified vet does not exist. Please, try again.")
         return None
     else:
         for slot in slots:
@@ -136,6 +313,8 @@ def filter_slots_by_date(slots, date):
         logger.warning("Please, re-initiate the process and insert a valid date for your appointment.")
         return None
     else:
+        if isinstance(date, dt.datetime):
+            date = date.date()
         filtered_slots = set()
         for slot in slots:
             if slot.datetime.date() == date:
@@ -156,7 +335,7 @@ def common_slots(*slot_sets: Set[Slot]) -> Set[Slot]:
     if not slot_sets:
         return set()
     result = slot_sets[0]
-    for slot in slot_sets[:1]:
+    for slot in slot_sets[1:]:
         result = result.intersection(slot)
     return result
 
@@ -1,9 +1,23 @@
 from pathlib import Path
 from threading import Lock
-from typing import Set, List, Dict
-from slot_times import Slot
-from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable, Set, List, Dict, Iterator, Tuple
+from constants import WEEKDAYS
+from slot_times import Slot, vet_name, weekday_templates
+from datetime import date, datetime, time, timedelta
 from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex, appointment_key, slot_key
+from appointments_logic.locking import VetDayLocks, vet_day_key
+from appointments_logic.series import AppointmentSeries, RecurrenceRule, SeriesBook
+from persistence_logic.engines import DoubleBookingError, State, StorageEngine, TransactionError
+from persistence_logic.journal import Journal
+from persistence_logic.group_commit import GroupCommitWriter, GROUP_COMMIT_LATENCY
+from persistence_logic.binary_snapshot import BinarySnapshot, write_snapshot
+from metrics import timed, timer
+from appointments_logic import events
+import atexit
+import heapq
+import itertools
 import json
 import logging
 import tempfile
@@ -12,44 +26,86 @@ import os
 # Initializing the logger
 logger = logging.getLogger(__name__)
 
-# Data pointing to the JSON file
+# Data pointing to the JSON file; the directory is created by the first write, not at import
 DATA_DIR = Path(__file__).parent / "data"
-DATA_DIR.mkdir(exist_ok=True)
 APPOINTMENTS_FILE = DATA_DIR / "appointments.json"
 AVAILABLE_SLOTS_FILE = DATA_DIR / "available_slots.json"
 RESERVED_SLOTS_FILE = DATA_DIR / "reserved_slots.json"
+JOURNAL_FILE = DATA_DIR / "journal.log"
+SQLITE_FILE = DATA_DIR / "appointments.db"
+SHARDS_DIR = DATA_DIR / "shards"
+BINARY_SNAPSHOT_FILE = DATA_DIR / "snapshot.bin"
+ARCHIVE_DIR = DATA_DIR / "archive"
+SERIES_FILE = DATA_DIR / "series.log"
 
-# Initialized the lock for thread-safe operations
-lock = Lock()
+# Point the storage at another data directory (benchmarks, tests, a second clinic)
+def set_data_dir(data_dir: Path) -> None:
+    global DATA_DIR, APPOINTMENTS_FILE, AVAILABLE_SLOTS_FILE, RESERVED_SLOTS_FILE, JOURNAL_FILE, SQLITE_FILE, SHARDS_DIR, BINARY_SNAPSHOT_FILE, ARCHIVE_DIR, SERIES_FILE
+    DATA_DIR = Path(data_dir)
+    APPOINTMENTS_FILE = DATA_DIR / "appointments.json"
+    AVAILABLE_SLOTS_FILE = DATA_DIR / "available_slots.json"
+    RESERVED_SLOTS_FILE = DATA_DIR / "reserved_slots.json"
+    JOURNAL_FILE = DATA_DIR / "journal.log"
+    SQLITE_FILE = DATA_DIR / "appointments.db"
+    SHARDS_DIR = DATA_DIR / "shards"
+    BINARY_SNAPSHOT_FILE = DATA_DIR / "snapshot.bin"
+    ARCHIVE_DIR = DATA_DIR / "archive"
+    SERIES_FILE = DATA_DIR / "series.log"
+    return None
+
+# Number of journal records after which the journal is compacted into the JSON files
+CHECKPOINT_INTERVAL = 1000
+
+# Days of the past kept in the working set by AppointmentStorage.archive()
+ARCHIVE_RETENTION_DAYS = 7
+
+# One lock per data file (instead of a single module lock), for thread-safe reads
+_file_locks: Dict[Path, Lock] = {}
+_file_locks_guard = Lock()
+
+def file_lock(file_path: Path) -> Lock:
+    path_lock = _file_locks.get(file_path)
+    if path_lock is None:
+        with _file_locks_guard:
+            path_lock = _file_locks.setdefault(file_path, Lock())
+    return path_lock
 
 # Atomic write helper (for adding and removing appointments); atomicity ensured at write-data level
 def atomic_write_json(file_path, data, indent=4):
     dir_path = file_path.parent
+    dir_path.mkdir(parents=True, exist_ok=True)
     temp_file_handle, temp_file_path = tempfile.mkstemp(dir=str(dir_path))
     try:
         with os.fdopen(temp_file_handle, 'w', encoding="utf-8") as temp_file:
-            json.dump(data, temp_file, indent=indent)
+            with timer("serialization", {"format": "json"}):
+                json.dump(data, temp_file, indent=indent)
             temp_file.flush()
-            os.fsync(temp_file.fileno())
+            with timer("fsync", {"file": "json"}):
+                os.fsync(temp_file.fileno())
         os.replace(temp_file_path, file_path)
     except OSError as os_err:
-        logger.error(f"Atomic write of the file {file_path} failed due to error: {os_err}.")
+        logger.error("Atomic write of the file %s failed due to error: %s.", file_path, os_err)
         raise os_err
     finally:
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
 
 # Atomic read helper
-def atomic_read_json(file_path):
+# With strict=True, a missing or undecodable file raises instead of reading as an empty list
+def atomic_read_json(file_path, strict: bool = False):
     if not file_path.exists():
-        logger.warning(f"The file {file_path} does not exist. Returning empty list.")
+        if strict:
+            raise FileNotFoundError(f"The file {file_path} does not exist.")
+        logger.warning("The file %s does not exist. Returning empty list.", file_path)
         return []
-    with lock:
+    with file_lock(file_path):
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 return json.load(f)
         except json.JSONDecodeError as json_err:
-            logger.error(f"Error decoding JSON from file {file_path}. Error: {json_err}. Returning empty list.")
+            if strict:
+                raise
+            logger.error("Error decoding JSON from file %s. Error: %s. Returning empty list.", file_path, json_err)
             return []
 
 # Serialization and deserialization helpers for the objects Appointment and Slot
@@ -81,29 +137,113 @@ def deserialize_appointment(appointment_dictionary: Dict) -> Appointment:
         slot=deserialize_slot(appointment_dictionary["slot"])
     )
 
-# Load the state of data using the atomic read helper
-def load_state():
+# A recurring series is stored as one record: its rule and its exceptions (occurrence number ->
+# null for a cancelled occurrence, or the slot it was moved to)
+def serialize_series(series: AppointmentSeries) -> Dict:
+    return {"id": series.id, "customer": series.customer, "vet": series.vet, "rule": series.rule.as_dict(),
+            "exceptions": [[number, serialize_slot(slot) if slot is not None else None] for number, slot in series.exceptions.items()]}
+
+def deserialize_series(data: Dict) -> AppointmentSeries:
+    return AppointmentSeries(data["id"], data["customer"], data["vet"], RecurrenceRule.from_dict(data["rule"]),
+                             {number: deserialize_slot(slot) if slot is not None else None for number, slot in data["exceptions"]})
+
+# The records of the series log: a whole series, or one exception added to a series
+SERIES_OPERATIONS = ("series", "series_exception")
+
+# The series log replayed into a SeriesBook (appointments_logic.series)
+def load_series(journal: Journal) -> SeriesBook:
+    book = SeriesBook()
+    for record in journal.replay():
+        data = record["data"]
+        if record["op"] == "series":
+            book.add(deserialize_series(data))
+            continue
+        series = book.get(data["series"])
+        if series is None:
+            logger.warning("The series log has an exception of the unknown series %s. Skipping it.", data["series"])
+            continue
+        book.set_exception(series, data["number"], deserialize_slot(data["slot"]) if data["slot"] is not None else None)
+    if len(book):
+        logger.info("Loaded %s recurring series.", len(book))
+    return book
+
+# The single operations of the records, the transactions ("batch" records) unpacked in order
+def unpack_records(records) -> Iterator[Tuple[str, Dict]]:
+    for record in records:
+        if record["op"] == "batch":
+            yield from unpack_records(record["data"]["records"])
+        else:
+            yield record["op"], record["data"]
+
+# Re-apply the journal records on top of the snapshot; the replay is idempotent, so records
+# that already made it into the snapshot (crash between checkpoint and journal reset) are skipped
+def replay_journal(appointments, reserved_slots, records):
+    records = list(records)
+    if not records:
+        return appointments, reserved_slots
+    appointments = AppointmentIndex(appointments)
+    reserved_keys = {(slot.datetime, slot.vet) for slot in reserved_slots}
+    replayed = 0
+    for operation, data in unpack_records(records):
+        if operation == "add":
+            appointment = deserialize_appointment(data)
+            if appointment not in appointments:
+                appointments.append(appointment)
+        elif operation == "remove":
+            appointment = deserialize_appointment(data)
+            if appointment in appointments:
+                appointments.remove(appointment)
+        elif operation == "update":
+            old_appointment = deserialize_appointment(data["old"])
+            new_appointment = deserialize_appointment(data["new"])
+            if old_appointment in appointments:
+                appointments.remove(old_appointment)
+            if new_appointment not in appointments:
+                appointments.append(new_appointment)
+        elif operation == "reserve":
+            slot = deserialize_slot(data)
+            if (slot.datetime, slot.vet) not in reserved_keys:
+                reserved_keys.add((slot.datetime, slot.vet))
+                reserved_slots.append(slot)
+        replayed += 1
+    if replayed:
+        logger.info("Replayed %s journal records on top of the JSON snapshot.", replayed)
+    return list(appointments), reserved_slots
+
+# Load the state of data using the atomic read helper (snapshot files + journal); with
+# strict=True any error is raised instead of giving empty lists
+@timed("load_state")
+def load_state(journal: Journal = None, strict: bool = False):
     try:
-        appointments = atomic_read_json(APPOINTMENTS_FILE)
-        available_slots = atomic_read_json(AVAILABLE_SLOTS_FILE)
-        reserved_slots = atomic_read_json(RESERVED_SLOTS_FILE)
+        appointments = atomic_read_json(APPOINTMENTS_FILE, strict)
+        available_slots = atomic_read_json(AVAILABLE_SLOTS_FILE, strict)
+        reserved_slots = atomic_read_json(RESERVED_SLOTS_FILE, strict)
+
+        with timer("deserialization", {"format": "json"}):
+            appointments = [deserialize_appointment(data) for data in appointments]
+            available_slots = [deserialize_slot(data) for data in available_slots]
+            reserved_slots = [deserialize_slot(data) for data in reserved_slots]
 
-        appointments = [deserialize_appointment(data) for data in appointments]
-        available_slots = [deserialize_slot(data) for data in available_slots]
-        reserved_slots = [deserialize_slot(data) for data in reserved_slots]
+        if journal is None:
+            journal = Journal(JOURNAL_FILE)
+        appointments, reserved_slots = replay_journal(appointments, reserved_slots, journal.replay())
 
         logger.info("Successfully loaded the state/data from the JSON files.")
         return appointments, available_slots, reserved_slots        
     except Exception as err:
-        logger.error(f"An error has occured while loading the state. Error: {err}. Returning empty lists.")
+        if strict:
+            raise
+        logger.error("An error has occured while loading the state. Error: %s. Returning empty lists.", err)
         return [], [], []
     
 # Save the state of data using the atomic read helper
+@timed("save_state")
 def save_state(appointments, available_slots, reserved_slots):
     try:
-        appointments_serialized = [serialize_appointment(data) for data in appointments]
-        available_slots_serialized = [serialize_slot(data) for data in available_slots]
-        reserved_slots_serialized = [serialize_slot(data) for data in reserved_slots]
+        with timer("serialization", {"format": "records"}):
+            appointments_serialized = [serialize_appointment(data) for data in appointments]
+            available_slots_serialized = [serialize_slot(data) for data in available_slots]
+            reserved_slots_serialized = [serialize_slot(data) for data in reserved_slots]
 
         atomic_write_json(APPOINTMENTS_FILE, appointments_serialized)
         atomic_write_json(AVAILABLE_SLOTS_FILE, available_slots_serialized)
@@ -111,50 +251,635 @@ def save_state(appointments, available_slots, reserved_slots):
         
         logger.info("Successfully saved the state/data to JSON files.")
     except Exception as err:
-        logger.error(f"An error has occured while saving the state: {err}")
+        logger.error("An error has occured while saving the state: %s", err)
         raise err
 
+# Optional binary snapshot of the state (see persistence_logic.binary_snapshot): fixed-width
+# records, memory-mapped on load, objects built only for the records that are read
+def save_binary_state(appointments, available_slots, reserved_slots, file_path: Path = None):
+    write_snapshot(file_path or BINARY_SNAPSHOT_FILE, appointments, available_slots, reserved_slots)
+    return None
+
+def load_binary_state(file_path: Path = None) -> BinarySnapshot:
+    return BinarySnapshot(file_path or BINARY_SNAPSHOT_FILE)
+
+# The JSON files engine (load_state/save_state).
+# With journaled=True, every mutation is appended as one record to the journal (one fsync),
+# and the JSON files are only rewritten at the checkpoints.
+# With group_commit=True (implies journaled), the records of concurrent callers are flushed
+# together within commit_latency seconds; each caller returns once its own record is durable.
+class JsonStorageEngine(StorageEngine):
+    name = "json"
+
+    def __init__(self, journaled: bool = False, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                 group_commit: bool = False, commit_latency: float = GROUP_COMMIT_LATENCY):
+        self.journaled = journaled or group_commit
+        self.checkpoint_interval = checkpoint_interval
+        self.journal = Journal(JOURNAL_FILE)
+        self.writer = GroupCommitWriter(self.journal, latency=commit_latency) if group_commit else None
+        # the full saves are serialized, each one snapshotting the state once it holds the lock
+        self._save_lock = Lock()
+
+    def load(self) -> State:
+        return load_state(self.journal)
+
+    # Full rewrite of the JSON files; the journal records are part of the snapshot afterwards
+    def save(self, appointments, available_slots, reserved_slots) -> None:
+        with self._save_lock:
+            save_state(appointments, available_slots, reserved_slots)
+            if self.journal.records_since_checkpoint:
+                self.journal.reset()
+        return None
+
+    # Full save, journal record, or a queued group commit record (returned, to be waited on)
+    def commit(self, operation: str, data: Dict, state: State):
+        if not self.journaled:
+            self.save(*state)
+            return None
+        elif self.writer is None:
+            self.journal.append(operation, data)
+            return None
+        else:
+            return self.writer.submit(operation, data)
+
+    def needs_checkpoint(self) -> bool:
+        return self.journaled and self.journal.records_since_checkpoint >= self.checkpoint_interval
+
+    # Compact the journal into the JSON files
+    def checkpoint(self, state: State) -> None:
+        self.save(*state)
+        logger.info("Checkpoint completed: the journal was compacted into the JSON files.")
+        return None
+
+    def close(self, state: State) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        if self.journaled and self.journal.records_since_checkpoint:
+            self.checkpoint(state)
+        self.journal.close()
+        return None
+
+    # With the journal, in the data directory the engine was created for
+    def companion_path(self, name: str) -> Path:
+        return self.journal.file_path.parent / name
+
+
+# The events announcing the operations of a transaction, and the ones undoing them
+TRANSACTION_EVENTS = {"add": "book", "remove": "cancel", "update": "update", "reserve": "reserve"}
+ROLLBACK_EVENTS = {"add": "cancel", "remove": "book", "update": "update", "reserve": "reserve"}
+
+# A unit of work over the storage (see AppointmentStorage.transaction). The operations are
+# buffered; commit() locks the (vet, day) of all their slots, checks them in order against the
+# state as the previous ones leave it, applies them in memory and persists them as a single
+# "batch" commit. Nothing is applied if a check or the engine fails.
+class StorageTransaction:
+    def __init__(self, storage: "AppointmentStorage"):
+        self.storage = storage
+        self.operations: List[Tuple[str, Tuple]] = []
+        self.committed = False
+
+    def _add(self, operation: str, *arguments) -> "StorageTransaction":
+        if self.committed:
+            raise TransactionError("The transaction was already committed.")
+        self.operations.append((operation, arguments))
+        return self
+
+    def book(self, appointment: Appointment) -> "StorageTransaction":
+        return self._add("add", appointment)
+
+    def cancel(self, appointment: Appointment) -> "StorageTransaction":
+        return self._add("remove", appointment)
+
+    def reschedule(self, old_appointment: Appointment, new_appointment: Appointment) -> "StorageTransaction":
+        return self._add("update", old_appointment, new_appointment)
+
+    def reserve(self, slot: Slot) -> "StorageTransaction":
+        return self._add("reserve", slot)
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    # The slots touched by each operation
+    @staticmethod
+    def _slots(operation: str, arguments: Tuple) -> List[Slot]:
+        return list(arguments) if operation == "reserve" else [appointment.slot for appointment in arguments]
+
+    def _validate(self) -> None:
+        appointments = self.storage.appointments
+        # the changes of the previous operations: appointments added/removed, bookings per slot
+        present: Dict = {}
+        bookings: Dict = {}
+        reserved = set()
+
+        def exists(appointment) -> bool:
+            key = appointment_key(appointment)
+            return present[key] if key in present else appointment in appointments
+
+        def book(appointment) -> None:
+            if exists(appointment):
+                raise TransactionError(f"Appointment {appointment} already exists.")
+            key = slot_key(appointment.slot)
+            booked = bookings.get(key, len(appointments.by_slot(appointment.slot)))
+            if booked or self.storage.series.occupant(appointment.slot) is not None:
+                raise TransactionError(f"The slot {appointment.slot} is already booked.")
+            present[appointment_key(appointment)] = True
+            bookings[key] = booked + 1
+
+        def cancel(appointment) -> None:
+            if not exists(appointment):
+                raise TransactionError(f"Appointment {appointment} not found.")
+            key = slot_key(appointment.slot)
+            present[appointment_key(appointment)] = False
+            bookings[key] = bookings.get(key, len(appointments.by_slot(appointment.slot))) - 1
+
+        for operation, arguments in self.operations:
+            if operation == "add":
+                book(arguments[0])
+            elif operation == "remove":
+                cancel(arguments[0])
+            elif operation == "update":
+                cancel(arguments[0])
+                book(arguments[1])
+            else:
+                slot = arguments[0]
+                if slot_key(slot) in reserved or slot in self.storage.reserved_slots:
+                    raise TransactionError(f"The slot {slot} is already reserved.")
+                reserved.add(slot_key(slot))
+        return None
+
+    # Apply the operations to the in-memory state; returns the steps that undo them, latest first
+    def _apply(self) -> List:
+        appointments, reserved_slots = self.storage.appointments, self.storage.reserved_slots
+        undo = []
+        for operation, arguments in self.operations:
+            if operation in ("remove", "update"):
+                appointments.remove(arguments[0])
+                undo.append((appointments.append, arguments[0]))
+            if operation in ("add", "update"):
+                appointments.append(arguments[-1])
+                undo.append((appointments.remove, arguments[-1]))
+            if operation == "reserve":
+                reserved_slots.append(arguments[0])
+                undo.append((reserved_slots.remove, arguments[0]))
+        return undo[::-1]
+
+    def _records(self) -> List[Dict]:
+        records = []
+        for operation, arguments in self.operations:
+            if operation == "update":
+                data = {"old": serialize_appointment(arguments[0]), "new": serialize_appointment(arguments[1])}
+            elif operation == "reserve":
+                data = serialize_slot(arguments[0])
+            else:
+                data = serialize_appointment(arguments[0])
+            records.append({"op": operation, "data": data})
+        return records
+
+    def _emit(self, kinds: Dict) -> None:
+        for operation, arguments in self.operations:
+            events.emit(kinds[operation], *self._slots(operation, arguments))
+        return None
+
+    @timed("transaction", {"layer": "storage"})
+    def commit(self) -> None:
+        if self.committed:
+            raise TransactionError("The transaction was already committed.")
+        self.committed = True
+        if not self.operations:
+            return None
+        storage = self.storage
+        keys = [vet_day_key(slot) for operation, arguments in self.operations for slot in self._slots(operation, arguments)]
+        with storage._locks.locked_many(keys):
+            self._validate()
+            undo = self._apply()
+            try:
+                pending = storage._stage("batch", {"records": self._records()})
+            except Exception as err:
+                for step, argument in undo:
+                    step(argument)
+                self._emit(ROLLBACK_EVENTS)
+                if isinstance(err, DoubleBookingError):
+                    raise TransactionError(f"The transaction was rolled back: {err}") from err
+                raise
+            self._emit(TRANSACTION_EVENTS)
+
+        # the batch did not become durable (e.g. a failed group commit flush): undo it, under the
+        # locks again; a step that a later mutation already undid is skipped
+        def rollback() -> None:
+            with storage._locks.locked_many(keys):
+                for step, argument in undo:
+                    try:
+                        step(argument)
+                    except ValueError:
+                        pass
+                self._emit(ROLLBACK_EVENTS)
+            logger.warning("Transaction of %s operations rolled back: it could not be made durable.", len(self.operations))
+            return None
+
+        storage._await(pending, rollback)
+        logger.info("Transaction of %s operations committed successfully.", len(self.operations))
+        return None
+
+
+# The storage facade; the persistence is delegated to a StorageEngine (JSON files by default,
+# see persistence_logic.sqlite_engine for the SQLite one). The keyword arguments configure the
+# default JSON engine. The mutations lock only the (vet, day) of their slot; save/checkpoint/close
+# lock every stripe. A slot holds one booking and is reserved once, whatever the engine: the rule
+# is checked here (the SQLite constraints only back it up).
 class AppointmentStorage:
-    def __init__(self):
-        self._lock = Lock()
-        self.appointments, self.available_slots, self.reserved_slots = load_state()
+    def __init__(self, engine: StorageEngine = None, **json_options):
+        self._locks = VetDayLocks()
+        self.engine = engine if engine is not None else JsonStorageEngine(**json_options)
+        appointments, self.available_slots, self.reserved_slots = self.engine.load()
+        self.appointments = AppointmentIndex(appointments)
+        self._archive = None
+        # the recurring series (rule + exceptions), kept in their own log next to the engine's data
+        self._series_journal = Journal(self.engine.companion_path(SERIES_FILE.name) or SERIES_FILE, SERIES_OPERATIONS)
+        self._series_lock = Lock()
+        self.series = load_series(self._series_journal)
+
+    # The cold tier (persistence_logic.archive), opened on first use; the historical lookups go
+    # through it (between, find, by_customer), the working set only holds the recent past onwards
+    @property
+    def archive_store(self):
+        if self._archive is None:
+            from persistence_logic.archive import ArchiveStore
+            self._archive = ArchiveStore(ARCHIVE_DIR)
+        return self._archive
+
+    # Move the appointments and slots before the cutoff (default: the start of the day
+    # ARCHIVE_RETENTION_DAYS ago) into a new archive segment, then rewrite the working state
+    # without them; returns the number of archived appointments
+    @timed("archive", {"layer": "storage"})
+    def archive(self, cutoff: datetime = None) -> int:
+        if cutoff is None:
+            cutoff = datetime.combine(date.today() - timedelta(days=ARCHIVE_RETENTION_DAYS), time())
+        with self._locks.all_locked():
+            past_appointments = [appointment for appointment in self.appointments if appointment.slot.datetime < cutoff]
+            past_available = [slot for slot in self.available_slots if slot.datetime < cutoff]
+            past_reserved = [slot for slot in self.reserved_slots if slot.datetime < cutoff]
+            if not (past_appointments or past_available or past_reserved):
+                return 0
+            # the segment is durable before the working files lose the records
+            self.archive_store.append(past_appointments, past_available, past_reserved)
+            remaining = [appointment for appointment in self.appointments if appointment.slot.datetime >= cutoff]
+            self.appointments.clear()
+            self.appointments.extend(remaining)
+            self.available_slots[:] = [slot for slot in self.available_slots if slot.datetime >= cutoff]
+            self.reserved_slots[:] = [slot for slot in self.reserved_slots if slot.datetime >= cutoff]
+            self.engine.save(*self._state())
+            events.emit("archive")
+        logger.info("Archived %s appointments and %s slots before %s.", len(past_appointments),
+                    len(past_available) + len(past_reserved), cutoff)
+        return len(past_appointments)
+
+    def _state(self) -> State:
+        return self.appointments, self.available_slots, self.reserved_slots
 
     def save(self):
-        with self._lock:
-            save_state(self.appointments, self.available_slots, self.reserved_slots)
+        with self._locks.all_locked():
+            self.engine.save(*self._state())
             return None
 
-    def find_appointment(self, customer: str, slot: Slot) -> Appointment:
-        with self._lock:
-            for appointment in self.appointments:
-                if (appointment.customer == customer) and (appointment.slot == slot):
-                    logger.info(f"Successfully identified the appointment. The appointment is for {customer} at {slot}.")
-                    return appointment
-                else:
-                    logger.warning(f"This appointment was not found. If you believe this is an error, please, try again and make sure you insert the correct details.")
+    def checkpoint(self):
+        with self._locks.all_locked():
+            self.engine.checkpoint(self._state())
+            self._compact_series()
+            return None
+
+    # Rewrite the series log with one record per series once the exception records outnumber
+    # the series (called with every stripe locked)
+    def _compact_series(self) -> None:
+        with self._series_lock:
+            if self._series_journal.records_since_checkpoint > 2 * len(self.series):
+                self._series_journal.rewrite([{"op": "series", "data": serialize_series(series)} for series in self.series])
+        return None
+
+    # Persist a single mutation (called while holding the vet-day lock); the engine may hand
+    # back a pending handle for deferred durability
+    def _stage(self, operation: str, data: Dict):
+        with timer("engine_commit", {"engine": self.engine.name}):
+            return self.engine.commit(operation, data, self._state())
+
+    # Wait for the durability of a staged mutation (outside the lock, so the commits can group);
+    # if it fails, `undo` reverts the in-memory change before the error is raised
+    def _await(self, pending, undo: Callable[[], None] = None) -> None:
+        with timer("durability_wait", {"engine": self.engine.name}):
+            try:
+                self.engine.wait(pending)
+            except Exception:
+                if undo is not None:
+                    undo()
+                raise
+        if self.engine.needs_checkpoint():
+            self.checkpoint()
+        return None
+
+    # The undo of a staged mutation for _await: `revert` runs under the locks of its (vet, day)
+    # keys again, and is skipped if a later mutation already reverted it
+    def _undoing(self, keys: List, revert: Callable[[], None]) -> Callable[[], None]:
+        def undo() -> None:
+            with self._locks.locked_many(keys):
+                try:
+                    revert()
+                except ValueError:
                     return None
-        
-    def add_appointment(self, appointment: Appointment):
-        with self._lock:
-            self.appointments.append(appointment)
-            self.save_state()
-            logger.info(f"Appointment {appointment} was added successfully.")
+            logger.warning("A mutation was rolled back: it could not be made durable.")
             return None
+        return undo
+
+    # Group several operations into one unit of work, persisted as a single commit:
+    #     with storage.transaction() as transaction:
+    #         transaction.cancel(old_appointment)
+    #         transaction.book(new_appointment)
+    # The operations are committed when the block exits, discarded if it raises; a commit that
+    # does not hold against the current state raises TransactionError and changes nothing.
+    @contextmanager
+    def transaction(self) -> Iterator[StorageTransaction]:
+        transaction = StorageTransaction(self)
+        yield transaction
+        transaction.commit()
+
+    # The vet-day locks of some slots, for a check-then-book over several of them (see
+    # appointments_logic.service.create_appointments_batch); the locks are reentrant, so a
+    # transaction committed inside takes them again
+    def locked_slots(self, slots: List[Slot]):
+        return self._locks.locked_many([vet_day_key(slot) for slot in slots])
+
+    # Whether a booking may take the slot, as an occurrence of a series (see _series_slot_free);
+    # the caller holds the vet-day lock of the slot
+    def is_slot_free(self, slot: Slot) -> bool:
+        return self._series_slot_free(slot, weekday_templates(), self.reserved_slots)
 
-    def remove_appointment(self, appointment: Appointment):
-        with self._lock:
+    # The booked (series occurrences included) and reserved slots of the days start <= date < end
+    # (of one vet, if given); the availability horizon (availability_logic.horizon) is computed from these
+    def taken_slots_between(self, start: date, end: date, vet: str = None) -> List[Slot]:
+        low, high = datetime.combine(start, time()), datetime.combine(end, time())
+        slots = [appointment.slot for appointment in self.appointments.between(low, high)]
+        slots.extend(slot for slot in list(self.reserved_slots) if low <= slot.datetime < high)
+        slots.extend(appointment.slot for appointment in self.series.occurrences_between(low, high, vet))
+        if vet is not None:
+            slots = [slot for slot in slots if slot.vet == vet]
+        return slots
+
+    def taken_slots(self, vet: str, day: date) -> List[Slot]:
+        return self.taken_slots_between(day, day + timedelta(days=1), vet)
+
+    @timed("lookup", {"layer": "storage"})
+    def find_appointment(self, customer: str, slot: Slot) -> Appointment:
+        appointment = self._locks.optimistic_read(vet_day_key(slot), lambda: self.appointments.find(customer, slot))
+        if appointment is None and self.series.find(customer, slot) is not None:
+            appointment = Appointment(customer, slot)
+        if appointment is not None:
+            logger.info("Successfully identified the appointment. The appointment is for %s at %s.", customer, slot)
+            return appointment
+        else:
+            logger.warning("This appointment was not found. If you believe this is an error, please, try again and make sure you insert the correct details.")
+            return None
+        
+    # "All upcoming appointments for customers starting with X" (case-insensitive), in time order;
+    # upcoming means from `since`, now by default. The occurrences of their series are merged in.
+    @timed("lookup", {"layer": "storage", "index": "customer"})
+    def upcoming_appointments(self, prefix: str, since: datetime = None, limit: int = None) -> List[Appointment]:
+        since = since if since is not None else datetime.now()
+        found = self.appointments.search_customers(prefix, since, limit)
+        series = self.series.with_customer_prefix(prefix)
+        if not series:
+            return found
+        merged = heapq.merge(found, *(item.occurrences(since) for item in series),
+                             key=lambda appointment: (appointment.slot.datetime, appointment.slot.vet, appointment.customer))
+        return list(itertools.islice(merged, limit))
+
+    # Returns the appointment once it is stored, None if it was refused (already booked, slot held
+    # by a series, double booking rejected by the engine)
+    @timed("booking", {"layer": "storage"})
+    def add_appointment(self, appointment: Appointment) -> Appointment:
+        with self._locks.locked(vet_day_key(appointment.slot)):
             if appointment in self.appointments:
+                logger.warning("Appointment %s already exists. Can't complete the add action.", appointment)
+                return None
+            if self.series.occupant(appointment.slot) is not None:
+                logger.warning("Appointment %s was not added: the slot is held by a recurring series.", appointment)
+                return None
+            if self.appointments.is_slot_booked(appointment.slot):
+                logger.warning("Appointment %s was not added: the slot is already booked.", appointment)
+                return None
+            self.appointments.append(appointment)
+            try:
+                pending = self._stage("add", serialize_appointment(appointment))
+            except DoubleBookingError as err:
                 self.appointments.remove(appointment)
-                self.save_state()
-                logger.info(f"Appointment {appointment} was removed successfully.")
+                events.emit("cancel", appointment.slot)
+                logger.warning("Appointment %s was not added: %s", appointment, err)
                 return None
-            else:
-                logger.warning(f"Appointment {appointment} not found. Can't complete the removal action. Try again.")
+            except Exception:
+                self.appointments.remove(appointment)
+                events.emit("cancel", appointment.slot)
+                raise
+            events.emit("book", appointment.slot)
+
+        def revert() -> None:
+            self.appointments.remove(appointment)
+            events.emit("cancel", appointment.slot)
+        self._await(pending, self._undoing([vet_day_key(appointment.slot)], revert))
+        logger.info("Appointment %s was added successfully.", appointment)
+        return appointment
+
+    # With a waitlist (appointments_logic.waitlist.Waitlist), the freed slot is offered to the
+    # best waiting customer: see _cancel_and_fill
+    @timed("cancel", {"layer": "storage"})
+    def remove_appointment(self, appointment: Appointment, waitlist=None):
+        if waitlist is not None:
+            return self._cancel_and_fill(appointment, waitlist)
+        with self._locks.locked(vet_day_key(appointment.slot)):
+            if appointment not in self.appointments:
+                occurrence = self.series.find(appointment.customer, appointment.slot)
+                if occurrence is None:
+                    logger.warning("Appointment %s not found. Can't complete the removal action. Try again.", appointment)
+                    return None
+                self._series_exception(*occurrence)
+                events.emit("cancel", appointment.slot)
+                logger.info("Occurrence %s of the series %s was cancelled.", occurrence[1], occurrence[0].id)
                 return None
+            self.appointments.remove(appointment)
+            try:
+                pending = self._stage("remove", serialize_appointment(appointment))
+            except Exception:
+                self.appointments.append(appointment)
+                events.emit("book", appointment.slot)
+                raise
+            events.emit("cancel", appointment.slot)
 
+        def revert() -> None:
+            self.appointments.append(appointment)
+            events.emit("book", appointment.slot)
+        self._await(pending, self._undoing([vet_day_key(appointment.slot)], revert))
+        logger.info("Appointment %s was removed successfully.", appointment)
+        return None
+
+    # The cancellation and the booking of the waitlisted customer are one transaction (a single
+    # durable commit): the slot is never seen free in between. Returns the new appointment, None
+    # if nobody was waiting for the slot (it is then cancelled alone) or the cancellation failed.
+    def _cancel_and_fill(self, appointment: Appointment, waitlist) -> Appointment:
+        if appointment not in self.appointments:
+            # a series occurrence is cancelled as an exception of its series, outside the transactions
+            return self.remove_appointment(appointment)
+        entry = waitlist.claim(appointment.slot, exclude=appointment.customer)
+        if entry is None:
+            return self.remove_appointment(appointment)
+        replacement = Appointment(entry.customer, appointment.slot)
+        try:
+            with self.transaction() as transaction:
+                transaction.cancel(appointment)
+                transaction.book(replacement)
+        except Exception as err:
+            waitlist.restore(entry, appointment.slot)
+            if isinstance(err, TransactionError):
+                logger.warning("Appointment %s was not removed: %s", appointment, err)
+                return None
+            raise
+        waitlist.fulfil(entry, replacement)
+        logger.info("Appointment %s was removed; the slot went to the waitlist entry %s.", appointment, entry.id)
+        return replacement
+
+    @timed("update", {"layer": "storage"})
+    def update_appointment(self, old_appointment: Appointment, new_appointment: Appointment):
+        with self._locks.locked_many([vet_day_key(old_appointment.slot), vet_day_key(new_appointment.slot)]):
+            if old_appointment not in self.appointments:
+                return self._move_occurrence(old_appointment, new_appointment)
+            if self.series.occupant(new_appointment.slot) is not None:
+                logger.warning("Appointment %s was not updated: the new slot is held by a recurring series.", old_appointment)
+                return None
+            if any(booked != old_appointment for booked in self.appointments.by_slot(new_appointment.slot)):
+                logger.warning("Appointment %s was not updated: the new slot is already booked.", old_appointment)
+                return None
+            self.appointments.remove(old_appointment)
+            self.appointments.append(new_appointment)
+            try:
+                pending = self._stage("update", {"old": serialize_appointment(old_appointment), "new": serialize_appointment(new_appointment)})
+            except Exception as err:
+                self.appointments.remove(new_appointment)
+                self.appointments.append(old_appointment)
+                events.emit("update", old_appointment.slot, new_appointment.slot)
+                if isinstance(err, DoubleBookingError):
+                    logger.warning("Appointment %s was not updated: %s", old_appointment, err)
+                    return None
+                raise
+            events.emit("update", old_appointment.slot, new_appointment.slot)
+
+        def revert() -> None:
+            self.appointments.remove(new_appointment)
+            self.appointments.append(old_appointment)
+            events.emit("update", old_appointment.slot, new_appointment.slot)
+        self._await(pending, self._undoing([vet_day_key(old_appointment.slot), vet_day_key(new_appointment.slot)], revert))
+        logger.info("Appointment %s was updated to %s successfully.", old_appointment, new_appointment)
+        return None
+
+    @timed("reserve", {"layer": "storage"})
     def reserve_slot(self, slot: Slot):
-        with self._lock:
+        with self._locks.locked(vet_day_key(slot)):
+            if slot in self.reserved_slots:
+                logger.warning("Slot %s was not reserved: it is already reserved.", slot)
+                return None
             self.reserved_slots.append(slot)
-            self.save()
-            logger.info(f"Slot {slot} was reserved successfully.")
-            return None
\ No newline at end of file
+            try:
+                pending = self._stage("reserve", serialize_slot(slot))
+            except Exception as err:
+                self.reserved_slots.remove(slot)
+                events.emit("reserve", slot)
+                if isinstance(err, DoubleBookingError):
+                    logger.warning("Slot %s was not reserved: %s", slot, err)
+                    return None
+                raise
+            events.emit("reserve", slot)
+
+        def revert() -> None:
+            self.reserved_slots.remove(slot)
+            events.emit("reserve", slot)
+        self._await(pending, self._undoing([vet_day_key(slot)], revert))
+        logger.info("Slot %s was reserved successfully.", slot)
+        return None
+
+    # Books a recurring series (appointments_logic.series) as a single record of the series log;
+    # no occurrence is stored. The occurrences are checked in one pass against the schedule, the
+    # appointments, the reserved slots and the other series: with skip_conflicts the conflicting
+    # ones are stored as cancelled exceptions, otherwise a conflict rejects the series.
+    # Returns the series, None if it was not booked.
+    @timed("series_booking", {"layer": "storage"})
+    def book_series(self, customer: str, vet: str, rule: RecurrenceRule, skip_conflicts: bool = False) -> AppointmentSeries:
+        vet = vet_name(vet) or vet
+        if not isinstance(customer, str) or not customer or rule is None:
+            logger.warning("The series needs a customer and a valid rule. Can't complete the booking.")
+            return None
+        occurrences = [(number, Slot(moment, vet)) for number, moment in rule.occurrences()]
+        templates = weekday_templates()
+        with self._locks.locked_many(vet_day_key(slot) for _, slot in occurrences):
+            reserved = {slot for slot in list(self.reserved_slots) if slot.vet == vet and slot.datetime >= rule.start}
+            conflicts = [number for number, slot in occurrences if not self._series_slot_free(slot, templates, reserved)]
+            if conflicts and (not skip_conflicts or len(conflicts) == len(occurrences)):
+                logger.warning("The series for %s was not booked: %s of its %s occurrences are not free (the first on %s).",
+                               customer, len(conflicts), len(occurrences), rule.at(conflicts[0]))
+                return None
+            with self._series_lock:
+                series = AppointmentSeries(self.series.next_id(), customer, vet, rule, dict.fromkeys(conflicts))
+                self._series_journal.append("series", serialize_series(series))
+                self.series.add(series)
+            events.emit("book", *(slot for number, slot in occurrences if number not in series.exceptions))
+        logger.info("The series %s of %s occurrences was booked for %s (%s skipped).", series.id, len(occurrences), customer, len(conflicts))
+        return series
+
+    # Whether an occurrence may take the slot: a minute of the vet's weekday template (no seconds),
+    # not reserved, not booked, not held by a series (the caller holds the vet-day lock)
+    def _series_slot_free(self, slot: Slot, templates: Dict, reserved) -> bool:
+        moment = slot.datetime
+        scheduled = moment.hour * 60 + moment.minute in templates.get(WEEKDAYS[moment.weekday()], {}).get(slot.vet, ())
+        return (scheduled and not moment.second and not moment.microsecond and slot not in reserved
+                and not self.appointments.by_slot(slot) and self.series.occupant(slot) is None)
+
+    # Cancel (slot None) or move one occurrence of a series, stored as one exception record (the
+    # caller holds the vet-day locks of the slots)
+    def _series_exception(self, series: AppointmentSeries, number: int, slot: Slot = None) -> None:
+        with self._series_lock:
+            self._series_journal.append("series_exception", {"series": series.id, "number": number,
+                                                             "slot": serialize_slot(slot) if slot is not None else None})
+            self.series.set_exception(series, number, slot)
+        return None
+
+    # update_appointment of a series occurrence: the occurrence is moved (same customer only)
+    def _move_occurrence(self, old_appointment: Appointment, new_appointment: Appointment):
+        occurrence = self.series.find(old_appointment.customer, old_appointment.slot)
+        if occurrence is None:
+            logger.warning("Appointment %s not found. Can't complete the update action. Try again.", old_appointment)
+            return None
+        if new_appointment.customer != old_appointment.customer:
+            logger.warning("An occurrence of a series can't change its customer. Can't complete the update action.")
+            return None
+        if not self._series_slot_free(new_appointment.slot, weekday_templates(), list(self.reserved_slots)):
+            logger.warning("Appointment %s was not updated: the new slot is reserved, booked or not on the schedule.", old_appointment)
+            return None
+        self._series_exception(*occurrence, new_appointment.slot)
+        events.emit("update", old_appointment.slot, new_appointment.slot)
+        logger.info("Occurrence %s of the series %s was moved to %s.", occurrence[1], occurrence[0].id, new_appointment.slot)
+        return None
+
+    def close(self):
+        with self._locks.all_locked():
+            self.engine.close(self._state())
+            self._compact_series()
+            self._series_journal.close()
+            return None
+
+
+# The storage shared by the callers of one process (main.py), created on first use: importing
+# the modules reads nothing from disk, and the state is loaded once, by the engine
+_shared_storage: AppointmentStorage = None
+_shared_storage_lock = Lock()
+
+def shared_storage(**options) -> AppointmentStorage:
+    global _shared_storage
+    if _shared_storage is None:
+        with _shared_storage_lock:
+            if _shared_storage is None:
+                _shared_storage = AppointmentStorage(**options)
+                atexit.register(_shared_storage.close)
+    return _shared_storage
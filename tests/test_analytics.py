@@ -0,0 +1,115 @@
+# Analytics (analytics_logic): the columnar exports match the objects they come from, and each
+# report gives the counts a plain loop over the slots and the appointments would give
+import collections
+import csv
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from analytics_logic.columns import AppointmentColumns, ScheduleColumns, epoch_date, epoch_day
+from analytics_logic.reports import (busiest_slots, capacity_forecast, daily_utilization, utilization_heatmap,
+                                     weekly_utilization, write_csv)
+from appointments_logic.core import Appointment
+from constants import WEEKDAYS
+from persistence_logic.binary_snapshot import BinarySnapshot, write_snapshot
+from slot_times import Slot, make_daily_slots
+
+# a Monday, then two weeks
+START = dt.date(2026, 1, 5)
+END = dt.date(2026, 1, 19)
+
+def scheduled(start: dt.date = START, end: dt.date = END):
+    slots = []
+    for day in range((end - start).days):
+        slots.extend(make_daily_slots(None, start + dt.timedelta(days=day)))
+    return sorted(slots, key=lambda slot: (slot.datetime, slot.vet))
+
+@pytest.fixture
+def appointments():
+    booked = [Appointment(f"Customer {number % 5}", slot) for number, slot in enumerate(scheduled()) if number % 3 == 0]
+    # a former vet and a day outside the range
+    booked.append(Appointment("Customer 0", Slot(dt.datetime(2026, 1, 6, 10), "Dr. Former")))
+    booked.append(Appointment("Customer 1", Slot(dt.datetime(2026, 2, 2, 10), booked[0].slot.vet)))
+    return booked
+
+def test_schedule_matches_the_daily_slots():
+    schedule = ScheduleColumns.from_templates(START, END)
+    slots = scheduled()
+    assert len(schedule) == len(slots) > 0
+    moments = schedule.minutes.astype("datetime64[m]").tolist()
+    assert sorted(zip(moments, [schedule.vets[vet] for vet in schedule.vet.tolist()])) == \
+        sorted((slot.datetime, slot.vet) for slot in slots)
+    assert epoch_date(epoch_day(START)) == START
+    assert len(ScheduleColumns.from_templates(END, START)) == 0
+
+def test_snapshot_columns_match_the_objects(tmp_path, appointments):
+    write_snapshot(tmp_path / "snapshot.bin", appointments, [], [])
+    snapshot = BinarySnapshot(tmp_path / "snapshot.bin")
+    try:
+        from_snapshot = AppointmentColumns.from_snapshot(snapshot)
+    finally:
+        snapshot.close()
+    from_objects = AppointmentColumns.from_appointments(appointments)
+
+    def rows(columns):
+        return collections.Counter(zip(columns.minutes.tolist(), [columns.vets[vet] for vet in columns.vet.tolist()],
+                                       [columns.customers[customer] for customer in columns.customer.tolist()]))
+
+    assert rows(from_snapshot) == rows(from_objects) and len(from_objects) == len(appointments)
+    assert len(from_objects.between(dt.datetime(2026, 2, 1), dt.datetime(2026, 3, 1))) == 1
+
+def test_daily_and_weekly_utilization(appointments):
+    columns = AppointmentColumns.from_appointments(appointments)
+    schedule = ScheduleColumns.from_templates(START, END)
+    capacity = collections.Counter((slot.datetime.date(), slot.vet) for slot in scheduled())
+    booked = collections.Counter((appointment.slot.datetime.date(), appointment.slot.vet) for appointment in appointments
+                                 if START <= appointment.slot.datetime.date() < END)
+
+    daily = daily_utilization(columns, schedule)
+    rows = {(date, vet): (count, total) for date, vet, count, total in
+            zip(daily["date"].tolist(), daily["vet"].tolist(), daily["booked"].tolist(), daily["capacity"].tolist())}
+    assert rows == {key: (booked[key], capacity[key]) for key in set(booked) | set(capacity)}
+    # booked without a schedule: no utilization
+    former = daily["vet"] == "Dr. Former"
+    assert former.sum() == 1 and daily["utilization"][former].tolist() != daily["utilization"][former].tolist()
+
+    weekly = weekly_utilization(columns, schedule)
+    assert sorted(set(weekly["week"].tolist())) == [START, START + dt.timedelta(days=7)]
+    assert weekly["booked"].sum() == sum(booked.values()) and weekly["capacity"].sum() == sum(capacity.values())
+
+def test_heatmap_and_busiest_slots(appointments):
+    columns = AppointmentColumns.from_appointments(appointments)
+    schedule = ScheduleColumns.from_templates(START, END)
+    heatmap = utilization_heatmap(columns, schedule)
+    assert len(heatmap["hour"]) == 7 * 24 and heatmap["utilization"].reshape(7, 24).shape == (7, 24)
+    capacity = collections.Counter((WEEKDAYS[slot.datetime.weekday()], slot.datetime.hour) for slot in scheduled())
+    cells = zip(heatmap["weekday"].tolist(), heatmap["hour"].tolist(), heatmap["capacity"].tolist())
+    assert {(weekday, hour): total for weekday, hour, total in cells if total} == dict(capacity)
+
+    busiest = busiest_slots(columns, schedule, top=5)
+    least = busiest_slots(columns, schedule, top=5, least=True)
+    assert len(busiest["vet"]) == 5 and "Dr. Former" not in busiest["vet"].tolist()
+    assert list(busiest["utilization"]) == sorted(busiest["utilization"], reverse=True)
+    assert list(least["utilization"]) == sorted(least["utilization"])
+    assert busiest["utilization"][0] >= least["utilization"][0]
+
+def test_capacity_forecast_and_csv(tmp_path, appointments):
+    columns = AppointmentColumns.from_appointments(appointments)
+    forecast = capacity_forecast(columns, END, weeks=2, history_weeks=2)
+    assert len(forecast["vet"]) > 0
+    assert (forecast["forecast"] >= forecast["booked"]).all()
+    assert (forecast["spare"] == forecast["capacity"] - forecast["forecast"]).all()
+    # each vet's share of the history's scheduled slots that were booked
+    capacity = collections.Counter(slot.vet for slot in scheduled())
+    booked = collections.Counter(appointment.slot.vet for appointment in appointments
+                                 if START <= appointment.slot.datetime.date() < END and appointment.slot.vet in capacity)
+    assert dict(zip(forecast["vet"].tolist(), forecast["fill_rate"].tolist())) == \
+        pytest.approx({vet: booked[vet] / total for vet, total in capacity.items()})
+
+    path = write_csv(forecast, tmp_path / "reports" / "forecast.csv")
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == list(forecast) and len(rows) == len(forecast["vet"]) + 1
+    assert dt.date.fromisoformat(rows[1][0]) == END - dt.timedelta(days=END.weekday())
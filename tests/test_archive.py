@@ -0,0 +1,67 @@
+# Archive of the past (persistence_logic.archive, AppointmentStorage.archive): the records before
+# the cutoff move to monthly segments and leave the working set; the historical lookups find them
+# and only decompress the segments of their time range
+import datetime as dt
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from persistence_logic.archive import ArchiveStore
+from slot_times import Slot
+
+CUTOFF = dt.datetime(2026, 3, 1)
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def appointments():
+    # January to April, one a week
+    return [Appointment(f"Customer {number % 3}", Slot(dt.datetime(2026, 1, 5, 9) + dt.timedelta(weeks=number), "Dr. One"))
+            for number in range(16)]
+
+def test_past_moves_to_the_archive(data_dir):
+    booked = appointments()
+    past = [appointment for appointment in booked if appointment.slot.datetime < CUTOFF]
+    reserved = [Slot(dt.datetime(2026, 2, 2, 10), "Dr. One"), Slot(dt.datetime(2026, 4, 6, 10), "Dr. One")]
+    storage_logic.save_state(booked, [], reserved)
+    storage = storage_logic.AppointmentStorage()
+
+    assert storage.archive(CUTOFF) == len(past)
+    assert set(storage.appointments) == set(booked) - set(past)
+    assert storage.reserved_slots == reserved[1:]
+    assert storage.archive(CUTOFF) == 0
+    storage.close()
+
+    assert set(storage_logic.AppointmentStorage().appointments) == set(booked) - set(past)
+    archive = ArchiveStore(data_dir / "archive")
+    assert [entry["appointments"] for entry in archive.manifest] == [4, 4]
+    assert archive.between() == past
+    assert archive.slots_between() == reserved[:1]
+    assert archive.by_customer("Customer 1") == [a for a in past if a.customer == "Customer 1"]
+    assert archive.find(past[2].customer, past[2].slot) == past[2]
+    assert archive.find("Nobody", past[2].slot) is None
+
+def test_lookup_reads_only_its_months(data_dir):
+    past = [appointment for appointment in appointments() if appointment.slot.datetime < CUTOFF]
+    ArchiveStore(data_dir / "archive").append(past, [], [])
+    archive = ArchiveStore(data_dir / "archive")
+    february = archive.between(dt.datetime(2026, 2, 1), dt.datetime(2026, 3, 1))
+    assert february == [a for a in past if a.slot.datetime.month == 2]
+    assert archive.segment_loads == 1
+
+def test_records_archived_twice_are_returned_once(data_dir):
+    past = appointments()[:3]
+    archive = ArchiveStore(data_dir / "archive")
+    archive.append(past, [], [])
+    archive.append(past, [], [])
+    assert archive.stats()["segments"] == 2
+    assert archive.between() == past
@@ -0,0 +1,75 @@
+# Availability cache (availability_logic.cache.AvailabilityCache): a (vet, date) is computed once,
+# then dropped by the slot events touching it; a fill that raced with a change is not stored
+import datetime as dt
+
+import pytest
+
+from appointments_logic import events
+from appointments_logic.core import make_appointment
+from appointments_logic.service import create_appointment, get_available_slots_for_vet
+from availability_logic.cache import AvailabilityCache
+from constants import VET_SCHEDULES
+from slot_times import Slot, make_daily_slots
+
+@pytest.fixture
+def cache():
+    cache = AvailabilityCache(max_entries=4)
+    yield cache
+    cache.close()
+
+def counting(value):
+    calls = []
+    def compute():
+        calls.append(True)
+        return list(value)
+    return compute, calls
+
+def test_computed_once_and_copied(cache):
+    compute, calls = counting([1, 2])
+    key = ("Dr. One", dt.date(2026, 1, 5))
+    first = cache.get_or_compute(key, compute)
+    first.append(3)
+    assert cache.get_or_compute(key, compute) == [1, 2]
+    assert len(calls) == 1 and cache.stats()["hits"] == 1
+
+def test_slot_events_invalidate_their_vet_day(cache):
+    day = dt.date(2026, 1, 5)
+    compute, calls = counting([])
+    for key in (("Dr. One", day), ("Dr. Two", day), ("Dr. One", day + dt.timedelta(days=1))):
+        cache.get_or_compute(key, compute)
+    events.emit("book", Slot(dt.datetime.combine(day, dt.time(9)), "Dr. One"))
+    for key in (("Dr. One", day), ("Dr. Two", day), ("Dr. One", day + dt.timedelta(days=1))):
+        cache.get_or_compute(key, compute)
+    assert len(calls) == 4
+    events.emit("schedule")
+    assert len(cache) == 0
+
+def test_fill_racing_with_a_change_is_dropped(cache):
+    key = ("Dr. One", dt.date(2026, 1, 5))
+    def compute():
+        cache.invalidate(*key)
+        return ["stale"]
+    assert cache.get_or_compute(key, compute) == ["stale"]
+    assert len(cache) == 0 and cache.stats()["dropped_fills"] == 1
+
+def test_least_recently_used_is_evicted(cache):
+    keys = [("Dr. One", dt.date(2026, 1, day)) for day in range(1, 6)]
+    for key in keys:
+        cache.get_or_compute(key, lambda: [])
+    assert len(cache) == 4 and cache.stats()["evictions"] == 1
+    compute, calls = counting([])
+    cache.get_or_compute(keys[0], compute)
+    assert calls == [True]
+
+def test_booking_through_the_service_is_seen(cache):
+    date = dt.date.today() + dt.timedelta(days=7)
+    while not make_daily_slots(None, date):
+        date += dt.timedelta(days=1)
+    slot = sorted(make_daily_slots(None, date))[0]
+    moment = dt.datetime.combine(date, dt.time())
+    available_slots, reserved_slots = sorted(make_daily_slots(None, date)), []
+    before = get_available_slots_for_vet(slot.vet, moment, VET_SCHEDULES, reserved_slots, cache=cache)
+    assert slot in before
+    create_appointment([], make_appointment("Ann", slot), available_slots, reserved_slots)
+    after = get_available_slots_for_vet(slot.vet, moment, VET_SCHEDULES, reserved_slots, cache=cache)
+    assert slot not in after and set(after) == set(before) - {slot}
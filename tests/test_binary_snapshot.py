@@ -0,0 +1,55 @@
+# Binary snapshot (persistence_logic.binary_snapshot): a written state loads back whole, and the
+# column queries answer without materializing it
+import datetime as dt
+
+import pytest
+
+from appointments_logic.core import Appointment
+from persistence_logic.binary_snapshot import BinarySnapshot, write_snapshot
+from slot_times import Slot
+
+START = dt.datetime(2026, 1, 5, 9)
+VETS = ("Dr. One", "Dr. Two", "Dr. Ünal")
+
+@pytest.fixture
+def state():
+    appointments = [Appointment(f"Customer {number % 11} é", Slot(START + dt.timedelta(minutes=30 * number), VETS[number % 3]))
+                    for number in range(100)]
+    available_slots = [Slot(START + dt.timedelta(days=10, minutes=30 * number), VETS[number % 3]) for number in range(20)]
+    reserved_slots = [Slot(START + dt.timedelta(days=20, minutes=30 * number), VETS[number % 2]) for number in range(5)]
+    return appointments, available_slots, reserved_slots
+
+def test_round_trip(tmp_path, state):
+    write_snapshot(tmp_path / "snapshot.bin", state[0][::-1], state[1], state[2])
+    snapshot = BinarySnapshot(tmp_path / "snapshot.bin")
+    try:
+        appointments, available_slots, reserved_slots = snapshot.load()
+        assert set(appointments) == set(state[0]) and len(appointments) == len(snapshot) == len(state[0])
+        assert sorted(available_slots) == sorted(state[1])
+        assert sorted(reserved_slots) == sorted(state[2])
+    finally:
+        snapshot.close()
+
+def test_queries(tmp_path, state):
+    appointments, available_slots, reserved_slots = state
+    write_snapshot(tmp_path / "snapshot.bin", appointments, available_slots, reserved_slots)
+    snapshot = BinarySnapshot(tmp_path / "snapshot.bin")
+    try:
+        booked, free = appointments[7], available_slots[3]
+        assert snapshot.has_appointment(booked.customer, booked.slot)
+        assert not snapshot.has_appointment("Nobody", booked.slot)
+        assert snapshot.is_booked(booked.slot) and not snapshot.is_booked(free)
+        assert snapshot.is_reserved(reserved_slots[1]) and not snapshot.is_reserved(booked.slot)
+        assert not snapshot.is_booked(Slot(booked.slot.datetime, "Dr. Unknown"))
+
+        low, high = START + dt.timedelta(hours=5), START + dt.timedelta(hours=20)
+        between = [appointment for appointment in appointments if low <= appointment.slot.datetime < high]
+        assert between and set(snapshot.appointments_between(low, high)) == set(between)
+        assert sorted(snapshot.taken_slots("Dr. Two", low, high)) == sorted(a.slot for a in between if a.slot.vet == "Dr. Two")
+    finally:
+        snapshot.close()
+
+def test_not_a_snapshot(tmp_path):
+    (tmp_path / "snapshot.bin").write_bytes(b"not a snapshot" * 10)
+    with pytest.raises(ValueError):
+        BinarySnapshot(tmp_path / "snapshot.bin")
@@ -0,0 +1,98 @@
+# Batch bookings (appointments_logic.service.create_appointments_batch): one result per request,
+# the first request of the batch wins a slot, and with a storage the bookings are one transaction
+import datetime as dt
+import json
+import logging
+import sys
+import threading
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from appointments_logic.locking import VetDayLocks
+from appointments_logic.series import make_rule
+from appointments_logic.service import create_appointment, create_appointments_batch
+from slot_times import make_daily_slots
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def future_slots():
+    date = dt.date.today() + dt.timedelta(days=7)
+    while len(make_daily_slots(None, date)) < 4:
+        date += dt.timedelta(days=1)
+    return sorted(make_daily_slots(None, date))
+
+def request(customer, slot) -> dict:
+    return {"customer": customer, "vet": slot.vet, "datetime": slot.datetime.isoformat(timespec="minutes")}
+
+def test_results_per_request_with_lists():
+    slots = future_slots()
+    appointments, available_slots, reserved_slots = [], list(slots[1:]), [slots[0]]
+    saved = []
+    requests = [request("Ann", slots[1]), "not json", request("Bob", slots[1]), request("Cid", slots[0]),
+                request("", slots[2]), json.dumps(request("Dan", slots[2]))]
+    results = create_appointments_batch(requests, appointments, available_slots, reserved_slots,
+                                        persist=lambda: saved.append(True), locks=VetDayLocks())
+
+    assert [result["status"] for result in results] == ["booked", "rejected", "rejected", "rejected", "rejected", "booked"]
+    assert [result["index"] for result in results] == list(range(6))
+    assert results[1]["reason"].startswith("invalid request")
+    assert results[2]["reason"].startswith("conflict")
+    assert results[3]["reason"] == "the slot is either reserved or unavailable"
+    assert results[4]["reason"] == "invalid customer"
+    assert appointments == [Appointment("Ann", slots[1]), Appointment("Dan", slots[2])]
+    assert slots[1] not in available_slots and slots[2] in reserved_slots
+    assert saved == [True]
+
+def test_storage_batch_is_one_transaction(data_dir):
+    slots = future_slots()
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    storage.add_appointment(Appointment("Zoe", slots[0]))
+    storage.reserve_slot(slots[1])
+    assert storage.book_series("Yan", slots[2].vet, make_rule(slots[2].datetime, count=1)) is not None
+    requests = [request("Ann", slot) for slot in slots[:4]] + [request("Bob", slots[3])]
+    results = create_appointments_batch(requests, storage=storage)
+
+    assert [result["status"] for result in results] == ["rejected", "rejected", "rejected", "booked", "rejected"]
+    assert results[4]["reason"].startswith("conflict")
+    assert storage.appointments.by_slot(slots[3]) == [Appointment("Ann", slots[3])]
+    storage.close()
+    reloaded = storage_logic.AppointmentStorage(journaled=True)
+    assert set(reloaded.appointments) == {Appointment("Zoe", slots[0]), Appointment("Ann", slots[3])}
+    reloaded.close()
+
+def test_batch_and_single_bookings_do_not_double_book():
+    # switch threads as often as possible, inside the checks of the batch included
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    date = dt.date.today() + dt.timedelta(days=7)
+    slots = sorted(slot for day in range(30) for slot in make_daily_slots(None, date + dt.timedelta(days=day)))
+    appointments, available_slots, reserved_slots = [], list(slots), []
+    locks = VetDayLocks()
+    start = threading.Barrier(2)
+
+    def singles():
+        start.wait()
+        for slot in slots:
+            create_appointment(appointments, Appointment("Single", slot), available_slots, reserved_slots, locks=locks)
+
+    thread = threading.Thread(target=singles)
+    logging.disable(logging.WARNING)
+    try:
+        thread.start()
+        start.wait()
+        create_appointments_batch([request("Batch", slot) for slot in slots], appointments, available_slots, reserved_slots, locks=locks)
+        thread.join()
+    finally:
+        logging.disable(logging.NOTSET)
+        sys.setswitchinterval(interval)
+    assert sorted(appointment.slot for appointment in appointments) == slots
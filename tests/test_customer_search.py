@@ -0,0 +1,41 @@
+# Customer prefix search (appointments_logic.index.AppointmentIndex.search_customers):
+# case-insensitive, in time order, from `since`, at most `limit`; the merge of the per-customer
+# lists and the walk of the time index (a small limit over many names) give the same answer
+import datetime as dt
+
+import pytest
+
+from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex
+from slot_times import Slot
+
+START = dt.datetime(2026, 1, 5, 9)
+NAMES = ("Anna", "anne", "ANNIKA", "Bob", "Annabel", "Cid", "Anya")
+
+@pytest.fixture
+def index():
+    return AppointmentIndex(Appointment(NAMES[number % len(NAMES)], Slot(START + dt.timedelta(hours=number), "Dr. One"))
+                            for number in range(200))
+
+def scan(index, prefix, since=None, limit=None):
+    found = [appointment for appointment in index.ordered() if appointment.customer.casefold().startswith(prefix.casefold())
+             and (since is None or appointment.slot.datetime >= since)]
+    return found[:limit] if limit is not None else found
+
+def test_customers_with_prefix(index):
+    assert index.customers_with_prefix("ANN") == ["anna", "annabel", "anne", "annika"]
+    assert index.customers_with_prefix("z") == []
+
+@pytest.mark.parametrize("prefix", ["ann", "A", "Bob", "", "x"])
+@pytest.mark.parametrize("limit", [None, 1, 5, 1000])
+def test_search_matches_a_scan(index, prefix, limit):
+    since = START + dt.timedelta(hours=37)
+    assert index.search_customers(prefix, limit=limit) == scan(index, prefix, limit=limit)
+    assert index.search_customers(prefix, since=since, limit=limit) == scan(index, prefix, since, limit)
+
+def test_search_follows_removals(index):
+    for appointment in index.by_customer("anne"):
+        index.remove(appointment)
+    assert "anne" not in index.customers_with_prefix("ann")
+    assert index.search_customers("anne") == []
+    assert all(appointment.customer != "anne" for appointment in index.search_customers("ann", limit=3))
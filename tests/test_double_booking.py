@@ -0,0 +1,90 @@
+# One booking per slot (storage_logic.AppointmentStorage): the same rule for every engine, and a
+# migration of JSON data that breaks it reports the extra bookings instead of failing half-way; a
+# migration never wipes a target from a bad source, nor overwrites its data without force
+import datetime as dt
+import json
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from persistence_logic.migrate import migrate_json_to_shards, migrate_json_to_sqlite
+from persistence_logic.sqlite_engine import SQLiteStorageEngine
+from slot_times import Slot
+
+SLOT = Slot(dt.datetime(2026, 1, 5, 9), "Dr. One")
+OTHER_SLOT = Slot(dt.datetime(2026, 1, 5, 10), "Dr. One")
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+ENGINES = {
+    "json": lambda data_dir: storage_logic.AppointmentStorage(),
+    "json journaled": lambda data_dir: storage_logic.AppointmentStorage(journaled=True),
+    "sqlite": lambda data_dir: storage_logic.AppointmentStorage(SQLiteStorageEngine(data_dir / "appointments.db")),
+}
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_a_slot_holds_one_booking(data_dir, engine):
+    storage = ENGINES[engine](data_dir)
+    assert storage.add_appointment(Appointment("Ann", SLOT)) is not None
+    assert storage.add_appointment(Appointment("Bob", SLOT)) is None
+
+    storage.add_appointment(Appointment("Bob", OTHER_SLOT))
+    storage.update_appointment(Appointment("Bob", OTHER_SLOT), Appointment("Bob", SLOT))
+    # the customer of a booking can still be changed in place
+    storage.update_appointment(Appointment("Ann", SLOT), Appointment("Ann Smith", SLOT))
+    assert set(storage.appointments) == {Appointment("Ann Smith", SLOT), Appointment("Bob", OTHER_SLOT)}
+
+    storage.reserve_slot(OTHER_SLOT)
+    storage.reserve_slot(OTHER_SLOT)
+    assert storage.reserved_slots == [OTHER_SLOT]
+    storage.close()
+
+def test_migration_reports_double_bookings(data_dir):
+    booked = [Appointment("Ann", SLOT), Appointment("Bob", SLOT), Appointment("Cid", OTHER_SLOT)]
+    storage_logic.save_state(booked, [], [])
+    engine = migrate_json_to_sqlite(data_dir / "appointments.db")
+    appointments = engine.load()[0]
+    engine.close(None)
+
+    assert appointments == [booked[0], booked[2]]
+    report = json.loads((data_dir / "appointments.duplicates.json").read_text())
+    assert report == [storage_logic.serialize_appointment(booked[1])]
+
+@pytest.mark.parametrize("damage", ["missing", "corrupt"])
+def test_migration_from_a_bad_source_keeps_the_target(data_dir, damage):
+    storage_logic.save_state([Appointment("Ann", SLOT)], [], [])
+    migrate_json_to_sqlite(data_dir / "appointments.db").close(None)
+    if damage == "missing":
+        storage_logic.APPOINTMENTS_FILE.unlink()
+    else:
+        storage_logic.APPOINTMENTS_FILE.write_text('[{"customer": "Bob", ')
+    with pytest.raises((OSError, ValueError)):
+        migrate_json_to_sqlite(data_dir / "appointments.db", force=True)
+    engine = SQLiteStorageEngine(data_dir / "appointments.db")
+    assert engine.load()[0] == [Appointment("Ann", SLOT)]
+    engine.close(None)
+
+def test_migration_overwrites_data_only_with_force(data_dir):
+    storage_logic.save_state([Appointment("Ann", SLOT)], [], [])
+    migrate_json_to_sqlite(data_dir / "appointments.db").close(None)
+    migrate_json_to_shards(data_dir / "shards")
+    storage_logic.save_state([Appointment("Bob", SLOT)], [], [])
+    with pytest.raises(FileExistsError):
+        migrate_json_to_sqlite(data_dir / "appointments.db")
+    with pytest.raises(FileExistsError):
+        migrate_json_to_shards(data_dir / "shards")
+
+    engine = migrate_json_to_sqlite(data_dir / "appointments.db", force=True)
+    assert engine.load()[0] == [Appointment("Bob", SLOT)]
+    engine.close(None)
+    assert migrate_json_to_shards(data_dir / "shards", force=True).load()[0] == [Appointment("Bob", SLOT)]
@@ -0,0 +1,96 @@
+# Availability horizon (availability_logic.horizon.AvailabilityHorizon): the free slots of the
+# window are precomputed from the storage, the booked days are recomputed, the window moves with
+# the days and falls back outside it or after a schedule change
+import datetime as dt
+import logging
+import time
+
+import pytest
+
+import storage_logic
+from appointments_logic import events
+from appointments_logic.core import Appointment
+from availability_logic.horizon import AvailabilityHorizon
+from slot_times import make_daily_slots
+
+TODAY = dt.date.today() + dt.timedelta(days=7)
+
+@pytest.fixture
+def storage(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    yield storage
+    storage.close()
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+@pytest.fixture
+def clock():
+    return {"today": TODAY}
+
+@pytest.fixture
+def horizon(storage, clock):
+    horizon = AvailabilityHorizon(storage, window_days=14, today=lambda: clock["today"])
+    yield horizon
+    horizon.close()
+
+def working_day(start: dt.date) -> dt.date:
+    while not make_daily_slots(None, start):
+        start += dt.timedelta(days=1)
+    return start
+
+def expected(storage, vet, date):
+    taken = set(storage.taken_slots(vet, date))
+    return sorted(slot for slot in make_daily_slots(None, date) if slot.vet == vet and slot not in taken)
+
+def test_window_reads_and_fallbacks(storage, horizon):
+    date = working_day(TODAY)
+    vet = sorted(make_daily_slots(None, date))[0].vet
+    assert horizon.free_slots(vet, date) == expected(storage, vet, date)
+    assert horizon.free_slots(vet, TODAY - dt.timedelta(days=1)) is None
+    assert horizon.free_slots(vet, TODAY + dt.timedelta(days=14)) is None
+    assert date in horizon and TODAY + dt.timedelta(days=14) not in horizon
+
+def test_bookings_are_seen(storage, horizon):
+    date = working_day(TODAY)
+    slot = sorted(make_daily_slots(None, date))[0]
+    storage.add_appointment(Appointment("Ann", slot))
+    storage.reserve_slot(sorted(make_daily_slots(None, date))[1])
+    assert horizon.stats()["dirty"] >= 1
+    assert horizon.free_slots(slot.vet, date) == expected(storage, slot.vet, date)
+    assert slot not in horizon.free_slots(slot.vet, date)
+    horizon.maintain()
+    assert horizon.stats()["dirty"] == 0
+
+def test_window_moves_with_the_days(storage, horizon, clock):
+    clock["today"] = TODAY + dt.timedelta(days=3)
+    horizon.maintain()
+    assert (horizon.start, horizon.end) == (TODAY + dt.timedelta(days=3), TODAY + dt.timedelta(days=17))
+    assert TODAY not in horizon
+    date = working_day(TODAY + dt.timedelta(days=14))
+    vet = sorted(make_daily_slots(None, date))[0].vet
+    # a day that entered the window at its end
+    assert date < horizon.end and horizon.free_slots(vet, date) == expected(storage, vet, date)
+
+def test_schedule_change_falls_back_until_rebuilt(storage, horizon):
+    date = working_day(TODAY)
+    vet = sorted(make_daily_slots(None, date))[0].vet
+    events.emit("schedule")
+    assert horizon.free_slots(vet, date) is None
+    horizon.maintain()
+    assert horizon.free_slots(vet, date) == expected(storage, vet, date)
+
+def test_worker_recomputes_the_dirty_days(storage, horizon):
+    horizon.start_worker()
+    slot = sorted(make_daily_slots(None, working_day(TODAY)))[0]
+    storage.add_appointment(Appointment("Ann", slot))
+    deadline = time.monotonic() + 5
+    while horizon.stats()["dirty"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert horizon.stats()["dirty"] == 0
+    recomputes = horizon.stats()["recomputes"]
+    assert slot not in horizon.free_slots(slot.vet, slot.datetime.date())
+    assert horizon.stats()["recomputes"] == recomputes
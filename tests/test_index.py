@@ -0,0 +1,56 @@
+# Indexed appointment store (appointments_logic.index.AppointmentIndex): the list API and the
+# slot/vet/date/time lookups stay in step through appends and removals
+import datetime as dt
+import random
+
+import pytest
+
+from appointments_logic.core import Appointment
+from appointments_logic.index import AppointmentIndex
+from slot_times import Slot
+
+START = dt.datetime(2026, 1, 5, 9)
+VETS = ("Dr. One", "Dr. Two", "Dr. Three")
+
+def sample(count: int = 60):
+    return [Appointment(f"Customer {number % 7}", Slot(START + dt.timedelta(hours=number * 5), VETS[number % 3]))
+            for number in range(count)]
+
+def test_list_api():
+    appointments = sample(5)
+    index = AppointmentIndex(appointments)
+    index.append(appointments[0])
+    assert len(index) == 5 and index == appointments
+    assert appointments[2] in index and "not an appointment" not in index
+    index.remove(appointments[2])
+    assert appointments[2] not in index and list(index) == appointments[:2] + appointments[3:]
+    with pytest.raises(ValueError):
+        index.remove(appointments[2])
+    index.clear()
+    assert len(index) == 0 and index.ordered() == []
+
+def test_lookups_match_a_scan_after_removals():
+    appointments = sample()
+    index = AppointmentIndex(reversed(appointments))
+    removed = random.Random(5).sample(appointments, 20)
+    for appointment in removed:
+        index.remove(appointment)
+    kept = [appointment for appointment in appointments if appointment not in removed]
+
+    def by_time(found):
+        return sorted(found, key=lambda appointment: (appointment.slot.datetime, appointment.slot.vet, appointment.customer))
+
+    assert index.ordered() == by_time(kept)
+    for vet in VETS:
+        assert index.by_vet(vet) == by_time(a for a in kept if a.slot.vet == vet)
+    for appointment in appointments:
+        assert index.by_slot(appointment.slot) == [a for a in kept if a.slot == appointment.slot]
+        assert index.is_slot_booked(appointment.slot) == (appointment in kept)
+        assert index.find(appointment.customer, appointment.slot) == (appointment if appointment in kept else None)
+        date = appointment.slot.datetime.date()
+        assert index.by_date(date) == by_time(a for a in kept if a.slot.datetime.date() == date)
+
+    low, high = START + dt.timedelta(days=2), START + dt.timedelta(days=6)
+    assert index.between(low, high) == by_time(a for a in kept if low <= a.slot.datetime < high)
+    assert index.between(high, low) == []
+    assert index.by_customer("customer 3", since=low) == by_time(a for a in kept if a.customer == "Customer 3" and a.slot.datetime >= low)
@@ -0,0 +1,67 @@
+# Crash recovery of the write-ahead journal (persistence_logic.journal): a torn or corrupted last
+# record is dropped on load, the records before it are replayed and the file is cut back to them
+import datetime as dt
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from persistence_logic.journal import Journal
+from slot_times import Slot
+
+RECORDS = 10
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def write_records(count: int):
+    storage_logic.save_state([], [], [])
+    journal = Journal(storage_logic.JOURNAL_FILE)
+    appointments = [Appointment(f"Customer {number}", Slot(dt.datetime(2026, 1, 5, 9) + dt.timedelta(days=number), "Dr. Test"))
+                    for number in range(count)]
+    for appointment in appointments:
+        journal.append("add", storage_logic.serialize_appointment(appointment))
+    journal.close()
+    return appointments
+
+def corrupt_checksum(line: bytes) -> bytes:
+    digit = b"0" if line[:1] != b"0" else b"1"
+    return digit + line[1:]
+
+# the crash cut the last line in the middle of its payload / its bytes were damaged / both
+TAILS = {
+    "truncated": lambda line: line[:len(line) // 2],
+    "checksum": corrupt_checksum,
+    "truncated_checksum": lambda line: corrupt_checksum(line)[:len(line) // 2],
+}
+
+@pytest.mark.parametrize("damage", TAILS)
+def test_damaged_tail_record_is_dropped_and_cut(data_dir, damage):
+    appointments = write_records(RECORDS)
+    lines = storage_logic.JOURNAL_FILE.read_bytes().splitlines(keepends=True)
+    assert len(lines) == RECORDS
+    valid = b"".join(lines[:-1])
+    storage_logic.JOURNAL_FILE.write_bytes(valid + TAILS[damage](lines[-1]))
+
+    loaded, available_slots, reserved_slots = storage_logic.load_state()
+    assert set(loaded) == set(appointments[:-1])
+    assert storage_logic.JOURNAL_FILE.read_bytes() == valid
+
+    # the journal keeps appending after the valid records
+    journal = Journal(storage_logic.JOURNAL_FILE)
+    journal.append("add", storage_logic.serialize_appointment(appointments[-1]))
+    journal.close()
+    assert set(storage_logic.load_state()[0]) == set(appointments)
+
+def test_intact_journal_is_replayed_whole(data_dir):
+    appointments = write_records(RECORDS)
+    size = storage_logic.JOURNAL_FILE.stat().st_size
+    assert set(storage_logic.load_state()[0]) == set(appointments)
+    assert storage_logic.JOURNAL_FILE.stat().st_size == size
@@ -0,0 +1,92 @@
+# Threaded stress test of the vet-day locking (appointments_logic.locking) through the service:
+# every thread tries to book every slot of many vet-days, so the stripes mutate the shared slot
+# lists at the same time; each slot must end up booked exactly once
+import datetime as dt
+import logging
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+from slot_times import make_daily_slots
+from appointments_logic.core import make_appointment
+from appointments_logic.index import AppointmentIndex
+from appointments_logic.locking import VetDayLocks
+from appointments_logic.service import cancel_appointment, create_appointment
+
+THREADS = 8
+DAYS = 60
+
+@pytest.fixture(autouse=True)
+def frequent_switches():
+    # switch threads as often as possible, inside list.remove and `in` included
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    logging.disable(logging.WARNING)
+    yield
+    logging.disable(logging.NOTSET)
+    sys.setswitchinterval(interval)
+
+def make_slots():
+    start = dt.date(2026, 1, 5)
+    return sorted(slot for day in range(DAYS) for slot in make_daily_slots(None, start + dt.timedelta(days=day)))
+
+def run_threads(target, count: int = THREADS) -> None:
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(number: int) -> None:
+        barrier.wait()
+        try:
+            target(number)
+        except Exception as err:
+            errors.append(err)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(count)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    assert not errors, errors[:3]
+
+def test_concurrent_bookings_book_every_slot_once():
+    slots = make_slots()
+    available_slots, reserved_slots = list(slots), []
+    appointments = AppointmentIndex()
+    locks = VetDayLocks()
+    booked = Counter()
+    counter_lock = threading.Lock()
+
+    def book(number: int) -> None:
+        # each thread walks the slots from another offset, so the vet-days interleave
+        offset = number * len(slots) // THREADS
+        for slot in slots[offset:] + slots[:offset]:
+            result, _, _ = create_appointment(appointments, make_appointment(f"Customer {number}", slot),
+                                              available_slots, reserved_slots, locks=locks)
+            if result is not None:
+                with counter_lock:
+                    booked[slot] += 1
+
+    run_threads(book)
+    assert [slot for slot, times in booked.items() if times > 1] == []
+    assert set(booked) == set(slots)
+    assert len(appointments) == len(slots)
+    assert sorted(reserved_slots) == slots
+    assert available_slots == []
+
+def test_concurrent_cancellations_free_every_slot_once():
+    slots = make_slots()
+    appointments = AppointmentIndex([make_appointment(f"Customer {index}", slot) for index, slot in enumerate(slots)])
+    available_slots, reserved_slots = [], list(slots)
+    locks = VetDayLocks()
+    booked = list(appointments)
+
+    def cancel(number: int) -> None:
+        for appointment in booked[number::THREADS]:
+            cancel_appointment(appointments, appointment, available_slots, reserved_slots, locks=locks)
+
+    run_threads(cancel)
+    assert len(appointments) == 0
+    assert reserved_slots == []
+    assert sorted(available_slots) == slots
@@ -0,0 +1,33 @@
+# Logging configuration (logging_setup): the record attributes the format does not use are not
+# collected while it is configured, and the logging module settings are restored when it stops
+import logging
+
+import pytest
+
+import logging_setup
+
+SETTINGS = ("_srcfile", "logProcesses", "logMultiprocessing", "logThreads")
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    logging_setup.stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_logging_settings_are_restored(root_logger):
+    defaults = {name: getattr(logging, name) for name in SETTINGS}
+    logging_setup.configure_logging(log_format="%(levelname)s %(message)s")
+    assert logging._srcfile is None and not logging.logThreads
+    logging_setup.stop_logging()
+    assert {name: getattr(logging, name) for name in SETTINGS} == defaults
+
+def test_format_using_the_caller_collects_it(root_logger):
+    logging_setup.configure_logging(log_format="%(levelname)s %(message)s")
+    logging_setup.configure_logging(log_format="%(lineno)d %(thread)d %(message)s", asynchronous=False)
+    assert logging._srcfile is not None and logging.logThreads
@@ -0,0 +1,20 @@
+# Request captures (metrics.capture): one at a time in the process
+import pytest
+
+import metrics
+
+def test_second_capture_is_refused_while_one_is_active():
+    with metrics.capture(cpu=True) as first:
+        with pytest.raises(metrics.CaptureBusyError):
+            with metrics.capture(cpu=True):
+                pass
+        sum(range(1000))
+    assert "function calls" in first.cpu_report
+
+def test_capture_is_free_again_after_a_failure():
+    with pytest.raises(ZeroDivisionError):
+        with metrics.capture(cpu=True, memory=True):
+            1 / 0
+    with metrics.capture(cpu=False, memory=True) as captured:
+        bytearray(1024)
+    assert captured.memory_peak > 0
@@ -0,0 +1,18 @@
+# Weekday filter of the free slot search (availability_logic.search): names or numbers 0-6 only
+import datetime as dt
+
+import pytest
+
+from availability_logic.search import first_free_slots
+
+START = dt.datetime(2026, 1, 5, 8)
+
+@pytest.mark.parametrize("weekdays", [[7], [-1], "Monday", ["monday"], [True], [1.0], 3])
+def test_invalid_weekdays_are_rejected(weekdays):
+    with pytest.raises(ValueError):
+        first_free_slots(START, weekdays=weekdays)
+
+def test_weekdays_by_name_or_number():
+    by_name = first_free_slots(START, 10, weekdays=["Tuesday", "Saturday"])
+    assert by_name == first_free_slots(START, 10, weekdays=[1, 5])
+    assert by_name and {slot.datetime.weekday() for slot in by_name} <= {1, 5}
@@ -0,0 +1,73 @@
+# Recurring series in the storage (appointments_logic.series): a moved occurrence must land on a
+# free scheduled slot, and the series log follows the storage's engine
+import datetime as dt
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from appointments_logic.series import make_rule
+from persistence_logic.sqlite_engine import SQLiteStorageEngine
+from slot_times import Slot, make_daily_slots
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+# Two scheduled slots of one vet on a future day
+def vet_slots():
+    date = dt.date.today() + dt.timedelta(days=7)
+    while True:
+        slots = sorted(make_daily_slots(None, date))
+        vet = slots[0].vet if slots else None
+        same_vet = [slot for slot in slots if slot.vet == vet]
+        if len(same_vet) >= 2:
+            return same_vet
+        date += dt.timedelta(days=1)
+
+def test_moved_occurrence_needs_a_free_scheduled_slot(data_dir):
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    first, second = vet_slots()[:2]
+    series = storage.book_series("Ann", first.vet, make_rule(first.datetime, count=3))
+    assert series is not None
+    occurrence = Appointment("Ann", first)
+
+    sunday = first.datetime + dt.timedelta(days=(6 - first.datetime.weekday()) % 7 or 7)
+    for target in (Slot(sunday.replace(hour=3, minute=0), first.vet), Slot(first.datetime.replace(second=30), first.vet)):
+        storage.update_appointment(occurrence, Appointment("Ann", target))
+        assert storage.series.find("Ann", first) == (series, 0)
+
+    storage.reserve_slot(second)
+    storage.update_appointment(occurrence, Appointment("Ann", second))
+    assert storage.series.find("Ann", first) == (series, 0)
+    assert storage.series.occupant(second) is None
+    storage.close()
+
+def test_moved_occurrence_to_a_free_slot(data_dir):
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    first, second = vet_slots()[:2]
+    series = storage.book_series("Ann", first.vet, make_rule(first.datetime, count=3))
+    storage.update_appointment(Appointment("Ann", first), Appointment("Ann", second))
+    assert storage.series.find("Ann", second) == (series, 0)
+    assert storage.series.occupant(first) is None
+    storage.close()
+
+def test_series_log_follows_the_engine(data_dir):
+    first = vet_slots()[0]
+    storages = [storage_logic.AppointmentStorage(SQLiteStorageEngine(data_dir / name / "appointments.db")) for name in ("one", "two")]
+    storages[0].book_series("Ann", first.vet, make_rule(first.datetime, count=2))
+    assert storages[1].book_series("Bob", first.vet, make_rule(first.datetime, count=2)) is not None
+    for storage in storages:
+        storage.close()
+    assert (data_dir / "one" / "appointments.series.log").exists()
+    assert not (data_dir / storage_logic.SERIES_FILE.name).exists()
+    reloaded = storage_logic.AppointmentStorage(SQLiteStorageEngine(data_dir / "one" / "appointments.db"))
+    assert [series.customer for series in reloaded.series] == ["Ann"]
+    reloaded.close()
@@ -0,0 +1,88 @@
+# Booking requests of the asyncio server (server.BookingServer): a booking the storage refuses is
+# reported as failed and leaves its slot free, past slots are refused, and the locks are a fixed
+# set of stripes whatever the requests send
+import asyncio
+import datetime as dt
+import json
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.series import make_rule
+from server import BookingServer
+from slot_times import make_daily_slots
+
+@pytest.fixture
+def booking_server(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    server = BookingServer(storage)
+    yield server
+    server.close()
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def future_slots():
+    date = dt.date.today() + dt.timedelta(days=7)
+    while not make_daily_slots(None, date):
+        date += dt.timedelta(days=1)
+    return sorted(make_daily_slots(None, date))
+
+def request(server: BookingServer, **fields) -> dict:
+    return asyncio.run(server.handle_request(json.dumps(fields).encode()))
+
+def booking(slot, customer: str = "Ann") -> dict:
+    return {"op": "book", "customer": customer, "vet": slot.vet, "datetime": slot.datetime.isoformat(timespec="minutes")}
+
+def test_booking_refused_by_the_storage_fails_and_frees_the_slot(booking_server):
+    slot = future_slots()[0]
+    # a series booked behind the server's back: the bitset still sees the slot free
+    assert booking_server.storage.book_series("Bob", slot.vet, make_rule(slot.datetime, count=1)) is not None
+    response = request(booking_server, **booking(slot))
+    assert response["ok"] is False
+    assert booking_server.availability.is_free(slot)
+    assert booking_server.storage.find_appointment("Ann", slot) is None
+
+def test_booking_is_stored(booking_server):
+    slot = future_slots()[0]
+    assert request(booking_server, **booking(slot))["ok"] is True
+    assert not booking_server.availability.is_free(slot)
+    assert request(booking_server, **booking(slot, "Bob"))["ok"] is False
+
+def test_past_slot_is_refused(booking_server):
+    date = dt.date.today() - dt.timedelta(days=7)
+    while not make_daily_slots(None, date):
+        date -= dt.timedelta(days=1)
+    response = request(booking_server, **booking(sorted(make_daily_slots(None, date))[0]))
+    assert response == {"id": None, "ok": False, "error": "the slot is in the past"}
+
+def test_locks_do_not_grow_with_the_requests(booking_server):
+    stripes = len(booking_server._locks)
+    for days in range(200):
+        request(booking_server, op="cancel", customer="Ann", vet=future_slots()[0].vet,
+                datetime=(dt.datetime.now() + dt.timedelta(days=days)).isoformat(timespec="minutes"))
+    request(booking_server, **booking(future_slots()[1]))
+    assert len(booking_server._locks) == stripes
+
+def test_concurrent_profiled_requests_run_one_at_a_time(booking_server):
+    booking_server.profile_requests = True
+    slots = future_slots()
+
+    async def burst():
+        requests = [dict(booking(slot, f"Customer {index}"), profile="cpu" if index % 2 else None)
+                    for index, slot in enumerate(slots[:6])]
+        return await asyncio.gather(*(booking_server.handle_request(json.dumps(fields).encode()) for fields in requests))
+
+    responses = asyncio.run(burst())
+    assert [response["ok"] for response in responses] == [True] * 6
+    assert all("profile" in response for response in responses[1::2])
+    assert booking_server._in_flight == 0 and not booking_server._profiling
+
+def test_invalid_weekdays_are_a_request_error(booking_server):
+    for weekdays in ([7], "Monday"):
+        response = request(booking_server, op="next", weekdays=weekdays)
+        assert response["ok"] is False and response["error"].startswith(("Unknown weekday", "The weekdays must"))
@@ -0,0 +1,38 @@
+# Sharded engine (persistence_logic.sharded_engine): vets whose names only differ by punctuation
+# or case keep separate shards, and a slot holds one booking also outside the loaded months
+import datetime as dt
+import logging
+
+import storage_logic
+
+from appointments_logic.core import Appointment
+from persistence_logic.sharded_engine import ShardedStorageEngine, shard_file_name
+from slot_times import Slot
+
+VETS = ("Dr. A", "Dr A", "Dr-A", "dr a", "..")
+
+def test_shard_file_names_are_distinct():
+    names = {shard_file_name((vet, "2026-01")) for vet in VETS}
+    assert len(names) == len(VETS)
+    assert all(".." not in name.split("/") for name in names)
+
+def test_similar_vets_do_not_overwrite_each_other(tmp_path):
+    moment = dt.datetime(2026, 1, 5, 9)
+    appointments = [Appointment(f"Customer {number}", Slot(moment, vet)) for number, vet in enumerate(VETS)]
+    ShardedStorageEngine(tmp_path).save(appointments, [], [Slot(moment, vet) for vet in VETS])
+
+    loaded, available_slots, reserved_slots = ShardedStorageEngine(tmp_path).load()
+    assert set(loaded) == set(appointments)
+    assert {slot.vet for slot in reserved_slots} == set(VETS)
+
+def test_booked_slot_outside_the_loaded_range_is_refused(tmp_path):
+    slot = Slot(dt.datetime(2026, 3, 2, 9), "Dr. One")
+    ShardedStorageEngine(tmp_path).save([Appointment("Ann", slot)], [], [])
+    logging.disable(logging.WARNING)
+    storage = storage_logic.AppointmentStorage(ShardedStorageEngine(tmp_path, dt.date(2026, 1, 1), dt.date(2026, 1, 31)))
+    try:
+        assert storage.add_appointment(Appointment("Bob", slot)) is None
+        assert storage.add_appointment(Appointment("Bob", Slot(slot.datetime, "Dr. Two"))) is not None
+    finally:
+        logging.disable(logging.NOTSET)
+    assert set(ShardedStorageEngine(tmp_path).load()[0]) == {Appointment("Ann", slot), Appointment("Bob", Slot(slot.datetime, "Dr. Two"))}
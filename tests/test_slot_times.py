@@ -0,0 +1,30 @@
+# Compact slot keys (slot_times.Slot): only the clinic vets are numbered; the slots of any other
+# vet name stay distinct without growing the vet table
+import datetime as dt
+import pickle
+
+import pytest
+
+import slot_times
+from constants import VET_SCHEDULES
+from slot_times import VET_ID_SPACE, Slot, compact_slot_key
+
+MOMENT = dt.datetime(2026, 1, 5, 9)
+
+def test_other_vets_are_not_interned():
+    vets = len(slot_times._vet_ids)
+    slots = {Slot(MOMENT, f"Dr. {number}") for number in range(VET_ID_SPACE + 10)}
+    assert len(slots) == VET_ID_SPACE + 10
+    assert len(slot_times._vet_ids) == vets == len(VET_SCHEDULES)
+
+def test_other_vets_compare_by_name():
+    clinic_vet = next(iter(VET_SCHEDULES))
+    one, other = Slot(MOMENT, "Dr. One"), Slot(MOMENT, "Dr. Other")
+    assert one != other
+    assert one == Slot(MOMENT, "".join(["Dr. ", "One"])) and hash(one) == hash(Slot(MOMENT, "Dr. One"))
+    assert sorted([other, one, Slot(MOMENT, clinic_vet)]) == [Slot(MOMENT, clinic_vet), one, other]
+    assert pickle.loads(pickle.dumps(one)) == one
+
+def test_vet_id_outside_the_key_space_is_refused():
+    with pytest.raises(AssertionError):
+        compact_slot_key(MOMENT, VET_ID_SPACE)
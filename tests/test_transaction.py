@@ -0,0 +1,122 @@
+# Storage transactions (storage_logic.StorageTransaction): all or none, in memory when the commit
+# (or a single mutation) cannot be made durable, and on disk for the sharded engine when a shard
+# write fails or it crashes between two shards
+import datetime as dt
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic import events
+from appointments_logic.core import Appointment
+from persistence_logic.sharded_engine import INTENT_NAME, ShardedStorageEngine
+from slot_times import Slot
+
+MOMENT = dt.datetime(2026, 1, 5, 9)
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def test_failed_durability_rolls_the_transaction_back(data_dir, monkeypatch):
+    storage = storage_logic.AppointmentStorage(group_commit=True)
+    old_appointment = Appointment("Ann", Slot(MOMENT, "Dr. One"))
+    storage.add_appointment(old_appointment)
+    new_appointment = Appointment("Ann", Slot(MOMENT, "Dr. Two"))
+
+    def failed_flush(pending):
+        raise OSError("the flush failed")
+
+    seen = []
+    listener = events.subscribe(lambda kind, slots: seen.append((kind, slots)))
+    monkeypatch.setattr(storage.engine, "wait", failed_flush)
+    try:
+        with pytest.raises(OSError):
+            with storage.transaction() as transaction:
+                transaction.reschedule(old_appointment, new_appointment)
+    finally:
+        events.unsubscribe(listener)
+    monkeypatch.undo()
+
+    assert list(storage.appointments) == [old_appointment]
+    # the commit events, then the ones undoing them
+    assert seen == [("update", (old_appointment.slot, new_appointment.slot))] * 2
+    storage.close()
+
+def test_failed_durability_rolls_a_booking_back(data_dir, monkeypatch):
+    storage = storage_logic.AppointmentStorage(group_commit=True)
+    appointment = Appointment("Ann", Slot(MOMENT, "Dr. One"))
+
+    def failed_flush(pending):
+        raise OSError("the flush failed")
+
+    monkeypatch.setattr(storage.engine, "wait", failed_flush)
+    with pytest.raises(OSError):
+        storage.add_appointment(appointment)
+    monkeypatch.undo()
+    assert appointment not in storage.appointments
+    assert storage.add_appointment(appointment) == appointment
+    storage.close()
+
+def test_sharded_batch_interrupted_between_shards_is_rolled_forward(tmp_path, monkeypatch):
+    old_appointment = Appointment("Ann", Slot(MOMENT, "Dr. One"))
+    new_appointment = Appointment("Ann", Slot(MOMENT, "Dr. Two"))
+    engine = ShardedStorageEngine(tmp_path)
+    engine.save([old_appointment], [new_appointment.slot], [old_appointment.slot])
+
+    written = []
+    write_shard = engine._write_shard
+
+    def crash_after_one_shard(key, entry):
+        if written:
+            raise SystemExit("crash")
+        written.append(key)
+        write_shard(key, entry)
+
+    monkeypatch.setattr(engine, "_write_shard", crash_after_one_shard)
+    data = {"records": [{"op": "update", "data": {"old": storage_logic.serialize_appointment(old_appointment),
+                                                  "new": storage_logic.serialize_appointment(new_appointment)}}]}
+    with pytest.raises(SystemExit):
+        engine.commit("batch", data, ([], [], []))
+    assert (tmp_path / INTENT_NAME).exists()
+
+    appointments, _, _ = ShardedStorageEngine(tmp_path).load()
+    assert appointments == [new_appointment]
+    assert not (tmp_path / INTENT_NAME).exists()
+
+def test_sharded_batch_with_a_failed_write_is_undone(tmp_path, monkeypatch):
+    logging.disable(logging.WARNING)
+    old_appointment = Appointment("Ann", Slot(MOMENT, "Dr. One"))
+    new_appointment = Appointment("Ann", Slot(MOMENT, "Dr. Two"))
+    storage = storage_logic.AppointmentStorage(ShardedStorageEngine(tmp_path))
+    storage.add_appointment(old_appointment)
+
+    written = []
+    write_shard = storage.engine._write_shard
+
+    # the second shard write fails, the others (the first one, then its restore) go through
+    def fail_after_one_shard(key, entry):
+        written.append(key)
+        if len(written) == 2:
+            raise OSError("the disk is full")
+        write_shard(key, entry)
+
+    monkeypatch.setattr(storage.engine, "_write_shard", fail_after_one_shard)
+    try:
+        with pytest.raises(OSError):
+            with storage.transaction() as transaction:
+                transaction.reschedule(old_appointment, new_appointment)
+    finally:
+        logging.disable(logging.NOTSET)
+    monkeypatch.undo()
+
+    assert list(storage.appointments) == [old_appointment]
+    assert storage.engine.load()[0] == [old_appointment]
+    assert not (tmp_path / INTENT_NAME).exists()
+    assert ShardedStorageEngine(tmp_path).load()[0] == [old_appointment]
@@ -0,0 +1,109 @@
+# Waitlist (appointments_logic.waitlist.Waitlist): a freed slot goes to the best waiting entry
+# that accepts it; a failed booking gives the entry back; the entries expire with their range.
+# Through the storage, the cancellation and the booking of the waiting customer are one commit.
+import datetime as dt
+import logging
+
+import pytest
+
+import storage_logic
+from appointments_logic.core import Appointment
+from appointments_logic.waitlist import BOOKED, CLAIMED, EXPIRED, WAITING, Waitlist
+from slot_times import make_daily_slots
+
+TODAY = dt.date.today() + dt.timedelta(days=7)
+
+@pytest.fixture
+def data_dir(tmp_path):
+    original = storage_logic.DATA_DIR
+    storage_logic.set_data_dir(tmp_path)
+    storage_logic.save_state([], [], [])
+    logging.disable(logging.WARNING)
+    yield tmp_path
+    logging.disable(logging.NOTSET)
+    storage_logic.set_data_dir(original)
+
+def day_slots(start: dt.date = TODAY):
+    while not make_daily_slots(None, start):
+        start += dt.timedelta(days=1)
+    return sorted(make_daily_slots(None, start))
+
+def test_invalid_entries_are_refused(data_dir):
+    waitlist = Waitlist(today=lambda: TODAY)
+    assert waitlist.register("", TODAY) is None
+    assert waitlist.register("Ann", TODAY, TODAY - dt.timedelta(days=1)) is None
+    assert waitlist.register("Ann", TODAY, TODAY + dt.timedelta(days=400)) is None
+    assert waitlist.register("Ann", TODAY, vets=["Dr. Nobody"]) is None
+    assert waitlist.register("Ann", TODAY, weekdays=["Caturday"]) is None
+    assert waitlist.register("Ann", TODAY - dt.timedelta(days=30), TODAY - dt.timedelta(days=1)) is None
+    assert len(waitlist) == 0
+
+def test_best_accepting_entry_is_claimed():
+    slot = day_slots()[0]
+    date = slot.datetime.date()
+    waitlist = Waitlist(today=lambda: TODAY)
+    other_vets = [vet for vet in {s.vet for s in day_slots()} if vet != slot.vet]
+    late = waitlist.register("Late", date, priority=1)
+    first = waitlist.register("First", date)
+    leaving = waitlist.register("Leaving", date, priority=-1)
+    waitlist.register("Other day", date + dt.timedelta(days=1))
+    if other_vets:
+        waitlist.register("Other vet", date, vets=other_vets, priority=-5)
+
+    # the customer freeing the slot is skipped, but keeps waiting
+    assert waitlist.claim(slot, exclude="Leaving") is first and first.status == CLAIMED
+    assert leaving.status == WAITING
+    waitlist.restore(first, slot)
+    assert first.status == WAITING
+    assert waitlist.withdraw(leaving.id) and not waitlist.withdraw(leaving.id)
+    assert waitlist.peek(slot) is first
+    assert waitlist.claim(slot) is first
+    waitlist.fulfil(first, Appointment("First", slot))
+    assert waitlist.claim(slot) is late
+    assert waitlist.claim(slot) is None
+    assert waitlist.stats()["booked"] == 1
+
+def test_entries_expire_with_their_range():
+    clock = {"today": TODAY}
+    waitlist = Waitlist(today=lambda: clock["today"])
+    short = waitlist.register("Short", TODAY, TODAY + dt.timedelta(days=1))
+    long = waitlist.register("Long", TODAY, TODAY + dt.timedelta(days=30))
+    assert waitlist.expire(TODAY + dt.timedelta(days=2)) == 1
+    assert short.status == EXPIRED and long.status == WAITING and len(waitlist) == 1
+    assert all(date >= TODAY + dt.timedelta(days=2) for _, date in waitlist._heaps)
+
+def test_cancellation_fills_the_slot_in_one_commit(data_dir):
+    slot = day_slots()[0]
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    waitlist = Waitlist(today=lambda: TODAY)
+    entry = waitlist.register("Bob", slot.datetime.date())
+    storage.add_appointment(Appointment("Ann", slot))
+
+    replacement = storage.remove_appointment(Appointment("Ann", slot), waitlist)
+    assert replacement == Appointment("Bob", slot)
+    assert entry.status == BOOKED and entry.appointment == replacement
+    assert storage.appointments.by_slot(slot) == [replacement]
+    storage.close()
+    assert list(storage_logic.AppointmentStorage(journaled=True).appointments) == [replacement]
+
+def test_failed_fill_gives_the_entry_back(data_dir, monkeypatch):
+    slot = day_slots()[0]
+    storage = storage_logic.AppointmentStorage(journaled=True)
+    waitlist = Waitlist(today=lambda: TODAY)
+    entry = waitlist.register("Bob", slot.datetime.date())
+    storage.add_appointment(Appointment("Ann", slot))
+
+    def failed_stage(operation, data):
+        raise OSError("the journal is not writable")
+
+    monkeypatch.setattr(storage, "_stage", failed_stage)
+    with pytest.raises(OSError):
+        storage.remove_appointment(Appointment("Ann", slot), waitlist)
+    monkeypatch.undo()
+    assert entry.status == WAITING and waitlist.peek(slot) is entry
+    assert list(storage.appointments) == [Appointment("Ann", slot)]
+    # nobody waiting: a plain cancellation
+    waitlist.withdraw(entry.id)
+    assert storage.remove_appointment(Appointment("Ann", slot), waitlist) is None
+    assert len(storage.appointments) == 0
+    storage.close()